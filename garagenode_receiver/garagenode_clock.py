@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""garagenode_clock.py - Clocks and timestamped serial captures for the GarageNode receiver.
+
+The receiver takes all times from a clock object (`monotonic()` for intervals and rate
+limiting, `time()` for timestamps of stored readings). SystemClock is the live clock;
+ReplayClock is driven by the timestamps of a capture file, so that a recorded capture
+replays in seconds with exactly the publish schedule the live receiver would produce
+(see `garagenode_receiver_mqtt.py --replay=FILE`).
+
+Capture file: magic 'GNCP', version (uint8), then records of
+UNIX timestamp (float64), length (uint32) and the bytes read from the serial port.
+
+Usage:
+  garagenode_clock.py record [--port=PORT] [--baud=BAUD] FILE
+  garagenode_clock.py info FILE
+  garagenode_clock.py -h | --help
+
+Options:
+  -h --help       Show this screen.
+  --port=PORT     Serial port [default: /dev/ttyAMA0].
+  --baud=BAUD     Baud rate [default: 9600].
+"""
+##
+## LICENSE:
+##
+## Copyright (C) 2019-2022 Alexander Streicher
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU Affero General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Affero General Public License for more details.
+##
+## You should have received a copy of the GNU Affero General Public License
+## along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+import struct
+import sys
+import time
+
+MAGIC = b'GNCP'
+VERSION = 1
+HEADER = struct.Struct('<4sB')
+RECORD = struct.Struct('<dI')
+
+
+class SystemClock(object):
+    """Live clock."""
+
+    @staticmethod
+    def monotonic():
+        return time.monotonic()
+
+    @staticmethod
+    def time():
+        return time.time()
+
+
+class ReplayClock(object):
+    """
+    Clock driven by capture timestamps, see `ReplayStream`.
+    Both `monotonic()` and `time()` return the capture time, it never goes backwards.
+    """
+
+    def __init__(self, start: float = 0.0):
+        self.now = start
+
+    def advance(self, timestamp: float):
+        if timestamp > self.now:
+            self.now = timestamp
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+
+class CaptureWriter(object):
+    """Writes a timestamped capture file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fp = open(path, 'wb')
+        self._fp.write(HEADER.pack(MAGIC, VERSION))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, data: bytes, timestamp: float = None):
+        if not data:
+            return
+        self._fp.write(RECORD.pack(time.time() if timestamp is None else timestamp, len(data)))
+        self._fp.write(data)
+
+    def close(self):
+        self._fp.close()
+
+
+def read_capture(fp):
+    """
+    Records of a capture file.
+    :param fp: binary file object
+    :return: generator of (timestamp, bytes)
+    """
+    magic, version = HEADER.unpack(fp.read(HEADER.size))
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a GarageNode capture file (version %d)!" % VERSION)
+    while True:
+        header = fp.read(RECORD.size)
+        if len(header) < RECORD.size:
+            ## a truncated last record is ignored
+            return
+        timestamp, length = RECORD.unpack(header)
+        data = fp.read(length)
+        if len(data) < length:
+            return
+        yield timestamp, data
+
+
+class ReplayStream(object):
+    """
+    Input stream replaying a capture file as fast as possible.
+    The clock is advanced to a record's timestamp when its first byte is read.
+    """
+
+    def __init__(self, path: str, clock: ReplayClock):
+        self.path = path
+        self.clock = clock
+        self._fp = open(path, 'rb')
+        self._records = read_capture(self._fp)
+        self._chunk = b''
+        self._pos = 0
+        self.records = 0
+
+    def __repr__(self):
+        return "ReplayStream(%s)" % self.path
+
+    def readable(self):
+        return True
+
+    def close(self):
+        self._fp.close()
+
+    def read(self, size: int = 1):
+        """
+        :return: bytes, empty at the end of the capture
+        """
+        while self._pos >= len(self._chunk):
+            record = next(self._records, None)
+            if record is None:
+                return b''
+            timestamp, self._chunk = record
+            self._pos = 0
+            self.records += 1
+            self.clock.advance(timestamp)
+        data = self._chunk[self._pos:self._pos + size]
+        self._pos += len(data)
+        return data
+
+
+def main():
+    from docopt import docopt
+    arguments = docopt(__doc__)
+    path = arguments["FILE"]
+    if arguments["record"]:
+        import serial
+        port = serial.Serial(arguments["--port"], baudrate=int(arguments["--baud"]))
+        with CaptureWriter(path) as writer:
+            try:
+                while True:
+                    ## block for 1 byte, then take everything that is waiting
+                    data = port.read(1)
+                    data += port.read(port.in_waiting)
+                    writer.write(data)
+            except KeyboardInterrupt:
+                pass
+    elif arguments["info"]:
+        count = size = 0
+        first = last = None
+        with open(path, 'rb') as fp:
+            for timestamp, data in read_capture(fp):
+                count += 1
+                size += len(data)
+                first = timestamp if first is None else first
+                last = timestamp
+        print("records: %d, bytes: %d" % (count, size))
+        if count:
+            print("from %s to %s (%.0f s)" % (time.ctime(first), time.ctime(last), last - first))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
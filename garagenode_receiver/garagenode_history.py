@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""garagenode_history.py - In-memory history of recent GarageNode readings.
+
+Fixed-size ring buffer (preallocated arrays, constant memory) of the last N decoded
+readings and a small local HTTP query interface:
+
+  GET /history?n=10   recent readings (oldest first) as JSON
+  GET /stats          summary statistics per field as JSON
+
+Both take an optional `node=<id>` parameter to select the readings of one sender node
+(default: all readings, i.e., of all nodes).
+"""
+##
+## LICENSE:
+##
+## Copyright (C) 2019-2022 Alexander Streicher
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU Affero General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Affero General Public License for more details.
+##
+## You should have received a copy of the GNU Affero General Public License
+## along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+import json
+import logging
+import math
+import threading
+import time
+from array import array
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+HISTORY_SIZE_DEFAULT = 1000
+## max. node ID length in bytes (UTF-8), see `node_id_regex` of the receiver
+NODE_ID_BYTES = 32
+
+## field name -> (array typecode, missing value marker)
+HISTORY_FIELDS = {
+    'light': ('l', -1),
+    'humidity': ('d', math.nan),
+    'temperature': ('d', math.nan),
+    'switch1': ('b', -1),
+    'switch2': ('b', -1),
+}
+
+
+def _is_missing(value, missing):
+    ## NaN != NaN
+    return value != value if missing != missing else value == missing
+
+
+class ReadingsHistory(object):
+    """
+    Ring buffer of the last `size` readings.
+    All arrays are preallocated, appending does not allocate.
+    Thread-safe, i.e., the query server may read while the receiver appends.
+    """
+
+    def __init__(self, size: int = HISTORY_SIZE_DEFAULT):
+        if size < 1:
+            raise ValueError("size must be positive!")
+        self.size = size
+        self._timestamps = array('d', [math.nan]) * size
+        self._values = {name: array(typecode, [missing]) * size
+                        for name, (typecode, missing) in HISTORY_FIELDS.items()}
+        ## node ID per slot: fixed-width bytes and length (0: sender without ID)
+        self._node_ids = bytearray(size * NODE_ID_BYTES)
+        self._node_lengths = array('B', [0]) * size
+        self._next = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def append(self, envelope, timestamp: float = None):
+        """
+        Store a reading.
+        :param envelope: MessageEnvelope (or anything with `get(name)` returning objects with `value`)
+        :param timestamp: UNIX timestamp, defaults to now
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        node = (getattr(envelope, 'node', None) or '').encode('utf8')[:NODE_ID_BYTES]
+        with self._lock:
+            i = self._next
+            self._timestamps[i] = timestamp
+            self._node_ids[i * NODE_ID_BYTES:i * NODE_ID_BYTES + len(node)] = node
+            self._node_lengths[i] = len(node)
+            for name, (_, missing) in HISTORY_FIELDS.items():
+                msg = envelope.get(name)
+                self._values[name][i] = missing if msg is None else msg.value
+            self._next = (i + 1) % self.size
+            if self._count < self.size:
+                self._count += 1
+
+    def _node_id(self, i: int):
+        offset = i * NODE_ID_BYTES
+        return bytes(self._node_ids[offset:offset + self._node_lengths[i]])
+
+    def _indices(self, n: int = None, node: str = None):
+        ## indices from oldest to newest, the last `n` entries (of `node`) only
+        if node is None:
+            count = self._count if n is None else max(0, min(n, self._count))
+            start = (self._next - count) % self.size
+            return [(start + k) % self.size for k in range(count)]
+        start = (self._next - self._count) % self.size
+        node_id = node.encode('utf8')[:NODE_ID_BYTES]
+        indices = [i for i in ((start + k) % self.size for k in range(self._count)) if self._node_id(i) == node_id]
+        if n is not None:
+            indices = indices[len(indices) - max(0, min(n, len(indices))):]
+        return indices
+
+    def recent(self, n: int = None, node: str = None):
+        """
+        Recent readings.
+        :param n: number of readings, defaults to all
+        :param node: only readings of this sender node ('' for the sender without ID), defaults to all
+        :return: list of dicts (oldest first) with 'timestamp', 'node' and the values, missing ones are left out
+        """
+        result = []
+        with self._lock:
+            for i in self._indices(n, node):
+                entry = {'timestamp': self._timestamps[i]}
+                if self._node_lengths[i]:
+                    entry['node'] = self._node_id(i).decode('utf8', errors='replace')
+                for name, (_, missing) in HISTORY_FIELDS.items():
+                    value = self._values[name][i]
+                    if not _is_missing(value, missing):
+                        entry[name] = value
+                result.append(entry)
+        return result
+
+    def stats(self, node: str = None):
+        """
+        Summary statistics over the buffer.
+        :param node: only readings of this sender node ('' for the sender without ID), defaults to all
+        :return: dict with 'count', 'first', 'last' and per field 'count', 'min', 'max', 'mean', 'last'
+        """
+        with self._lock:
+            indices = self._indices(node=node)
+            result = {'count': len(indices),
+                      'first': self._timestamps[indices[0]] if indices else None,
+                      'last': self._timestamps[indices[-1]] if indices else None,
+                      'fields': {}}
+            for name, (_, missing) in HISTORY_FIELDS.items():
+                values = self._values[name]
+                count = 0
+                total = 0.0
+                vmin = vmax = last = None
+                for i in indices:
+                    value = values[i]
+                    if _is_missing(value, missing):
+                        continue
+                    count += 1
+                    total += value
+                    vmin = value if vmin is None else min(vmin, value)
+                    vmax = value if vmax is None else max(vmax, value)
+                    last = value
+                result['fields'][name] = {'count': count, 'min': vmin, 'max': vmax,
+                                          'mean': total / count if count else None, 'last': last}
+        return result
+
+
+class HistoryRequestHandler(BaseHTTPRequestHandler):
+    """HTTP GET handler for `/history` and `/stats`."""
+
+    ## set by `start_http_server()`
+    history = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        node = query.get('node', [None])[0]
+        if url.path == '/history':
+            try:
+                n = int(query.get('n', [0])[0]) or None
+            except ValueError:
+                self.send_error(400, "invalid parameter 'n'")
+                return
+            self._send_json(self.history.recent(n, node))
+        elif url.path == '/stats':
+            self._send_json(self.history.stats(node))
+        else:
+            self.send_error(404)
+
+    def _send_json(self, data):
+        body = json.dumps(data).encode('utf8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug("history http: " + format, *args)
+
+
+def start_http_server(history: ReadingsHistory, host: str = '127.0.0.1', port: int = 8087):
+    """
+    Serve the history query interface in a background (daemon) thread.
+    :param history: readings history
+    :param host: listen address, local only by default
+    :param port: TCP port, 0 for any free port
+    :return: server instance (`server.server_address` holds the actual address)
+    """
+    handler = type('BoundHistoryRequestHandler', (HistoryRequestHandler,), {'history': history})
+    server = ThreadingHTTPServer((host, port), handler)
+    thread = threading.Thread(target=server.serve_forever, name='history-http', daemon=True)
+    thread.start()
+    logging.info("history query interface on http://%s:%d/", *server.server_address[:2])
+    return server
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""garagenode_link.py - Power-line link quality monitor for the GarageNode receiver.
+
+Derives the quality of the (power-line) serial link from framing statistics over a
+sliding time window: valid frames vs. frames expected from the senders' sleep interval,
+garbage bytes between frames, truncated frames, invalid UTF-8, unparseable frames,
+field conversion failures and the inter-arrival jitter.
+The window is a fixed ring of time buckets, i.e., constant memory and O(1) updates.
+"""
+##
+## LICENSE:
+##
+## Copyright (C) 2019-2022 Alexander Streicher
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU Affero General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Affero General Public License for more details.
+##
+## You should have received a copy of the GNU Affero General Public License
+## along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+import math
+import time
+from array import array
+
+## sender sleep interval (SLEEPTIME in garagenode_sender.ino plus wake-up delays)
+EXPECTED_INTERVAL_SECONDS_DEFAULT = 30.0
+WINDOW_SECONDS_DEFAULT = 3600.0
+WINDOW_BUCKETS_DEFAULT = 60
+
+## counter name -> array typecode
+LINK_COUNTERS = {
+    'frames': 'l',            ## decoded frames
+    'damaged': 'l',           ## decoded frames with any of the problems below
+    'dropped': 'l',           ## frames that could not be decoded at all
+    'missed': 'l',            ## frames expected but not received (gaps in a node's arrivals)
+    'truncated': 'l',         ## frame start without frame end
+    'invalid_utf8': 'l',      ## frames with invalid UTF-8
+    'unparseable': 'l',       ## frames without any valid field or with an invalid node ID
+    'field_errors': 'l',      ## field values that could not be converted
+    'garbage_bytes': 'l',     ## bytes outside of frames
+    'gaps': 'l',              ## inter-arrival samples
+    'gap_intervals': 'l',     ## sum of intervals spanned by the samples
+    'gap_seconds': 'd',       ## sum of inter-arrival times
+    'deviation_sum': 'd',     ## sum of deviations from the expected interval(s)
+    'deviation_sumsq': 'd',   ## sum of squared deviations
+}
+
+
+class LinkQualityMonitor(object):
+    """
+    Link statistics over a sliding window of `buckets` time buckets.
+
+    The score is the fraction of expected frames that arrived undamaged:
+        (frames - damaged) / max(frames + missed, frames + dropped)
+    i.e., lost frames are counted either from the arrival gaps or from the dropped frames,
+    whichever is larger (a dropped frame also leaves a gap).
+    Garbage bytes do not affect the score, they also include the sender's status lines.
+    """
+
+    def __init__(self, expected_interval: float = EXPECTED_INTERVAL_SECONDS_DEFAULT,
+                 window_seconds: float = WINDOW_SECONDS_DEFAULT, buckets: int = WINDOW_BUCKETS_DEFAULT,
+                 clock=time.monotonic):
+        """
+        :param clock: function returning the monotonic time in seconds, the default for all `now` parameters
+        """
+        if expected_interval <= 0 or window_seconds <= 0:
+            raise ValueError("expected_interval and window_seconds must be positive!")
+        if buckets < 1:
+            raise ValueError("buckets must be positive!")
+        self.expected_interval = expected_interval
+        self.window_seconds = window_seconds
+        self.buckets = buckets
+        self.bucket_seconds = window_seconds / buckets
+        self.clock = clock
+        self._counters = {name: array(typecode, [0]) * buckets for name, typecode in LINK_COUNTERS.items()}
+        ## absolute number of the current bucket
+        self._bucket = None
+
+    def _index(self, now: float = None):
+        ## ring index of the bucket for `now`, expired buckets are cleared
+        if now is None:
+            now = self.clock()
+        bucket = int(now // self.bucket_seconds)
+        if self._bucket is None:
+            self._bucket = bucket
+        elif bucket > self._bucket:
+            for b in range(self._bucket + 1, min(bucket, self._bucket + self.buckets) + 1):
+                i = b % self.buckets
+                for values in self._counters.values():
+                    values[i] = 0
+            self._bucket = bucket
+        return self._bucket % self.buckets
+
+    def _add(self, name: str, value=1, now: float = None):
+        self._counters[name][self._index(now)] += value
+
+    def garbage(self, count: int = 1, now: float = None):
+        self._add('garbage_bytes', count, now)
+
+    def truncated(self, now: float = None):
+        self._add('truncated', 1, now)
+
+    def invalid_utf8(self, now: float = None):
+        self._add('invalid_utf8', 1, now)
+
+    def unparseable(self, now: float = None):
+        self._add('unparseable', 1, now)
+
+    def field_error(self, now: float = None):
+        self._add('field_errors', 1, now)
+
+    def damaged(self, now: float = None):
+        """A frame with problems was decoded anyway (counted by `frame()` as well)."""
+        self._add('damaged', 1, now)
+
+    def dropped(self, now: float = None):
+        """A frame could not be decoded."""
+        self._add('dropped', 1, now)
+
+    def frame(self, now: float = None, previous: float = None):
+        """
+        A decoded frame arrived.
+        :param now: arrival time (monotonic seconds), defaults to the clock's
+        :param previous: arrival time of the previous frame of the same sender node, if any
+        """
+        if now is None:
+            now = self.clock()
+        i = self._index(now)
+        counters = self._counters
+        counters['frames'][i] += 1
+        if previous is None:
+            return
+        gap = now - previous
+        intervals = max(1, round(gap / self.expected_interval))
+        deviation = gap - intervals * self.expected_interval
+        counters['missed'][i] += intervals - 1
+        counters['gaps'][i] += 1
+        counters['gap_intervals'][i] += intervals
+        counters['gap_seconds'][i] += gap
+        counters['deviation_sum'][i] += deviation
+        counters['deviation_sumsq'][i] += deviation * deviation
+
+    def stats(self, now: float = None):
+        """
+        Statistics over the window.
+        :return: dict with the counters, 'quality' (0..1, None without any frames),
+                 'interval_seconds' (mean inter-arrival time per interval) and
+                 'jitter_seconds' (standard deviation from the expected interval)
+        """
+        self._index(now)
+        result = {name: sum(values) for name, values in self._counters.items()}
+        expected = max(result['frames'] + result['missed'], result['frames'] + result['dropped'])
+        quality = None
+        if expected:
+            quality = max(0, result['frames'] - result['damaged']) / expected
+        interval = jitter = None
+        n = result['gaps']
+        if n:
+            interval = result['gap_seconds'] / result['gap_intervals']
+            mean = result['deviation_sum'] / n
+            jitter = math.sqrt(max(0.0, result['deviation_sumsq'] / n - mean * mean))
+        return {
+            'quality': quality,
+            'interval_seconds': interval,
+            'jitter_seconds': jitter,
+            'frames': result['frames'],
+            'damaged': result['damaged'],
+            'dropped': result['dropped'],
+            'missed': result['missed'],
+            'truncated': result['truncated'],
+            'invalid_utf8': result['invalid_utf8'],
+            'unparseable': result['unparseable'],
+            'field_errors': result['field_errors'],
+            'garbage_bytes': result['garbage_bytes'],
+            'window_seconds': self.window_seconds,
+        }
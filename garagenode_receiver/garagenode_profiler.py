@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""garagenode_profiler.py - Runtime profiling helpers for the GarageNode receiver.
+
+SamplingProfiler samples the stacks of all threads at a fixed rate in a background
+thread and writes them in collapsed-stack format ("frame;frame;frame count" per line),
+e.g., for flamegraph.pl or speedscope. It can be switched on and off while the service
+is running (see `install_signal_handlers()`: SIGUSR1 starts, SIGUSR2 stops and dumps).
+
+StageTimers counts calls and wall/CPU time of the processing stages (framing, parsing,
+publishing).
+"""
+##
+## LICENSE:
+##
+## Copyright (C) 2019-2022 Alexander Streicher
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU Affero General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Affero General Public License for more details.
+##
+## You should have received a copy of the GNU Affero General Public License
+## along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+import collections
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+
+SAMPLE_INTERVAL_SECONDS_DEFAULT = 0.01
+## strftime() pattern
+PROFILE_PATH_DEFAULT = '/tmp/garagenode-%Y%m%d-%H%M%S.collapsed'
+
+
+class SamplingProfiler(object):
+    """
+    Statistical profiler sampling `sys._current_frames()` every `interval` seconds.
+    Stacks are counted as tuples of code objects, i.e., a sample only walks the frames
+    and does one dict update per thread; labels are built when dumping.
+    Blocked threads are sampled too (wall-clock profile).
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL_SECONDS_DEFAULT):
+        if interval <= 0:
+            raise ValueError("interval must be positive!")
+        self.interval = interval
+        ## (thread name, code objects outermost first) -> count
+        self._stacks = collections.Counter()
+        self._thread = None
+        self._stop = threading.Event()
+        self.samples = 0
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is not None:
+            return self
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=5)
+        self._thread = None
+
+    def reset(self):
+        self._stacks.clear()
+        self.samples = 0
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.sample(exclude=own)
+
+    def sample(self, exclude: int = None):
+        """Take one sample of all threads (except `exclude`)."""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == exclude:
+                continue
+            codes = []
+            while frame is not None:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            codes.reverse()
+            self._stacks[(names.get(ident, str(ident)), tuple(codes))] += 1
+        self.samples += 1
+
+    def collapsed(self):
+        """
+        Collapsed stacks, one line per distinct stack: "thread;file:function;... count"
+        :return: list of str
+        """
+        labels = {}
+
+        def label(code):
+            result = labels.get(code)
+            if result is None:
+                result = labels[code] = "%s:%s" % (os.path.basename(code.co_filename), code.co_name)
+            return result
+
+        return ["%s;%s %d" % (name, ';'.join(label(code) for code in codes), count)
+                for (name, codes), count in self._stacks.most_common()]
+
+    def dump(self, path: str):
+        """Write the collapsed stacks to a file."""
+        with open(path, 'w', encoding='utf8') as fp:
+            for line in self.collapsed():
+                fp.write(line + '\n')
+
+
+class StageTimers(object):
+    """
+    Call counts and wall clock/thread CPU time per processing stage.
+
+    Example:
+        started = timers.start()
+        ...
+        timers.stop('parsing', started)
+    """
+
+    def __init__(self):
+        ## stage -> [count, wall ns, CPU ns, max. wall ns]
+        self._stages = {}
+
+    @staticmethod
+    def start():
+        return time.perf_counter_ns(), time.thread_time_ns()
+
+    def stop(self, stage: str, started):
+        wall = time.perf_counter_ns() - started[0]
+        cpu = time.thread_time_ns() - started[1]
+        entry = self._stages.get(stage)
+        if entry is None:
+            entry = self._stages[stage] = [0, 0, 0, 0]
+        entry[0] += 1
+        entry[1] += wall
+        entry[2] += cpu
+        if wall > entry[3]:
+            entry[3] = wall
+
+    def reset(self):
+        self._stages.clear()
+
+    def stats(self):
+        """
+        :return: dict stage -> dict with 'count', 'wall_ms', 'cpu_ms' (totals), 'wall_ms_mean', 'wall_ms_max'
+        """
+        return {stage: {'count': count,
+                        'wall_ms': wall / 1e6,
+                        'cpu_ms': cpu / 1e6,
+                        'wall_ms_mean': wall / count / 1e6,
+                        'wall_ms_max': wall_max / 1e6}
+                for stage, (count, wall, cpu, wall_max) in self._stages.items()}
+
+
+def install_signal_handlers(profiler: SamplingProfiler, timers: StageTimers = None,
+                            path: str = PROFILE_PATH_DEFAULT):
+    """
+    SIGUSR1: start sampling (and reset the stage timers).
+    SIGUSR2: stop sampling, write the collapsed stacks to `path` (strftime() pattern)
+             and log the stage timers.
+    Must be called from the main thread.
+    """
+    def on_start(signum, frame):
+        if profiler.running:
+            return
+        logging.warning("Profiling started (%.0f Hz)", 1 / profiler.interval)
+        profiler.reset()
+        if timers is not None:
+            timers.reset()
+        profiler.start()
+
+    def on_stop(signum, frame):
+        dump_profile(profiler, timers, path)
+
+    signal.signal(signal.SIGUSR1, on_start)
+    signal.signal(signal.SIGUSR2, on_stop)
+
+
+def dump_profile(profiler: SamplingProfiler, timers: StageTimers = None, path: str = PROFILE_PATH_DEFAULT):
+    """Stop sampling, write the collapsed stacks and log the stage timers."""
+    profiler.stop()
+    if profiler.samples:
+        filename = time.strftime(path)
+        try:
+            profiler.dump(filename)
+            logging.warning("Profile with %d samples written to %s", profiler.samples, filename)
+        except OSError as ex:
+            logging.error("Could not write profile: %s", ex)
+    if timers is not None:
+        for stage, stats in timers.stats().items():
+            logging.warning("stage %s: %d calls, wall %.1f ms (mean %.3f ms, max %.3f ms), CPU %.1f ms",
+                            stage, stats['count'], stats['wall_ms'], stats['wall_ms_mean'], stats['wall_ms_max'],
+                            stats['cpu_ms'])
@@ -17,6 +17,8 @@ Options:
   -h --help       Show this screen.
   -q --quiet      Be more quiet, show only warnings and errors.
   --simulate      Do not use serial port but simulate using file TESTDATA_FILE.
+  --replay=FILE   Do not use serial port but replay a timestamped capture (garagenode_clock.py record)
+                  as fast as possible, with the capture's timing (rate limits, periodic sends).
   -v --verbose    Be more verbose.
   --version       Show version.
 """
@@ -39,10 +41,15 @@ Options:
 ## along with this program.  If not, see <http://www.gnu.org/licenses/>.
 ##
 
-import datetime
+import collections
+import json
+import math
 import os
 import re
+import signal
+import struct
 import sys
+import time
 from codecs import open
 import logging
 import paho.mqtt.publish
@@ -50,6 +57,15 @@ import serial
 from docopt import docopt
 from dotenv import load_dotenv
 
+from garagenode_serial import SerialReaderThread, SelectorStream, RING_BUFFER_SIZE_DEFAULT
+from garagenode_history import ReadingsHistory, start_http_server, HISTORY_SIZE_DEFAULT
+from garagenode_shm import ReadingsWriter
+from garagenode_tsdb import TimeSeriesStore, BLOCK_SAMPLES_DEFAULT, FLUSH_SECONDS_DEFAULT, RETENTION_DAYS_DEFAULT
+from garagenode_link import LinkQualityMonitor, EXPECTED_INTERVAL_SECONDS_DEFAULT, WINDOW_SECONDS_DEFAULT
+from garagenode_clock import SystemClock, ReplayClock, ReplayStream
+from garagenode_profiler import SamplingProfiler, StageTimers, install_signal_handlers, dump_profile, \
+    SAMPLE_INTERVAL_SECONDS_DEFAULT, PROFILE_PATH_DEFAULT
+
 __version__ = "1.8.0"
 __date__ = "2019-09-04"
 __updated__ = "2022-05-21"
@@ -69,20 +85,69 @@ if sys.version_info < (3, 0):
 
 TESTDATA_FILE = '../tools/serial2file.bin'
 MQTT_TIME_PERIOD_SECONDS_DEFAULT = 600
+NODE_MAX_DEFAULT = 256
+NODE_EXPIRE_SECONDS_DEFAULT = 7 * 24 * 3600
+DEDUP_WINDOW_SECONDS_DEFAULT = 2.0
+DEDUP_MAX_ENTRIES_DEFAULT = 64
+DISCOVERY_REFRESH_SECONDS_DEFAULT = 3600
 
 DEBUG = bool(os.environ.get("DEBUG", "").lower() in ("1", "true", "yes"))
 __script_dir = os.path.dirname(os.path.realpath(__file__))
 
+## combined payload binary layout (little-endian, 13 bytes):
+## version (uint8), light (int16, -1=missing), humidity (float32, NaN=missing),
+## temperature (float32, NaN=missing), switch1 (int8, -1=missing), switch2 (int8, -1=missing)
+COMBINED_STRUCT = struct.Struct('<Bhffbb')
+COMBINED_STRUCT_VERSION = 1
+COMBINED_FORMATS = ('json', 'struct')
+## value ranges of the struct fields, values outside are packed as missing
+INT16_RANGE = (-2 ** 15, 2 ** 15 - 1)
+INT8_RANGE = (-2 ** 7, 2 ** 7 - 1)
+FLOAT32_MAX = struct.unpack('<f', b'\xff\xff\x7f\x7f')[0]
+
 ## **L:140;H:29.90;T:27.60;S1:1$$
 ## **L:140;H:29.90;T:27.60;S1:1;S2:1$$
 ## **L:140;H:nan;T:nan;S1:0$$
-regex = re.compile(r"(?P<L>(L:[^;]*);)?(?P<H>(H:[^;]*);)?(?P<T>(T:[^;]*);)?(?P<S1>(S1:.);?)?(?P<S2>(S2:.);?)?")
+## **N:garage2;L:140;H:29.90;T:27.60;S1:1;S2:1$$  (optional node ID, multiple senders)
+regex = re.compile(r"(?P<N>(N:[^;]*);)?(?P<L>(L:[^;]*);)?(?P<H>(H:[^;]*);)?(?P<T>(T:[^;]*);)?(?P<S1>(S1:.);?)?(?P<S2>(S2:.);?)?")
+
+## node IDs become part of MQTT topics
+node_id_regex = re.compile(r"^[A-Za-z0-9_-]{1,32}$")
+
+## plausible field value ranges (NaN: sensor reading failed), values outside are
+## corrupted and dropped, i.e., they never reach the sinks (history, TSDB, MQTT)
+## light: 0..int32 (array('l') of the history on 32-bit platforms), the sender sends 0..1023
+FIELD_RANGES = {
+    'light': (0, 2 ** 31 - 1),
+    'humidity': (0.0, 100.0),
+    'temperature': (-100.0, 150.0),
+    'switch1': (0, 1),
+    'switch2': (0, 1),
+}
+
+
+def field_value(name: str, value):
+    """
+    Check a converted field value against FIELD_RANGES.
+    :return: value
+    :raises ValueError: if out of range
+    """
+    low, high = FIELD_RANGES[name]
+    ## NaN != NaN
+    if value == value and not low <= value <= high:
+        logging.warning("Value out of range, dropping field: %s=%s", name, value)
+        raise ValueError("%s out of range: %s" % (name, value))
+    return value
 
 
 def send_mqtt(msgs):
     if DEBUG:
         logging.warning("DEBUG mode, not sending to MQTT")
         return
+    if not msgs:
+        ## paho would wait forever for a publish confirmation
+        logging.debug("Nothing to send to MQTT")
+        return
 
     mqtt_host = os.getenv("MQTT_HOST", "localhost")
     mqtt_port = int(os.getenv("MQTT_PORT", 1883))
@@ -110,8 +175,10 @@ class Message(object):
 
 
 class MessageEnvelope(object):
-    def __init__(self):
+    def __init__(self, node: str = None):
         self.msgs = {}
+        ## sender node ID, None for a (single) sender without ID
+        self.node = node
 
     def __len__(self):
         return len(self.msgs)
@@ -132,8 +199,20 @@ class MessageEnvelope(object):
         return self.msgs.get(key)
 
 
-def datadict2msgs(envelope: MessageEnvelope):
+def node_topic_base(node: str = None):
+    """
+    MQTT topic base for a sender node.
+    :param node: node ID, None for a sender without ID
+    :return: MQTT_TOPIC_BASE, with node ID sub-level if given
+    """
     topic_base = os.getenv("MQTT_TOPIC_BASE")
+    if node:
+        topic_base += node + "/"
+    return topic_base
+
+
+def datadict2msgs(envelope: MessageEnvelope):
+    topic_base = node_topic_base(getattr(envelope, 'node', None))
     msgs = []
     for key in envelope.keys():
         d = envelope.get(key)
@@ -142,11 +221,280 @@ def datadict2msgs(envelope: MessageEnvelope):
     return msgs
 
 
-def look_in_stream(stream):
+def combined2msg(envelope: MessageEnvelope, fmt: str = 'json'):
     """
-    Heuristic and parsing of data (file/serial line) stream.
+    Build one single MQTT message with all fields of the envelope.
+    :param envelope: data envelope
+    :param fmt: payload encoding, 'json' (compact) or 'struct' (see COMBINED_STRUCT)
+    :return: MQTT message dict
+    """
+    topic = node_topic_base(envelope.node) + os.getenv("MQTT_COMBINED_TOPIC", "state")
+    retain = any(envelope.get(key).retain for key in envelope.keys())
+    if fmt == 'json':
+        values = {}
+        for key in envelope.keys():
+            value = envelope.get(key).value
+            ## NaN and +-Infinity are not valid JSON
+            values[key] = None if isinstance(value, float) and not math.isfinite(value) else value
+        payload = json.dumps(values, separators=(',', ':'))
+    elif fmt == 'struct':
+        def int_or_missing(name, value_range):
+            msg = envelope.get(name)
+            if msg is None or not value_range[0] <= msg.value <= value_range[1]:
+                return -1
+            return msg.value
+
+        def float_or_missing(name):
+            msg = envelope.get(name)
+            if msg is None or not abs(msg.value) <= FLOAT32_MAX:
+                return float('nan')
+            return msg.value
+
+        payload = COMBINED_STRUCT.pack(COMBINED_STRUCT_VERSION,
+                                       int_or_missing('light', INT16_RANGE),
+                                       float_or_missing('humidity'),
+                                       float_or_missing('temperature'),
+                                       int_or_missing('switch1', INT8_RANGE),
+                                       int_or_missing('switch2', INT8_RANGE))
+    else:
+        raise ValueError("Unknown combined payload format '%s'!" % fmt)
+    return {'topic': topic, 'payload': payload, 'retain': retain}
+
+
+def link2msgs(stats: dict):
+    """
+    Build the MQTT messages for the link quality statistics.
+    :param stats: see `LinkQualityMonitor.stats()`
+    :return: list of MQTT message dicts
+    """
+    topic_base = node_topic_base() + "link/"
+    quality = stats['quality']
+    jitter = stats['jitter_seconds']
+    return [
+        {'topic': topic_base + 'quality', 'payload': None if quality is None else round(quality, 3), 'retain': False},
+        {'topic': topic_base + 'jitter', 'payload': None if jitter is None else round(jitter, 3), 'retain': False},
+        {'topic': topic_base + 'stats', 'payload': json.dumps(stats, separators=(',', ':')), 'retain': False},
+    ]
+
+
+## Home Assistant MQTT discovery component and config per known field
+HA_DISCOVERY_FIELDS = {
+    'light': ('sensor', {'name': 'Light', 'state_class': 'measurement', 'icon': 'mdi:brightness-5'}),
+    'humidity': ('sensor', {'name': 'Humidity', 'device_class': 'humidity', 'state_class': 'measurement',
+                            'unit_of_measurement': '%'}),
+    'temperature': ('sensor', {'name': 'Temperature', 'device_class': 'temperature', 'state_class': 'measurement',
+                               'unit_of_measurement': '°C'}),
+    'switch1': ('binary_sensor', {'name': 'Switch 1', 'payload_on': '1', 'payload_off': '0'}),
+    'switch2': ('binary_sensor', {'name': 'Switch 2', 'payload_on': '1', 'payload_off': '0'}),
+}
+
+
+class HomeAssistantDiscovery(object):
+    """
+    Home Assistant MQTT discovery config messages.
+    Config messages are generated once per field and cached. They are handed out when
+    a new field shows up and again for all fields every `refresh_seconds`.
+    The messages are retained, but a broker restart (without persistence) loses them and
+    is not noticed: `send_mqtt()` connects anew for every publish. The periodic refresh
+    announces the fields again after such a restart (0: never).
+    """
+
+    def __init__(self, topic_base: str, prefix: str = 'homeassistant', node_id: str = 'garagenode',
+                 json_state_topic: str = None, device_name: str = 'GarageNode',
+                 refresh_seconds: float = DISCOVERY_REFRESH_SECONDS_DEFAULT, clock=time.monotonic):
+        """
+        :param clock: function returning the monotonic time in seconds
+        """
+        self.topic_base = topic_base
+        self.prefix = prefix.rstrip('/')
+        self.node_id = node_id
+        self.device_name = device_name
+        ## combined JSON topic instead of per-field topics
+        self.json_state_topic = json_state_topic
+        self.refresh_seconds = refresh_seconds
+        self.clock = clock
+        self._configs = {}
+        self._announced = set()
+        ## monotonic clock time of the last (re-)announcement round
+        self._announced_at = None
+
+    def config(self, name: str):
+        """
+        Discovery config message for a field (cached).
+        :param name: field name, e.g. 'light'
+        :return: MQTT message dict or None if field is unknown
+        """
+        msg = self._configs.get(name)
+        if msg is None and name in HA_DISCOVERY_FIELDS:
+            component, extra = HA_DISCOVERY_FIELDS[name]
+            payload = {
+                'unique_id': f"{self.node_id}_{name}",
+                'object_id': f"{self.node_id}_{name}",
+                'state_topic': self.topic_base + name,
+                'device': {'identifiers': [self.node_id], 'name': self.device_name,
+                           'manufacturer': 'Ixtalo', 'sw_version': __version__},
+            }
+            if self.json_state_topic:
+                payload['state_topic'] = self.json_state_topic
+                payload['value_template'] = "{{ value_json.%s }}" % name
+            payload.update(extra)
+            msg = {'topic': f"{self.prefix}/{component}/{self.node_id}/{name}/config",
+                   'payload': json.dumps(payload, separators=(',', ':')),
+                   'retain': True}
+            self._configs[name] = msg
+        return msg
+
+    def msgs(self, envelope: MessageEnvelope, now: float = None):
+        """
+        Discovery config messages for fields not announced yet (or not since `refresh_seconds`).
+        :param envelope: data envelope
+        :param now: monotonic time in seconds, defaults to the clock's
+        :return: list of MQTT message dicts (empty during normal operation)
+        """
+        if now is None:
+            now = self.clock()
+        if self._announced_at is None:
+            self._announced_at = now
+        elif self.refresh_seconds > 0 and now - self._announced_at >= self.refresh_seconds:
+            logging.debug("Home Assistant discovery refresh")
+            self._announced.clear()
+            self._announced_at = now
+        new_names = [name for name in envelope.keys() if name not in self._announced and name in HA_DISCOVERY_FIELDS]
+        if not new_names:
+            return []
+        logging.info("Home Assistant discovery for: %s", new_names)
+        self._announced.update(new_names)
+        return [self.config(name) for name in new_names]
+
+
+class NodeState(object):
+    """Receiver state per sender node."""
+
+    def __init__(self, node: str, now: float):
+        self.node = node
+        ## monotonic clock time of the last periodic send, None before the first one
+        self.last_sent = None
+        self.last_light = -1
+        self.last_switch1 = -1
+        self.last_switch2 = -1
+        self.last_seen = now
+        ## monotonic clock time of the previous frame (link quality inter-arrival times)
+        self.last_arrival = None
+        ## per node Home Assistant discovery, see `handle_stream()`
+        self.discovery = None
+
+    def __repr__(self):
+        return "node %s (last seen: %.1f)" % (self.node, self.last_seen)
+
+
+class NodeTable(object):
+    """
+    Hash table of NodeState objects, ordered by last seen.
+    Lookups are O(1), nodes unseen for `expire_seconds` are evicted and there
+    are at most `max_nodes` entries (least recently seen are dropped first).
+    """
+
+    def __init__(self, max_nodes: int = NODE_MAX_DEFAULT, expire_seconds: float = NODE_EXPIRE_SECONDS_DEFAULT):
+        if max_nodes < 1:
+            raise ValueError("max_nodes must be positive!")
+        self.max_nodes = max_nodes
+        self.expire_seconds = expire_seconds
+        self._nodes = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __contains__(self, node):
+        return node in self._nodes
+
+    def get(self, node: str, now: float):
+        """
+        Node state for a node, created if unknown. Marks the node as seen.
+        :param node: node ID (None for a sender without ID)
+        :param now: current monotonic clock time in seconds
+        :return: NodeState
+        """
+        state = self._nodes.get(node)
+        if state is None:
+            logging.info("New sender node: %s", node)
+            state = NodeState(node, now)
+            self._nodes[node] = state
+        else:
+            state.last_seen = now
+            self._nodes.move_to_end(node)
+        self._evict(now)
+        return state
+
+    def _evict(self, now: float):
+        ## oldest (least recently seen) entries are first
+        while self._nodes:
+            node, state = next(iter(self._nodes.items()))
+            if len(self._nodes) <= self.max_nodes and now - state.last_seen <= self.expire_seconds:
+                break
+            logging.info("Evicting sender node %s (unseen for %d seconds)", node, now - state.last_seen)
+            del self._nodes[node]
+
+
+class FrameDeduplicator(object):
+    """
+    Drop repeated frames, e.g., power line modem retransmissions or line echo.
+    Keeps hashes of the raw frames seen within the last `window_seconds`
+    in insertion order (O(1) insert, lookup and eviction), at most `max_entries`.
+    """
+
+    def __init__(self, window_seconds: float = DEDUP_WINDOW_SECONDS_DEFAULT,
+                 max_entries: int = DEDUP_MAX_ENTRIES_DEFAULT, clock=time.monotonic):
+        """
+        :param clock: function returning the monotonic time in seconds
+        """
+        if max_entries < 1:
+            raise ValueError("max_entries must be positive!")
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+        self.clock = clock
+        self._seen = collections.OrderedDict()
+        ## counters
+        self.passed = 0
+        self.suppressed = 0
+
+    def __len__(self):
+        return len(self._seen)
+
+    def is_duplicate(self, raw: bytes, now: float = None):
+        """
+        Check a raw frame and remember it.
+        :param raw: raw frame bytes
+        :param now: monotonic time in seconds, defaults to the clock's
+        :return: True if the same frame has been seen within the time window
+        """
+        if now is None:
+            now = self.clock()
+        ## forget frames outside the time window, oldest first
+        while self._seen:
+            key, seen = next(iter(self._seen.items()))
+            if now - seen <= self.window_seconds:
+                break
+            del self._seen[key]
+        key = hash(raw)
+        if key in self._seen:
+            self.suppressed += 1
+            logging.debug("Duplicate frame suppressed (#%d)", self.suppressed)
+            return True
+        self._seen[key] = now
+        if len(self._seen) > self.max_entries:
+            self._seen.popitem(last=False)
+        self.passed += 1
+        return False
+
+
+def read_frame(stream, link: LinkQualityMonitor = None, stages: StageTimers = None):
+    """
+    Framing: look for the next frame in the data (file/serial line) stream.
     :param stream: data stream
-    :return: DataEntries object or None if not parseable
+    :param link: optional link quality monitor to count garbage bytes in
+    :param stages: optional stage timers, 'framing' is timed from the start signature on
+    :return: raw frame bytes after the start signature '**' (incl. terminating '$' or '*'),
+             or None if there is no frame start at the current position
     """
     ## look for 1st signature character
     ## example:
@@ -162,101 +510,253 @@ def look_in_stream(stream):
         x = stream.read(1)
         if x == b'*':
             logging.debug("signature '**' found - collecting ...")
+            started = stages.start() if stages is not None else None
             ## now collect everything till the next end-signature '$$'
             raw = b''
             y = ''
             while y != b'$' and y != b'*':
                 y = stream.read(1)
+                if len(y) < 1:
+                    ## EOF within a frame
+                    raise IOError('EOF reached!')
                 raw += y
+            if stages is not None:
+                stages.stop('framing', started)
+            return raw
+        if link is not None:
+            link.garbage(1 + len(x))
+    elif link is not None and x not in b'$\r\n':
+        ## the 2nd '$' of the end signature and line breaks are no garbage
+        link.garbage(1)
+    return None
 
-            logging.debug("#%d bytes collected. Decoding...", len(raw))
-            try:
-                ## decode bytes as unicode
-                ## error handler: replace with a suitable replacement marker
-                data = raw.decode("utf8", errors="replace")
-                logging.debug("decoded data: %s", data)
-            except UnicodeDecodeError:
-                logging.error("could not utf8-decode data (#%d bytes)!", len(raw))
+
+def parse_frame(raw: bytes, link: LinkQualityMonitor = None):
+    """
+    Decoding and parsing of a frame.
+    :param raw: raw frame bytes, see `read_frame()`
+    :param link: optional link quality monitor to count framing and decoding problems in
+    :return: MessageEnvelope object or None if not parseable
+    """
+    logging.debug("#%d bytes collected. Decoding...", len(raw))
+    try:
+        ## decode bytes as unicode
+        ## error handler: replace with a suitable replacement marker
+        data = raw.decode("utf8", errors="replace")
+        logging.debug("decoded data: %s", data)
+    except UnicodeDecodeError:
+        logging.error("could not utf8-decode data (#%d bytes)!", len(raw))
+        if link is not None:
+            link.invalid_utf8()
+            link.dropped()
+        return None
+
+    damaged = False
+    if link is not None:
+        if raw.endswith(b'*'):
+            ## a new frame started before the end signature
+            link.truncated()
+            damaged = True
+        if '\ufffd' in data:
+            link.invalid_utf8()
+            damaged = True
+
+    ## strip signature characters
+    data = data.strip('*$')
+
+    ## try regular expression pattern matching
+    m = regex.search(data)
+    if m:
+        logging.debug("parsed. match: %s", m)
+        g = m.groupdict()
+        result = MessageEnvelope()
+
+        keystring = "N"
+        group = g[keystring]
+        if group:
+            value = group.removeprefix(keystring + ":").strip(";")
+            if not node_id_regex.match(value):
+                ## readings must not end up at the wrong node
+                logging.warning("Invalid node ID '%s', dropping data!", value)
+                if link is not None:
+                    link.unparseable()
+                    link.dropped()
                 return None
+            result.node = value
 
-            ## strip signature characters
-            data = data.strip('*$')
-
-            ## try regular expression pattern matching
-            m = regex.search(data)
-            if m:
-                logging.debug("parsed. match: %s", m)
-                g = m.groupdict()
-                result = MessageEnvelope()
-
-                keystring = "L"
-                group = g[keystring]
-                if group:
-                    value = group.removeprefix(keystring + ":").strip(";")
-                    try:
-                        result.add(Message('light', int(value), retain=False))
-                    except ValueError:
-                        pass
-
-                keystring = "H"
-                group = g[keystring]
-                if group:
-                    value = group.removeprefix(keystring + ":").strip(";")
-                    try:
-                        result.add(Message('humidity', float(value), retain=False))
-                    except ValueError:
-                        pass
-
-                keystring = "T"
-                group = g[keystring]
-                if group:
-                    value = group.removeprefix(keystring + ":").strip(";")
-                    try:
-                        result.add(Message('temperature', float(value), retain=False))
-                    except ValueError:
-                        pass
-
-                keystring = "S1"
-                group = g[keystring]
-                if group:
-                    value = group.removeprefix(keystring + ":").strip(";")
-                    try:
-                        result.add(Message('switch1', int(value), retain=True))
-                    except ValueError:
-                        pass
-
-                keystring = "S2"
-                group = g[keystring]
-                if group:
-                    value = group.removeprefix(keystring + ":").strip(";")
-                    try:
-                        result.add(Message('switch2', int(value), retain=True))
-                    except ValueError:
-                        pass
-
-                logging.debug("result: %s", result)
-                return result
-            else:
-                logging.warning("Problem parsing data! (no match for '%s')", data)
+        keystring = "L"
+        group = g[keystring]
+        if group:
+            value = group.removeprefix(keystring + ":").strip(";")
+            try:
+                result.add(Message('light', field_value('light', int(value)), retain=False))
+            except ValueError:
+                if link is not None:
+                    link.field_error()
+                    damaged = True
+
+        keystring = "H"
+        group = g[keystring]
+        if group:
+            value = group.removeprefix(keystring + ":").strip(";")
+            try:
+                result.add(Message('humidity', field_value('humidity', float(value)), retain=False))
+            except ValueError:
+                if link is not None:
+                    link.field_error()
+                    damaged = True
+
+        keystring = "T"
+        group = g[keystring]
+        if group:
+            value = group.removeprefix(keystring + ":").strip(";")
+            try:
+                result.add(Message('temperature', field_value('temperature', float(value)), retain=False))
+            except ValueError:
+                if link is not None:
+                    link.field_error()
+                    damaged = True
+
+        keystring = "S1"
+        group = g[keystring]
+        if group:
+            value = group.removeprefix(keystring + ":").strip(";")
+            try:
+                result.add(Message('switch1', field_value('switch1', int(value)), retain=True))
+            except ValueError:
+                if link is not None:
+                    link.field_error()
+                    damaged = True
+
+        keystring = "S2"
+        group = g[keystring]
+        if group:
+            value = group.removeprefix(keystring + ":").strip(";")
+            try:
+                result.add(Message('switch2', field_value('switch2', int(value)), retain=True))
+            except ValueError:
+                if link is not None:
+                    link.field_error()
+                    damaged = True
+
+        if len(result) == 0:
+            ## all groups are optional, i.e., the pattern matches anything (e.g., line noise)
+            logging.warning("Problem parsing data! (no fields in '%s')", data)
+            if link is not None:
+                link.unparseable()
+                link.dropped()
+            return None
+        logging.debug("result: %s", result)
+        if damaged:
+            link.damaged()
+        return result
+    else:
+        logging.warning("Problem parsing data! (no match for '%s')", data)
+        if link is not None:
+            link.unparseable()
+            link.dropped()
 
     return None
 
 
-def handle_stream(stream):
+def look_in_stream(stream, dedup=None, link: LinkQualityMonitor = None, stages: StageTimers = None):
+    """
+    Heuristic and parsing of data (file/serial line) stream.
+    :param stream: data stream
+    :param dedup: optional FrameDeduplicator to drop repeated frames before decoding
+    :param link: optional link quality monitor to count framing and decoding problems in
+    :param stages: optional stage timers for 'framing' and 'parsing'
+    :return: MessageEnvelope object or None if not parseable
+    """
+    raw = read_frame(stream, link=link, stages=stages)
+    if raw is None:
+        return None
+    if dedup is not None and dedup.is_duplicate(raw):
+        return None
+    if stages is None:
+        return parse_frame(raw, link=link)
+    started = stages.start()
+    result = parse_frame(raw, link=link)
+    stages.stop('parsing', started)
+    return result
+
+
+def handle_stream(stream, history: ReadingsHistory = None, store: TimeSeriesStore = None,
+                  bus: ReadingsWriter = None, stages: StageTimers = None, clock=None):
     """
     Handle GarageNode sender UART messages.
+    Change detection and rate limiting is done per sender node.
     :param stream:  input stream, i.e., serial UART stream
+    :param history: optional history buffer to keep all decoded readings in
+    :param store: optional on-device time-series store to keep all decoded readings in
+    :param bus: optional shared-memory writer for the latest reading (local consumers)
+    :param stages: optional stage timers for 'framing', 'parsing' and 'publishing'
+    :param clock: clock for rate limiting and timestamps (`monotonic()`, `time()`), defaults to SystemClock,
+                  see `garagenode_clock.ReplayClock`
     """
     assert stream.readable()
+    if clock is None:
+        clock = SystemClock()
+    time_period_seconds = int(os.getenv("MQTT_TIME_PERIOD_SECONDS", MQTT_TIME_PERIOD_SECONDS_DEFAULT))
+
+    ## combined payload (one message per reading), alongside or instead of per-field topics
+    combined_format = os.getenv("MQTT_COMBINED_FORMAT", "").lower()
+    assert not combined_format or combined_format in COMBINED_FORMATS, "Invalid MQTT_COMBINED_FORMAT!"
+    combined_only = bool(combined_format) and os.getenv("MQTT_COMBINED_ONLY", "").lower() in ("1", "true", "yes")
+
+    discovery_prefix = os.getenv("MQTT_DISCOVERY_PREFIX")
+    if discovery_prefix and combined_only and combined_format == 'struct':
+        logging.warning("Home Assistant discovery not possible with binary payloads only!")
+        discovery_prefix = None
+
+    discovery_refresh_seconds = float(os.getenv("MQTT_DISCOVERY_REFRESH_SECONDS", DISCOVERY_REFRESH_SECONDS_DEFAULT))
+
+    def make_discovery(node):
+        topic_base = node_topic_base(node)
+        json_state_topic = None
+        if combined_only:
+            json_state_topic = topic_base + os.getenv("MQTT_COMBINED_TOPIC", "state")
+        if node:
+            return HomeAssistantDiscovery(topic_base, discovery_prefix, node_id='garagenode_' + node,
+                                          json_state_topic=json_state_topic, device_name='GarageNode ' + node,
+                                          refresh_seconds=discovery_refresh_seconds, clock=clock.monotonic)
+        return HomeAssistantDiscovery(topic_base, discovery_prefix, json_state_topic=json_state_topic,
+                                      refresh_seconds=discovery_refresh_seconds, clock=clock.monotonic)
+
+    nodes = NodeTable(int(os.getenv("NODE_MAX", NODE_MAX_DEFAULT)),
+                      float(os.getenv("NODE_EXPIRE_SECONDS", NODE_EXPIRE_SECONDS_DEFAULT)))
+
+    ## duplicate frame suppression, disabled with a time window of 0
+    dedup = None
+    if float(os.getenv("DEDUP_WINDOW_SECONDS", DEDUP_WINDOW_SECONDS_DEFAULT)) > 0:
+        dedup = FrameDeduplicator(float(os.getenv("DEDUP_WINDOW_SECONDS", DEDUP_WINDOW_SECONDS_DEFAULT)),
+                                  int(os.getenv("DEDUP_MAX_ENTRIES", DEDUP_MAX_ENTRIES_DEFAULT)),
+                                  clock=clock.monotonic)
+
+    ## link quality from framing statistics, published every LINK_PUBLISH_SECONDS (0: not published)
+    link = LinkQualityMonitor(float(os.getenv("LINK_EXPECTED_INTERVAL_SECONDS", EXPECTED_INTERVAL_SECONDS_DEFAULT)),
+                              float(os.getenv("LINK_WINDOW_SECONDS", WINDOW_SECONDS_DEFAULT)),
+                              clock=clock.monotonic)
+    link_publish_seconds = float(os.getenv("LINK_PUBLISH_SECONDS", 0))
+    link_published = last_arrival = clock.monotonic()
+
+    ## event-driven streams run timers while waiting for data, i.e., also on a dead link
+    timers = hasattr(stream, 'add_timer')
+    if timers:
+        if link_publish_seconds > 0:
+            stream.add_timer(link_publish_seconds, lambda: send_mqtt(link2msgs(link.stats())))
+        watchdog_seconds = float(os.getenv("SERIAL_WATCHDOG_SECONDS", 0))
+        if watchdog_seconds > 0:
+            def watchdog():
+                silence = clock.monotonic() - last_arrival
+                if silence > watchdog_seconds:
+                    logging.warning("No frames received for %d seconds!", silence)
+            stream.add_timer(watchdog_seconds, watchdog)
 
-    last_dt = datetime.datetime.min
-    last_light = -1
-    last_switch1 = -1
-    last_switch2 = -1
     while True:
         ## parse stream, look for relevant data strings
         try:
-            result = look_in_stream(stream)
+            result = look_in_stream(stream, dedup=dedup, link=link, stages=stages)
         except IOError as ex:
             if str(ex) == "EOF reached!":
                 ## EOF reached is not an error per se...
@@ -268,55 +768,87 @@ def handle_stream(stream):
             logging.exception(ex)
             break
 
+        ## no frames on a dead link, i.e., the link stats are not published then either
+        if not timers and link_publish_seconds > 0 and clock.monotonic() - link_published >= link_publish_seconds:
+            link_published = clock.monotonic()
+            send_mqtt(link2msgs(link.stats()))
+
         if result is None:
             continue
         else:
+            if history is not None or store is not None or bus is not None:
+                timestamp = clock.time()
+                if history is not None:
+                    history.append(result, timestamp)
+                if store is not None:
+                    store.append(result, timestamp)
+                if bus is not None:
+                    bus.write(result, timestamp)
+
+            now = last_arrival = clock.monotonic()
+            state = nodes.get(result.node, now)
+            link.frame(now, state.last_arrival)
+            state.last_arrival = now
+
             ## flag for MQTT sending
             do_send = False
 
             ## extra handling for light sensor
             if result.get('light'):
-                if last_light != -1 and abs(last_light - result.get('light').value) > 50:  ## skip initial
+                if state.last_light != -1 and abs(state.last_light - result.get('light').value) > 50:  ## skip initial
                     logging.info('Significant light change detected!')
                     do_send = True
-                last_light = result.get('light').value
+                state.last_light = result.get('light').value
 
             ## extra handling for switches
             if result.get('switch1'):
                 value = result.get('switch1').value
-                if last_switch1 != value:
+                if state.last_switch1 != value:
                     logging.info('Switch1 change detected! (value=%d)', value)
                     ## force sending
                     do_send = True
-                    last_switch1 = value
+                    state.last_switch1 = value
             if result.get('switch2'):
                 value = result.get('switch2').value
-                if last_switch2 != value:
+                if state.last_switch2 != value:
                     logging.info('Switch2 change detected! (value=%d)', value)
                     ## force sending
                     do_send = True
-                    last_switch2 = value
+                    state.last_switch2 = value
 
             ## periodic sending, make sure to send not too often
-            now = datetime.datetime.now()
-            tdiff_seconds = (now - last_dt).total_seconds()
-            logging.debug("result: %s, tdiff_seconds: %d", result, tdiff_seconds)
-            if tdiff_seconds > int(os.getenv("MQTT_TIME_PERIOD_SECONDS", MQTT_TIME_PERIOD_SECONDS_DEFAULT)):
-                last_dt = now
+            if state.last_sent is None or now - state.last_sent > time_period_seconds:
+                logging.debug("result: %s, periodic send", result)
+                state.last_sent = now
                 do_send = True
 
             ## only send if a condition from above is true
             if do_send:
                 ## converting result array to MQTT messages
-                msgs = datadict2msgs(result)
+                msgs = [] if combined_only else datadict2msgs(result)
+                if combined_format:
+                    msgs.append(combined2msg(result, combined_format))
+                if discovery_prefix:
+                    if state.discovery is None:
+                        state.discovery = make_discovery(result.node)
+                    ## announce newly seen fields before their values
+                    msgs = state.discovery.msgs(result, now) + msgs
                 ## send to MQTT
+                started = stages.start() if stages is not None else None
                 send_mqtt(msgs)
+                if stages is not None:
+                    stages.stop('publishing', started)
+
+    logging.info("Link quality: %s", link.stats())
+    if dedup is not None:
+        logging.info("Duplicate frames suppressed: %d (passed: %d)", dedup.suppressed, dedup.passed)
 
 
 def main():
     arguments = docopt(__doc__, version=f"garagenode_receiver_mqtt {__version__} ({__updated__})")
     arg_verbose = arguments["--verbose"]
     arg_simulate = arguments["--simulate"]
+    arg_replay = arguments["--replay"]
     arg_quiet = arguments["--quiet"]
 
     assert not (arg_verbose and arg_quiet), "CLI parameters verbose and quiet are mutually exclusive!"
@@ -340,9 +872,17 @@ def main():
     logging.info("SERIAL_PORT: %s", os.getenv("SERIAL_PORT"))
     logging.info("MQTT_TOPIC_BASE: %s", os.getenv("MQTT_TOPIC_BASE"))
     logging.info("MQTT_TIME_PERIOD_SECONDS: %s", os.getenv("MQTT_TIME_PERIOD_SECONDS"))
+    logging.info("MQTT_DISCOVERY_PREFIX: %s", os.getenv("MQTT_DISCOVERY_PREFIX"))
+    logging.info("MQTT_COMBINED_FORMAT: %s", os.getenv("MQTT_COMBINED_FORMAT"))
+    logging.info("LINK_PUBLISH_SECONDS: %s", os.getenv("LINK_PUBLISH_SECONDS"))
 
     ## setup input stream
-    if arg_simulate:
+    clock = None
+    if arg_replay:
+        logging.warning("!!! REPLAY MODE !!! capture: %s", os.path.realpath(arg_replay))
+        clock = ReplayClock()
+        stream = ReplayStream(arg_replay, clock)
+    elif arg_simulate:
         logging.warning("!!! DEBUG/SIMULATE MODE !!! TESTDATA_FILE: %s", os.path.realpath(TESTDATA_FILE))
         ## for debugging use a binary capture sample
         stream = open(TESTDATA_FILE, 'rb')
@@ -356,25 +896,74 @@ def main():
             stopbits=serial.STOPBITS_ONE,
             bytesize=serial.EIGHTBITS
         )
-    
+        ## thread: dedicated reader thread to always drain the serial port
+        ## select: event-driven, sleep in select()/epoll between frames, timers for periodic tasks
+        ## direct: blocking reads in the processing loop (SERIAL_READER_THREAD=false before)
+        read_mode = os.getenv("SERIAL_READ_MODE")
+        if not read_mode:
+            read_mode = "thread" if os.getenv("SERIAL_READER_THREAD", "true").lower() in ("1", "true", "yes") \
+                else "direct"
+        assert read_mode in ("thread", "select", "direct"), "Invalid SERIAL_READ_MODE!"
+        if read_mode == "thread":
+            stream = SerialReaderThread(stream, int(os.getenv("SERIAL_RING_BYTES", RING_BUFFER_SIZE_DEFAULT))).start()
+        elif read_mode == "select":
+            stream = SelectorStream(stream)
+
     logging.info("input stream: %s", stream)
 
+    ## in-memory history of recent readings with local query interface
+    history = None
+    if os.getenv("HISTORY_HTTP_PORT"):
+        history = ReadingsHistory(int(os.getenv("HISTORY_SIZE", HISTORY_SIZE_DEFAULT)))
+        start_http_server(history, os.getenv("HISTORY_HTTP_HOST", "127.0.0.1"), int(os.getenv("HISTORY_HTTP_PORT")))
+
+    ## on-device compressed time-series store
+    store = None
+    if os.getenv("TSDB_PATH"):
+        store = TimeSeriesStore(os.getenv("TSDB_PATH"),
+                                block_samples=int(os.getenv("TSDB_BLOCK_SAMPLES", BLOCK_SAMPLES_DEFAULT)),
+                                flush_seconds=float(os.getenv("TSDB_FLUSH_SECONDS", FLUSH_SECONDS_DEFAULT)),
+                                retention_days=float(os.getenv("TSDB_RETENTION_DAYS", RETENTION_DAYS_DEFAULT)))
+        ## compaction and retention in a background thread, not in the receive loop
+        store.start()
+        logging.info("TSDB_PATH: %s", store.path)
+        ## systemd stops with SIGTERM, make sure buffered readings get written
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    ## shared-memory bus with the latest reading for local consumers
+    bus = None
+    if os.getenv("SHM_PATH"):
+        bus = ReadingsWriter(os.getenv("SHM_PATH"))
+        logging.info("SHM_PATH: %s", bus.path)
+
+    ## runtime profiling: SIGUSR1 starts sampling, SIGUSR2 stops and writes collapsed stacks
+    ## (flame graphs) and logs the per-stage timers, PROFILE=true samples right from the start
+    profiler = SamplingProfiler(float(os.getenv("PROFILE_INTERVAL_SECONDS", SAMPLE_INTERVAL_SECONDS_DEFAULT)))
+    stages = StageTimers()
+    profile_path = os.getenv("PROFILE_PATH", PROFILE_PATH_DEFAULT)
+    install_signal_handlers(profiler, stages, profile_path)
+    if os.getenv("PROFILE", "").lower() in ("1", "true", "yes"):
+        profiler.start()
+
     ## handle stream, i.e., listen for incoming data
-    handle_stream(stream)
+    try:
+        handle_stream(stream, history=history, store=store, bus=bus, stages=stages, clock=clock)
+    finally:
+        if profiler.running:
+            dump_profile(profiler, stages, profile_path)
+        if store is not None:
+            ## stop the compaction, write buffered readings
+            store.close()
+        if isinstance(stream, SerialReaderThread):
+            logging.info("serial reader: %d bytes received, %d overflows (%d bytes dropped)",
+                         stream.bytes_received, stream.overflows, stream.overflow_bytes)
+        elif isinstance(stream, SelectorStream):
+            logging.info("serial: %d bytes received, %d wakeups, %d timer calls",
+                         stream.bytes_received, stream.wakeups, stream.timer_calls)
 
 
 if __name__ == '__main__':
     if DEBUG:
         # sys.argv.append('--verbose')
         pass
-    if os.environ.get("PROFILE", "").lower() in ("true", "1", "yes"):
-        import cProfile
-        import pstats
-        profile_filename = f"{__file__}.profile"
-        cProfile.run('main()', profile_filename)
-        with open(f'{profile_filename}.txt', 'w', encoding="utf8") as statsfp:
-            profile_stats = pstats.Stats(profile_filename, stream=statsfp)
-            stats = profile_stats.strip_dirs().sort_stats('cumulative')
-            stats.print_stats()
-        sys.exit(0)
     sys.exit(main())
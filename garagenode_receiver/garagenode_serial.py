@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""garagenode_serial.py - Serial port input helpers for the GarageNode receiver.
+
+SerialReaderThread drains the serial port in a dedicated thread, so the UART's small
+kernel buffer cannot overflow while the processing loop is busy (e.g., connecting to MQTT).
+
+SelectorStream waits on the serial port's file descriptor with `selectors` (epoll on Linux)
+and runs timer callbacks while idle, i.e., no wakeups between the sender's frames.
+"""
+##
+## LICENSE:
+##
+## Copyright (C) 2019-2022 Alexander Streicher
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU Affero General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Affero General Public License for more details.
+##
+## You should have received a copy of the GNU Affero General Public License
+## along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+import heapq
+import logging
+import os
+import selectors
+import threading
+import time
+
+RING_BUFFER_SIZE_DEFAULT = 64 * 1024
+CHUNK_SIZE_DEFAULT = 4096
+
+
+class SerialReaderThread(object):
+    """
+    Reader thread that only drains a serial port into a preallocated ring buffer.
+    The processing loop consumes it like a stream via `read()`.
+
+    Single producer (reader thread) and single consumer: the producer only advances
+    `_head` and the consumer only `_tail` (both ever increasing byte counters), i.e.,
+    no lock is needed for the handoff. If the buffer is full, newly received bytes
+    are dropped and counted as overflow.
+    """
+
+    def __init__(self, port, size: int = RING_BUFFER_SIZE_DEFAULT):
+        """
+        :param port: serial port (`serial.Serial`, blocking, i.e. no timeout)
+        :param size: ring buffer size in bytes
+        """
+        if size < 1:
+            raise ValueError("size must be positive!")
+        self.port = port
+        self.size = size
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._head = 0
+        self._tail = 0
+        self._data_available = threading.Event()
+        self._stopped = False
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name='serial-reader', daemon=True)
+        ## counters
+        self.bytes_received = 0
+        self.overflows = 0
+        self.overflow_bytes = 0
+
+    def __repr__(self):
+        return "SerialReaderThread(%s, size=%d)" % (self.port, self.size)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the reader thread, pending `read()` calls return EOF."""
+        self._stopped = True
+        if hasattr(self.port, 'cancel_read'):
+            self.port.cancel_read()
+        self._data_available.set()
+        self._thread.join(timeout=5)
+
+    def readable(self):
+        return True
+
+    def __len__(self):
+        """Number of buffered bytes."""
+        return self._head - self._tail
+
+    def _run(self):
+        try:
+            while not self._stopped:
+                ## block for 1 byte, then take everything that is waiting
+                data = self.port.read(1)
+                if not data:
+                    ## read cancelled or EOF
+                    break
+                waiting = self.port.in_waiting
+                if waiting:
+                    data += self.port.read(waiting)
+                self._put(data)
+        except Exception as ex:
+            self._error = ex
+        finally:
+            self._stopped = True
+            self._data_available.set()
+
+    def _put(self, data: bytes):
+        self.bytes_received += len(data)
+        free = self.size - (self._head - self._tail)
+        if len(data) > free:
+            self.overflows += 1
+            self.overflow_bytes += len(data) - free
+            logging.warning("Serial ring buffer overflow, %d bytes dropped (total: %d)",
+                            len(data) - free, self.overflow_bytes)
+            data = data[:free]
+        n = len(data)
+        if not n:
+            return
+        start = self._head % self.size
+        first = min(n, self.size - start)
+        self._view[start:start + first] = data[:first]
+        if first < n:
+            self._view[:n - first] = data[first:]
+        ## publish the bytes to the consumer only after they are copied
+        self._head += n
+        self._data_available.set()
+
+    def read(self, size: int = 1):
+        """
+        Read up to `size` bytes, blocks until at least one byte is available.
+        :return: bytes, empty at EOF (reader stopped)
+        :raise: the reader thread's exception, e.g., `serial.SerialException`
+        """
+        while self._head == self._tail:
+            if self._stopped:
+                if self._error is not None:
+                    raise self._error
+                return b''
+            self._data_available.wait()
+            self._data_available.clear()
+        n = min(size, self._head - self._tail)
+        start = self._tail % self.size
+        first = min(n, self.size - start)
+        data = bytes(self._view[start:start + first])
+        if first < n:
+            data += bytes(self._view[:n - first])
+        self._tail += n
+        return data
+
+
+class SelectorStream(object):
+    """
+    Event-driven input stream on a file descriptor (serial port, pty, pipe).
+    `read()` serves from the last chunk; only when it is used up, the process sleeps in
+    `select()` until the descriptor is readable or the next timer is due, and then reads
+    everything available in one call. Timer callbacks (periodic publishing, watchdogs)
+    run within `read()`, i.e., in the processing thread.
+    """
+
+    def __init__(self, port, chunk_size: int = CHUNK_SIZE_DEFAULT):
+        """
+        :param port: object with `fileno()` (e.g., `serial.Serial`) or file descriptor
+        :param chunk_size: max. bytes per read syscall
+        """
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be positive!")
+        self.port = port
+        self.fd = port if isinstance(port, int) else port.fileno()
+        self.chunk_size = chunk_size
+        os.set_blocking(self.fd, False)
+        ## self-pipe to wake up `select()` on stop
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self.fd, selectors.EVENT_READ)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ)
+        self._chunk = b''
+        self._pos = 0
+        self._eof = False
+        ## heap of (deadline, sequence number, interval, callback)
+        self._timers = []
+        self._timer_seq = 0
+        ## counters
+        self.wakeups = 0
+        self.bytes_received = 0
+        self.timer_calls = 0
+
+    def __repr__(self):
+        return "SelectorStream(%s)" % (self.port,)
+
+    def readable(self):
+        return True
+
+    def add_timer(self, interval: float, callback):
+        """
+        Call `callback()` every `interval` seconds (monotonic clock) while reading.
+        """
+        if interval <= 0:
+            raise ValueError("interval must be positive!")
+        self._timer_seq += 1
+        heapq.heappush(self._timers, (time.monotonic() + interval, self._timer_seq, interval, callback))
+
+    def stop(self):
+        """Pending and further `read()` calls return EOF (thread-safe)."""
+        os.write(self._wakeup_w, b'\0')
+
+    def close(self):
+        self._selector.close()
+        os.close(self._wakeup_r)
+        os.close(self._wakeup_w)
+
+    def _run_timers(self):
+        now = time.monotonic()
+        while self._timers and self._timers[0][0] <= now:
+            deadline, seq, interval, callback = heapq.heappop(self._timers)
+            ## no catching up after a long busy phase
+            heapq.heappush(self._timers, (max(deadline + interval, now), seq, interval, callback))
+            self.timer_calls += 1
+            try:
+                callback()
+            except Exception as ex:
+                logging.exception(ex)
+
+    def _wait(self):
+        timeout = None
+        if self._timers:
+            timeout = max(0.0, self._timers[0][0] - time.monotonic())
+        events = self._selector.select(timeout)
+        self.wakeups += 1
+        for key, _ in events:
+            if key.fd == self._wakeup_r:
+                self._eof = True
+                return
+        if events:
+            try:
+                data = os.read(self.fd, self.chunk_size)
+            except BlockingIOError:
+                ## spurious wakeup
+                data = None
+            if data == b'':
+                self._eof = True
+            elif data:
+                self.bytes_received += len(data)
+                self._chunk = data
+                self._pos = 0
+        self._run_timers()
+
+    def read(self, size: int = 1):
+        """
+        Read up to `size` bytes, blocks until at least one byte is available.
+        :return: bytes, empty at EOF (or after `stop()`)
+        :raise: OSError, e.g., if the serial device is gone
+        """
+        while self._pos >= len(self._chunk):
+            if self._eof:
+                return b''
+            self._wait()
+        data = self._chunk[self._pos:self._pos + size]
+        self._pos += len(data)
+        return data
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""garagenode_shm.py - Shared-memory bus with the latest GarageNode reading.
+
+The receiver writes the latest decoded reading into a memory-mapped file with a
+fixed layout (e.g., in /dev/shm), protected by a sequence lock. Local processes
+poll it with `ReadingsReader` without syscalls and without an MQTT round-trip.
+
+Usage:
+  garagenode_shm.py [--interval=SEC] [PATH]
+  garagenode_shm.py -h | --help
+
+Arguments:
+  PATH              Shared memory file, defaults to /dev/shm/garagenode.
+
+Options:
+  -h --help         Show this screen.
+  --interval=SEC    Poll interval, print every new reading [default: 1].
+"""
+##
+## LICENSE:
+##
+## Copyright (C) 2019-2022 Alexander Streicher
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU Affero General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Affero General Public License for more details.
+##
+## You should have received a copy of the GNU Affero General Public License
+## along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+import math
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+
+SHM_PATH_DEFAULT = '/dev/shm/garagenode'
+
+MAGIC = b'GNSH'
+VERSION = 2
+## header: magic, version, sequence number (odd while being written)
+HEADER = struct.Struct('<4sIQ')
+## reading: timestamp, humidity, temperature, light, switch1, switch2, node ID length, node ID
+## missing values: NaN for floats, -1 for integers
+READING = struct.Struct('<dddqbbB32s')
+## followed by the CRC32 of the packed reading
+_CRC = struct.Struct('<I')
+_CRC_OFFSET = HEADER.size + READING.size
+SIZE = _CRC_OFFSET + _CRC.size
+_SEQ = struct.Struct('<Q')
+_SEQ_OFFSET = 8
+
+
+class ReadingsWriter(object):
+    """
+    Single writer of the latest reading.
+    Updates are wait-free: the sequence number is made odd, the reading is copied
+    in and the sequence number is made even again; readers retry on odd or changed
+    sequence numbers.
+    Python has no explicit memory fences, i.e., on weakly ordered CPUs (ARM) a reader may
+    see the stores out of order. Therefore the reading carries a CRC32, which readers
+    verify in addition to the sequence numbers.
+    """
+
+    def __init__(self, path: str = SHM_PATH_DEFAULT):
+        self.path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, SIZE)
+            self._mm = mmap.mmap(fd, SIZE)
+        finally:
+            os.close(fd)
+        self._seq = 0
+        HEADER.pack_into(self._mm, 0, MAGIC, VERSION, self._seq)
+
+    def close(self):
+        self._mm.close()
+
+    def write(self, envelope, timestamp: float = None):
+        """
+        Publish a reading.
+        :param envelope: MessageEnvelope
+        :param timestamp: UNIX timestamp, defaults to now
+        """
+        def value_or(name, default):
+            msg = envelope.get(name)
+            return default if msg is None else msg.value
+        node = (getattr(envelope, 'node', None) or '').encode('utf8')[:32]
+        mm = self._mm
+        self._seq += 1
+        _SEQ.pack_into(mm, _SEQ_OFFSET, self._seq)
+        data = READING.pack(time.time() if timestamp is None else timestamp,
+                            value_or('humidity', math.nan),
+                            value_or('temperature', math.nan),
+                            value_or('light', -1),
+                            value_or('switch1', -1),
+                            value_or('switch2', -1),
+                            len(node), node)
+        mm[HEADER.size:_CRC_OFFSET] = data
+        _CRC.pack_into(mm, _CRC_OFFSET, zlib.crc32(data))
+        self._seq += 1
+        _SEQ.pack_into(mm, _SEQ_OFFSET, self._seq)
+
+
+class ReadingsReader(object):
+    """
+    Reader for the latest reading, any number of readers.
+
+    Example:
+        reader = ReadingsReader()
+        reading = reader.read()   ## dict or None if nothing written yet
+    """
+
+    def __init__(self, path: str = SHM_PATH_DEFAULT):
+        self.path = path
+        with open(path, 'rb') as fp:
+            self._mm = mmap.mmap(fp.fileno(), SIZE, access=mmap.ACCESS_READ)
+        magic, version, _ = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self._mm.close()
+            raise ValueError("%s is not a GarageNode readings file (version %d)!" % (path, VERSION))
+        self.last_seq = 0
+
+    def close(self):
+        self._mm.close()
+
+    @property
+    def seq(self):
+        """Current sequence number (changes with every update)."""
+        return _SEQ.unpack_from(self._mm, _SEQ_OFFSET)[0]
+
+    def read(self, retries: int = 1000):
+        """
+        Consistent snapshot of the latest reading.
+        :param retries: max. attempts while the writer is updating
+        :return: dict with 'seq', 'timestamp', 'node' and the available values, None if nothing written yet
+        :raise: TimeoutError if no consistent snapshot could be taken
+        """
+        mm = self._mm
+        for _ in range(retries):
+            seq1 = _SEQ.unpack_from(mm, _SEQ_OFFSET)[0]
+            if not seq1 & 1:
+                data = mm[HEADER.size:_CRC_OFFSET]
+                crc = _CRC.unpack_from(mm, _CRC_OFFSET)[0]
+                seq2 = _SEQ.unpack_from(mm, _SEQ_OFFSET)[0]
+                ## nothing written yet (no CRC) or a complete reading
+                if seq1 == seq2 and (seq1 == 0 or zlib.crc32(data) == crc):
+                    break
+            ## yield, the writer may be a preempted thread of this process
+            time.sleep(0)
+        else:
+            raise TimeoutError("no consistent reading after %d retries" % retries)
+        if seq1 == 0:
+            return None
+        self.last_seq = seq1
+        timestamp, humidity, temperature, light, switch1, switch2, node_length, node = READING.unpack(data)
+        result = {'seq': seq1, 'timestamp': timestamp, 'node': node[:node_length].decode('utf8') or None}
+        if light != -1:
+            result['light'] = light
+        if humidity == humidity:
+            result['humidity'] = humidity
+        if temperature == temperature:
+            result['temperature'] = temperature
+        if switch1 != -1:
+            result['switch1'] = switch1
+        if switch2 != -1:
+            result['switch2'] = switch2
+        return result
+
+    def changed(self):
+        """True if there is a newer reading than the last one read."""
+        return self.seq != self.last_seq
+
+
+def main():
+    from docopt import docopt
+    arguments = docopt(__doc__)
+    reader = ReadingsReader(arguments["PATH"] or SHM_PATH_DEFAULT)
+    interval = float(arguments["--interval"])
+    try:
+        while True:
+            if reader.changed():
+                print(reader.read(), flush=True)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,650 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""garagenode_tsdb.py - Compressed time-series store for GarageNode readings.
+
+Append-only day segment files of compressed blocks, meant for local history on the
+receiver (SD card friendly: readings are buffered in memory and written in batches,
+each reading is rewritten at most once by the compaction, expired days are deleted as a whole).
+Timestamps are delta-of-delta encoded, humidity/temperature XOR encoded
+(Gorilla style) and light/switches delta encoded.
+
+Usage:
+  garagenode_tsdb.py query [options] DIR
+  garagenode_tsdb.py info DIR
+  garagenode_tsdb.py compact [--retention-days=DAYS] DIR
+  garagenode_tsdb.py -h | --help
+
+Arguments:
+  DIR           Store directory (TSDB_PATH).
+
+Options:
+  -h --help               Show this screen.
+  --from=TIME             Start time, ISO format or UNIX timestamp.
+  --to=TIME               End time (inclusive), ISO format or UNIX timestamp.
+  --node=ID               Sender node ID, '-' for the sender without ID.
+  --json                  Output JSON lines instead of CSV.
+  --retention-days=DAYS   Drop data older than this [default: 60].
+"""
+##
+## LICENSE:
+##
+## Copyright (C) 2019-2022 Alexander Streicher
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU Affero General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Affero General Public License for more details.
+##
+## You should have received a copy of the GNU Affero General Public License
+## along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+import datetime
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+
+MAGIC = b'GNTS'
+VERSION = 2
+## magic, version, node ID length, sample count, first/last timestamp [ms], payload length,
+## CRC32 (header up to the CRC + node ID + payload)
+BLOCK_HEADER = struct.Struct('<4sBBHqqII')
+_CRC_OFFSET = BLOCK_HEADER.size - 4
+
+BLOCK_SAMPLES_DEFAULT = 1024
+FLUSH_SECONDS_DEFAULT = 15 * 60
+RETENTION_DAYS_DEFAULT = 60
+COMPACT_SECONDS_DEFAULT = 3600
+SEGMENT_SUFFIX = '.gnts'
+
+## row: (timestamp [s], light, humidity, temperature, switch1, switch2)
+## missing values: -1 for integers, NaN for floats
+ROW_FIELDS = ('timestamp', 'light', 'humidity', 'temperature', 'switch1', 'switch2')
+INT_FIELDS = ('light', 'switch1', 'switch2')
+
+_double = struct.Struct('<d')
+_uint64 = struct.Struct('<Q')
+
+
+def _float2bits(value: float):
+    return _uint64.unpack(_double.pack(value))[0]
+
+
+def _bits2float(bits: int):
+    return _double.unpack(_uint64.pack(bits))[0]
+
+
+class BitWriter(object):
+    def __init__(self):
+        self._buf = bytearray()
+        self._acc = 0
+        self._nbits = 0
+
+    def write(self, value: int, nbits: int):
+        self._acc = (self._acc << nbits) | (value & ((1 << nbits) - 1))
+        self._nbits += nbits
+        while self._nbits >= 8:
+            self._nbits -= 8
+            self._buf.append((self._acc >> self._nbits) & 0xff)
+        self._acc &= (1 << self._nbits) - 1
+
+    def getvalue(self):
+        if self._nbits:
+            return bytes(self._buf) + bytes([(self._acc << (8 - self._nbits)) & 0xff])
+        return bytes(self._buf)
+
+
+class BitReader(object):
+    def __init__(self, data: bytes):
+        self._data = data
+        self._pos = 0
+        self._acc = 0
+        self._nbits = 0
+
+    def read(self, nbits: int):
+        while self._nbits < nbits:
+            if self._pos >= len(self._data):
+                raise ValueError("unexpected end of block data")
+            self._acc = (self._acc << 8) | self._data[self._pos]
+            self._pos += 1
+            self._nbits += 8
+        self._nbits -= nbits
+        value = self._acc >> self._nbits
+        self._acc &= (1 << self._nbits) - 1
+        return value
+
+
+## variable length signed integers: (prefix, prefix bits, value bits)
+_INT_BUCKETS = ((0b10, 2, 7), (0b110, 3, 9), (0b1110, 4, 12), (0b1111, 4, 64))
+
+
+def _write_int(writer: BitWriter, value: int):
+    if value == 0:
+        writer.write(0, 1)
+        return
+    for prefix, prefix_bits, value_bits in _INT_BUCKETS:
+        if -(1 << (value_bits - 1)) <= value < (1 << (value_bits - 1)):
+            writer.write(prefix, prefix_bits)
+            writer.write(value, value_bits)
+            return
+    raise ValueError("value out of range: %d" % value)
+
+
+def _read_int(reader: BitReader):
+    if reader.read(1) == 0:
+        return 0
+    for _, prefix_bits, value_bits in _INT_BUCKETS:
+        ## each further '1' bit selects the next bucket, the last bucket has no terminating '0'
+        if value_bits == 64 or reader.read(1) == 0:
+            value = reader.read(value_bits)
+            if value >= 1 << (value_bits - 1):
+                value -= 1 << value_bits
+            return value
+
+
+class _XorState(object):
+    def __init__(self):
+        self.bits = 0
+        self.leading = -1
+        self.trailing = -1
+
+
+def _write_float(writer: BitWriter, state: _XorState, value: float):
+    bits = _float2bits(value)
+    xor = bits ^ state.bits
+    state.bits = bits
+    if xor == 0:
+        writer.write(0, 1)
+        return
+    leading = min(64 - xor.bit_length(), 31)
+    trailing = (xor & -xor).bit_length() - 1
+    if state.leading >= 0 and leading >= state.leading and trailing >= state.trailing:
+        ## meaningful bits fit into the previous window
+        writer.write(0b10, 2)
+        writer.write(xor >> state.trailing, 64 - state.leading - state.trailing)
+    else:
+        significant = 64 - leading - trailing
+        writer.write(0b11, 2)
+        writer.write(leading, 5)
+        writer.write(significant - 1, 6)
+        writer.write(xor >> trailing, significant)
+        state.leading = leading
+        state.trailing = trailing
+
+
+def _read_float(reader: BitReader, state: _XorState):
+    if reader.read(1) == 0:
+        return _bits2float(state.bits)
+    if reader.read(1) == 0:
+        xor = reader.read(64 - state.leading - state.trailing) << state.trailing
+    else:
+        state.leading = reader.read(5)
+        significant = reader.read(6) + 1
+        state.trailing = 64 - state.leading - significant
+        xor = reader.read(significant) << state.trailing
+    state.bits ^= xor
+    return _bits2float(state.bits)
+
+
+def encode_block(rows):
+    """
+    Compress rows (sorted by time).
+    :return: (first timestamp [ms], last timestamp [ms], payload bytes)
+    """
+    writer = BitWriter()
+    t_first = prev_t = int(round(rows[0][0] * 1000))
+    prev_delta = 0
+    prev_ints = [-1, -1, -1]
+    floats = [_XorState(), _XorState()]
+    for row in rows:
+        t = int(round(row[0] * 1000))
+        delta = t - prev_t
+        _write_int(writer, delta - prev_delta)
+        prev_t, prev_delta = t, delta
+        light, humidity, temperature, switch1, switch2 = row[1:]
+        for k, value in enumerate((light, switch1, switch2)):
+            _write_int(writer, value - prev_ints[k])
+            prev_ints[k] = value
+        _write_float(writer, floats[0], humidity)
+        _write_float(writer, floats[1], temperature)
+    return t_first, prev_t, writer.getvalue()
+
+
+def decode_block(t_first: int, count: int, payload: bytes):
+    """
+    Decompress rows, see `encode_block()`.
+    :return: list of rows
+    """
+    reader = BitReader(payload)
+    rows = []
+    prev_t = t_first
+    prev_delta = 0
+    ints = [-1, -1, -1]
+    floats = [_XorState(), _XorState()]
+    for _ in range(count):
+        prev_delta += _read_int(reader)
+        prev_t += prev_delta
+        for k in range(3):
+            ints[k] += _read_int(reader)
+        humidity = _read_float(reader, floats[0])
+        temperature = _read_float(reader, floats[1])
+        rows.append((prev_t / 1000.0, ints[0], humidity, temperature, ints[1], ints[2]))
+    return rows
+
+
+def envelope2row(envelope, timestamp: float):
+    """Row from a MessageEnvelope."""
+    def value_or(name, default):
+        msg = envelope.get(name)
+        return default if msg is None else msg.value
+    return (timestamp,
+            int(value_or('light', -1)),
+            float(value_or('humidity', math.nan)),
+            float(value_or('temperature', math.nan)),
+            int(value_or('switch1', -1)),
+            int(value_or('switch2', -1)))
+
+
+class Block(object):
+    """Block header info."""
+
+    def __init__(self, offset: int, node: str, node_length: int, count: int, t_first: int, t_last: int,
+                 payload_length: int, crc: int):
+        self.offset = offset
+        self.node = node
+        self.node_length = node_length
+        self.count = count
+        self.t_first = t_first
+        self.t_last = t_last
+        self.payload_length = payload_length
+        self.crc = crc
+        ## segment file name, set by TimeSeriesStore
+        self.segment = None
+
+    def __repr__(self):
+        return "block @%d node=%s count=%d [%d..%d]" % (self.offset, self.node, self.count, self.t_first, self.t_last)
+
+    @property
+    def end(self):
+        """File offset after the block."""
+        return self.offset + BLOCK_HEADER.size + self.node_length + self.payload_length
+
+
+def _pack_block(node: str, rows):
+    t_first, t_last, payload = encode_block(rows)
+    node_bytes = (node or '').encode('utf8')
+    header = BLOCK_HEADER.pack(MAGIC, VERSION, len(node_bytes), len(rows), t_first, t_last, len(payload), 0)
+    crc = zlib.crc32(node_bytes + payload, zlib.crc32(header[:_CRC_OFFSET]))
+    return header[:_CRC_OFFSET] + struct.pack('<I', crc) + node_bytes + payload
+
+
+def _read_header(fp, offset: int, size: int):
+    ## block at `offset` with a valid header and CRC (header, node ID and payload), None if there is none
+    fp.seek(offset)
+    header = fp.read(BLOCK_HEADER.size)
+    if len(header) < BLOCK_HEADER.size:
+        return None
+    magic, version, node_length, count, t_first, t_last, payload_length, crc = BLOCK_HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION:
+        return None
+    if offset + BLOCK_HEADER.size + node_length + payload_length > size:
+        return None
+    data = fp.read(node_length + payload_length)
+    if zlib.crc32(data, zlib.crc32(header[:_CRC_OFFSET])) != crc:
+        return None
+    node = data[:node_length].decode('utf8', errors='replace')
+    return Block(offset, node, node_length, count, t_first, t_last, payload_length, crc)
+
+
+def _find_block(fp, start: int, size: int):
+    """
+    Offset of the next valid block at or after `start`.
+    :return: offset or None if there is none
+    """
+    if start >= size:
+        return None
+    with mmap.mmap(fp.fileno(), size, access=mmap.ACCESS_READ) as mm:
+        offset = mm.find(MAGIC, start)
+        while offset != -1:
+            if _read_header(fp, offset, size) is not None:
+                return offset
+            offset = mm.find(MAGIC, offset + 1)
+    return None
+
+
+def _scan_blocks(fp):
+    """
+    Iterate over the blocks with a valid CRC (header, node ID and payload).
+    An invalid block (e.g., a bit flip on the SD card) is skipped up to the next valid block.
+    Stops at an invalid block without any valid block after it, i.e., a partially written
+    last block (e.g., power loss while writing).
+    """
+    size = os.fstat(fp.fileno()).st_size
+    offset = 0
+    while offset < size:
+        block = _read_header(fp, offset, size)
+        if block is not None:
+            yield block
+            offset = block.end
+            continue
+        found = _find_block(fp, offset + 1, size)
+        if found is None:
+            logging.warning("tsdb: truncated or invalid block at offset %d", offset)
+            return
+        logging.warning("tsdb: invalid block at offset %d, continuing at offset %d", offset, found)
+        offset = found
+
+
+def _read_rows(fp, block: Block):
+    fp.seek(block.offset)
+    header = fp.read(BLOCK_HEADER.size)
+    data = fp.read(block.node_length + block.payload_length)
+    if zlib.crc32(data, zlib.crc32(header[:_CRC_OFFSET])) != block.crc:
+        logging.warning("tsdb: CRC error in %s, skipping", block)
+        return []
+    try:
+        return decode_block(block.t_first, block.count, data[block.node_length:])
+    except ValueError as ex:
+        logging.warning("tsdb: corrupt %s (%s), skipping", block, ex)
+        return []
+
+
+class TimeSeriesStore(object):
+    """
+    Append-only compressed store: a directory with one segment file per (UTC) day.
+    Rows are buffered per node and appended as blocks to the segment of the block's last
+    reading when `block_samples` rows are collected or `flush_seconds` have passed.
+    Maintenance (`compact()`, every `compact_seconds` in a background thread after `start()`)
+    merges the partial blocks of a closed segment (day is over or a newer segment exists) once,
+    i.e., a reading is rewritten at most once, and deletes whole segments older than `retention_days`.
+    Appending never compacts.
+    """
+
+    def __init__(self, path: str, block_samples: int = BLOCK_SAMPLES_DEFAULT,
+                 flush_seconds: float = FLUSH_SECONDS_DEFAULT,
+                 retention_days: float = RETENTION_DAYS_DEFAULT,
+                 compact_seconds: float = COMPACT_SECONDS_DEFAULT):
+        """
+        :param path: store directory, created if missing
+        """
+        if not 0 < block_samples <= 0xffff:
+            raise ValueError("block_samples must be 1..65535!")
+        if os.path.exists(path) and not os.path.isdir(path):
+            raise ValueError("%s is not a directory!" % path)
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.block_samples = block_samples
+        self.flush_seconds = flush_seconds
+        self.retention_days = retention_days
+        self.compact_seconds = compact_seconds
+        ## node -> list of rows
+        self._buffers = {}
+        self._last_flush = time.monotonic()
+        ## segment file operations (flush vs. background compaction)
+        self._lock = threading.Lock()
+        ## segments compacted and not appended to since
+        self._compacted = set()
+        self._thread = None
+        self._stop = threading.Event()
+        self._repair()
+
+    @staticmethod
+    def segment_name(t_ms: float):
+        """Segment file name for a timestamp [ms]."""
+        return time.strftime('%Y%m%d', time.gmtime(t_ms / 1000)) + SEGMENT_SUFFIX
+
+    @staticmethod
+    def _segment_end(name: str):
+        ## UNIX timestamp of the end of the segment's day
+        day = datetime.datetime.strptime(name[:8], '%Y%m%d').replace(tzinfo=datetime.timezone.utc)
+        return day.timestamp() + 24 * 3600
+
+    def segments(self):
+        """Segment file names, oldest first."""
+        return sorted(name for name in os.listdir(self.path)
+                      if name.endswith(SEGMENT_SUFFIX) and len(name) == 8 + len(SEGMENT_SUFFIX) and name[:8].isdigit())
+
+    def _repair(self):
+        ## cut off a partially written block at the end of the segments (invalid blocks in between are
+        ## skipped by the scan) and remove the leftovers of an interrupted compaction
+        for name in os.listdir(self.path):
+            if name.endswith(SEGMENT_SUFFIX + '.tmp'):
+                os.remove(os.path.join(self.path, name))
+        for name in self.segments():
+            path = os.path.join(self.path, name)
+            with open(path, 'r+b') as fp:
+                magic, version = struct.unpack('<4sB', fp.read(5).ljust(5, b'\0'))
+                if magic == MAGIC and version != VERSION:
+                    ## all blocks would be invalid, i.e., the whole segment would be cut off
+                    raise ValueError("%s: unsupported store version %d (expected %d)!" % (path, version, VERSION))
+                end = 0
+                for block in _scan_blocks(fp):
+                    end = block.end
+                if end < os.fstat(fp.fileno()).st_size:
+                    logging.warning("tsdb: truncating %s to %d bytes", path, end)
+                    fp.truncate(end)
+
+    def start(self):
+        """Run `compact()` every `compact_seconds` in a background thread."""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='tsdb-compact', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=60)
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.compact_seconds):
+            try:
+                self.compact()
+            except Exception as ex:
+                logging.exception("tsdb: compaction failed: %s", ex)
+
+    def append(self, envelope, timestamp: float = None):
+        """
+        Buffer a reading, write if due.
+        :param envelope: MessageEnvelope
+        :param timestamp: UNIX timestamp, defaults to now
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        node = getattr(envelope, 'node', None) or ''
+        buffer = self._buffers.setdefault(node, [])
+        buffer.append(envelope2row(envelope, timestamp))
+        if len(buffer) >= self.block_samples or time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        """Write all buffered rows, one single write per segment."""
+        self._last_flush = time.monotonic()
+        data = {}
+        for node, rows in self._buffers.items():
+            for k in range(0, len(rows), self.block_samples):
+                chunk = rows[k:k + self.block_samples]
+                name = self.segment_name(max(row[0] for row in chunk) * 1000)
+                data.setdefault(name, []).append(_pack_block(node, chunk))
+        self._buffers.clear()
+        with self._lock:
+            for name, blocks in data.items():
+                with open(os.path.join(self.path, name), 'ab') as fp:
+                    fp.write(b''.join(blocks))
+                    fp.flush()
+                    os.fsync(fp.fileno())
+                self._compacted.discard(name)
+                logging.debug("tsdb: %d blocks written to %s", len(blocks), name)
+
+    def close(self):
+        self.stop()
+        self.flush()
+
+    def _blocks(self, name: str):
+        ## blocks of a segment, with the segment name set
+        try:
+            with open(os.path.join(self.path, name), 'rb') as fp:
+                blocks = list(_scan_blocks(fp))
+        except FileNotFoundError:
+            ## deleted by the retention in the meantime
+            return []
+        for block in blocks:
+            block.segment = name
+        return blocks
+
+    def blocks(self):
+        """List of block headers, all segments."""
+        return [block for name in self.segments() for block in self._blocks(name)]
+
+    def query(self, start: float = None, end: float = None, node: str = None):
+        """
+        Stored rows in a time range (written data only, see `flush()`).
+        :param start: UNIX timestamp (inclusive), None for no limit
+        :param end: UNIX timestamp (inclusive), None for no limit
+        :param node: node ID ('' for the sender without ID), None for all nodes
+        :return: iterator of (node, row), sorted by time per block
+        """
+        start_ms = -math.inf if start is None else start * 1000
+        end_ms = math.inf if end is None else end * 1000
+        for name in self.segments():
+            ## the blocks of a segment end within its day
+            if self._segment_end(name) * 1000 <= start_ms:
+                continue
+            try:
+                fp = open(os.path.join(self.path, name), 'rb')
+            except FileNotFoundError:
+                continue
+            with fp:
+                for block in list(_scan_blocks(fp)):
+                    if node is not None and block.node != node:
+                        continue
+                    if block.t_last < start_ms or block.t_first > end_ms:
+                        continue
+                    for row in _read_rows(fp, block):
+                        if start_ms <= row[0] * 1000 <= end_ms:
+                            yield block.node, row
+
+    def compact(self, now: float = None):
+        """
+        Delete segments older than the retention time and merge the blocks of closed segments
+        (day is over or a newer segment exists) into full blocks per node, once per segment.
+        Buffered rows are not written, see `flush()`.
+        :param now: UNIX timestamp, defaults to now
+        """
+        if now is None:
+            now = time.time()
+        cutoff = now - self.retention_days * 24 * 3600
+        names = self.segments()
+        for name in names:
+            if self._segment_end(name) <= cutoff:
+                with self._lock:
+                    os.remove(os.path.join(self.path, name))
+                    self._compacted.discard(name)
+                logging.info("tsdb: segment %s expired, deleted", name)
+        names = [name for name in names if self._segment_end(name) > cutoff]
+        for name in names:
+            if name in self._compacted:
+                continue
+            if name == names[-1] and self._segment_end(name) > now:
+                ## still being appended to
+                continue
+            self._compact_segment(name)
+
+    def _compact_segment(self, name: str):
+        ## merge the blocks of a segment into full blocks per node,
+        ## the segment is rewritten and atomically replaced
+        path = os.path.join(self.path, name)
+        with self._lock:
+            blocks = self._blocks(name)
+            partial = sum(1 for block in blocks if block.count < self.block_samples)
+            ## one partial block per node is the best possible, invalid blocks are dropped
+            valid_size = sum(block.end - block.offset for block in blocks)
+            if partial <= len(set(block.node for block in blocks)) and valid_size == os.path.getsize(path):
+                self._compacted.add(name)
+                return
+            rows_per_node = {}
+            with open(path, 'rb') as fp:
+                for block in blocks:
+                    rows_per_node.setdefault(block.node, []).extend(_read_rows(fp, block))
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as fp:
+                for node, rows in rows_per_node.items():
+                    rows.sort(key=lambda row: row[0])
+                    for k in range(0, len(rows), self.block_samples):
+                        fp.write(_pack_block(node, rows[k:k + self.block_samples]))
+                fp.flush()
+                os.fsync(fp.fileno())
+            os.replace(tmp_path, path)
+            self._compacted.add(name)
+        logging.info("tsdb: compacted segment %s, %d blocks (%d partial) to %d bytes",
+                     name, len(blocks), partial, os.path.getsize(path))
+
+
+def parse_time(value: str):
+    """UNIX timestamp from ISO format or number string (None stays None)."""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value).timestamp()
+
+
+def main():
+    from docopt import docopt
+    arguments = docopt(__doc__)
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr, format='%(levelname)-8s %(message)s')
+
+    store = TimeSeriesStore(arguments["DIR"], retention_days=float(arguments["--retention-days"]))
+    if arguments["query"]:
+        node = arguments["--node"]
+        if node == '-':
+            node = ''
+        rows = store.query(parse_time(arguments["--from"]), parse_time(arguments["--to"]), node)
+        if not arguments["--json"]:
+            print("node," + ",".join(ROW_FIELDS))
+        for node, row in rows:
+            if arguments["--json"]:
+                entry = {'node': node or None}
+                for name, value in zip(ROW_FIELDS, row):
+                    if not (value == -1 and name in INT_FIELDS) and value == value:
+                        entry[name] = value
+                print(json.dumps(entry))
+            else:
+                print(node + "," + ",".join("" if (value == -1 and name in INT_FIELDS) or value != value else str(value)
+                                            for name, value in zip(ROW_FIELDS, row)))
+    elif arguments["info"]:
+        blocks = store.blocks()
+        segments = store.segments()
+        size = sum(os.path.getsize(os.path.join(store.path, name)) for name in segments)
+        samples = sum(block.count for block in blocks)
+        print("directory: %s (%d segments, %d bytes)" % (store.path, len(segments), size))
+        print("blocks: %d, samples: %d, %.1f bytes/sample" % (len(blocks), samples, size / samples if samples else 0))
+        for node in sorted(set(block.node for block in blocks)):
+            node_blocks = [block for block in blocks if block.node == node]
+            print("node %s: %d samples, %s .. %s" % (
+                node or '-', sum(block.count for block in node_blocks),
+                datetime.datetime.fromtimestamp(min(block.t_first for block in node_blocks) / 1000),
+                datetime.datetime.fromtimestamp(max(block.t_last for block in node_blocks) / 1000)))
+    elif arguments["compact"]:
+        store.compact()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+#!pytest
+
+import os
+import tempfile
+import unittest
+
+import pytest
+
+from garagenode_clock import *
+
+
+class ReplayClockTests(unittest.TestCase):
+
+    @staticmethod
+    def test_advance():
+        instance = ReplayClock()
+        instance.advance(100.5)
+        assert instance.monotonic() == instance.time() == 100.5
+        ## never backwards
+        instance.advance(50)
+        assert instance.monotonic() == 100.5
+
+
+class CaptureTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'capture.gncp')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_write_read(self):
+        ## prepare
+        with CaptureWriter(self.path) as writer:
+            writer.write(b'**L:11;', timestamp=1000.0)
+            writer.write(b'', timestamp=1000.5)
+            writer.write(b'S1:1$$', timestamp=1001.0)
+        ## check, empty reads are not recorded
+        with open(self.path, 'rb') as fp:
+            assert list(read_capture(fp)) == [(1000.0, b'**L:11;'), (1001.0, b'S1:1$$')]
+
+    def test_truncated(self):
+        with CaptureWriter(self.path) as writer:
+            writer.write(b'**L:11;', timestamp=1000.0)
+            writer.write(b'S1:1$$', timestamp=1001.0)
+        with open(self.path, 'r+b') as fp:
+            fp.truncate(os.path.getsize(self.path) - 2)
+        with open(self.path, 'rb') as fp:
+            assert list(read_capture(fp)) == [(1000.0, b'**L:11;')]
+
+    def test_invalid(self):
+        with open(self.path, 'wb') as fp:
+            fp.write(b'**L:11;S1:1$$')
+        with open(self.path, 'rb') as fp:
+            with pytest.raises(ValueError):
+                list(read_capture(fp))
+
+    def test_replay_stream(self):
+        ## prepare
+        with CaptureWriter(self.path) as writer:
+            writer.write(b'ab', timestamp=1000.0)
+            writer.write(b'c', timestamp=1060.0)
+        clock = ReplayClock()
+        instance = ReplayStream(self.path, clock)
+        ## check, the clock follows the bytes read
+        assert instance.read(1) == b'a'
+        assert clock.monotonic() == 1000.0
+        assert instance.read(5) == b'b'
+        assert clock.monotonic() == 1000.0
+        assert instance.read(1) == b'c'
+        assert clock.monotonic() == 1060.0
+        assert instance.read(1) == b''
+        assert instance.records == 2
+        instance.close()
@@ -0,0 +1,145 @@
+#!pytest
+
+import json
+import math
+import unittest
+import urllib.error
+import urllib.request
+
+import pytest
+
+from garagenode_history import *
+from garagenode_receiver_mqtt import Message, MessageEnvelope
+
+
+def _envelope(light, temperature=None, node=None):
+    envelope = MessageEnvelope(node).add(Message('light', light))
+    if temperature is not None:
+        envelope.add(Message('temperature', temperature))
+    return envelope
+
+
+class ReadingsHistoryTests(unittest.TestCase):
+
+    @staticmethod
+    def test_empty():
+        instance = ReadingsHistory(3)
+        assert len(instance) == 0
+        assert instance.recent() == []
+        assert instance.stats()['count'] == 0
+        assert instance.stats()['fields']['light']['mean'] is None
+
+    @staticmethod
+    def test_invalid_size():
+        with pytest.raises(ValueError):
+            ReadingsHistory(0)
+
+    @staticmethod
+    def test_recent():
+        ## prepare
+        instance = ReadingsHistory(3)
+        instance.append(_envelope(1, 20.5), timestamp=100)
+        instance.append(_envelope(2), timestamp=101)
+        ## check
+        assert len(instance) == 2
+        assert instance.recent() == [{'timestamp': 100, 'light': 1, 'temperature': 20.5},
+                                     {'timestamp': 101, 'light': 2}]
+        assert instance.recent(1) == [{'timestamp': 101, 'light': 2}]
+
+    @staticmethod
+    def test_wraparound():
+        ## prepare
+        instance = ReadingsHistory(3)
+        for i in range(10):
+            instance.append(_envelope(i), timestamp=i)
+        ## check
+        assert len(instance) == 3
+        assert [entry['light'] for entry in instance.recent()] == [7, 8, 9]
+        assert [entry['light'] for entry in instance.recent(100)] == [7, 8, 9]
+
+    @staticmethod
+    def test_stats():
+        ## prepare
+        instance = ReadingsHistory(10)
+        instance.append(_envelope(10, 20.0), timestamp=1)
+        instance.append(_envelope(30, math.nan), timestamp=2)
+        instance.append(_envelope(20, 22.0), timestamp=3)
+        ## action
+        actual = instance.stats()
+        ## check
+        assert actual['count'] == 3
+        assert actual['first'] == 1
+        assert actual['last'] == 3
+        assert actual['fields']['light'] == {'count': 3, 'min': 10, 'max': 30, 'mean': 20, 'last': 20}
+        assert actual['fields']['temperature'] == {'count': 2, 'min': 20.0, 'max': 22.0, 'mean': 21.0, 'last': 22.0}
+        assert actual['fields']['switch1']['count'] == 0
+
+    @staticmethod
+    def test_nodes():
+        ## prepare
+        instance = ReadingsHistory(10)
+        instance.append(_envelope(10, 20.0, node='garage1'), timestamp=1)
+        instance.append(_envelope(500, 5.0, node='garage2'), timestamp=2)
+        instance.append(_envelope(30, 22.0, node='garage1'), timestamp=3)
+        instance.append(_envelope(40), timestamp=4)
+        ## check
+        assert [entry.get('node') for entry in instance.recent()] == ['garage1', 'garage2', 'garage1', None]
+        assert instance.recent(1, node='garage1') == [{'timestamp': 3, 'node': 'garage1', 'light': 30,
+                                                       'temperature': 22.0}]
+        assert instance.recent(node='garage2') == [{'timestamp': 2, 'node': 'garage2', 'light': 500,
+                                                    'temperature': 5.0}]
+        assert instance.recent(node='') == [{'timestamp': 4, 'light': 40}]
+        assert instance.recent(node='garage3') == []
+        actual = instance.stats(node='garage1')
+        assert actual['count'] == 2
+        assert actual['first'] == 1
+        assert actual['fields']['light'] == {'count': 2, 'min': 10, 'max': 30, 'mean': 20, 'last': 30}
+        assert instance.stats()['fields']['light']['max'] == 500
+
+    @staticmethod
+    def test_nodes_wraparound():
+        ## prepare, shorter node ID overwrites a longer one
+        instance = ReadingsHistory(2)
+        instance.append(_envelope(1, node='garage-long-name'), timestamp=1)
+        instance.append(_envelope(2, node='n2'), timestamp=2)
+        instance.append(_envelope(3, node='n1'), timestamp=3)
+        ## check
+        assert [entry['node'] for entry in instance.recent()] == ['n2', 'n1']
+        assert instance.recent(node='n1') == [{'timestamp': 3, 'node': 'n1', 'light': 3}]
+
+
+class HistoryHttpTests(unittest.TestCase):
+
+    def setUp(self):
+        self.history = ReadingsHistory(5)
+        self.history.append(_envelope(11, 20.0), timestamp=1)
+        self.history.append(_envelope(12), timestamp=2)
+        self.history.append(_envelope(13, node='n2'), timestamp=3)
+        self.server = start_http_server(self.history, port=0)
+        self.url = "http://%s:%d" % self.server.server_address[:2]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_history(self):
+        with urllib.request.urlopen(self.url + "/history?n=1") as response:
+            assert json.load(response) == [{'timestamp': 3, 'node': 'n2', 'light': 13}]
+
+    def test_history_node(self):
+        with urllib.request.urlopen(self.url + "/history?node=n2") as response:
+            assert json.load(response) == [{'timestamp': 3, 'node': 'n2', 'light': 13}]
+
+    def test_stats(self):
+        with urllib.request.urlopen(self.url + "/stats") as response:
+            assert json.load(response)['fields']['light']['max'] == 13
+
+    def test_stats_node(self):
+        with urllib.request.urlopen(self.url + "/stats?node=n2") as response:
+            actual = json.load(response)
+            assert actual['count'] == 1
+            assert actual['fields']['light']['min'] == 13
+
+    def test_not_found(self):
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(self.url + "/foobar")
@@ -0,0 +1,83 @@
+#!pytest
+
+import unittest
+
+import pytest
+
+from garagenode_link import *
+
+
+class LinkQualityMonitorTests(unittest.TestCase):
+
+    @staticmethod
+    def test_empty():
+        instance = LinkQualityMonitor()
+        actual = instance.stats(now=100)
+        assert actual['quality'] is None
+        assert actual['jitter_seconds'] is None
+        assert actual['frames'] == 0
+
+    @staticmethod
+    def test_perfect_link():
+        instance = LinkQualityMonitor(expected_interval=30, window_seconds=3600)
+        previous = None
+        for k in range(10):
+            now = 1000 + 30 * k
+            instance.frame(now, previous)
+            previous = now
+        actual = instance.stats(now=1300)
+        assert actual['quality'] == 1.0
+        assert actual['frames'] == 10
+        assert actual['missed'] == 0
+        assert actual['interval_seconds'] == pytest.approx(30)
+        assert actual['jitter_seconds'] == pytest.approx(0, abs=1e-9)
+
+    @staticmethod
+    def test_missed_and_jitter():
+        instance = LinkQualityMonitor(expected_interval=30, window_seconds=3600)
+        ## 3rd and 4th frame missing, arrivals off by +-1 s
+        for now, previous in ((1031, 1000), (1120, 1031), (1151, 1120)):
+            instance.frame(now, previous)
+        actual = instance.stats(now=1151)
+        assert actual['frames'] == 3
+        assert actual['missed'] == 2
+        assert actual['quality'] == pytest.approx(3 / 5)
+        assert actual['interval_seconds'] == pytest.approx(151 / 5)
+        assert actual['jitter_seconds'] > 0
+
+    @staticmethod
+    def test_dropped_and_damaged():
+        instance = LinkQualityMonitor(expected_interval=30, window_seconds=3600)
+        instance.frame(now=1000)
+        instance.frame(now=1030)
+        instance.damaged(now=1030)
+        instance.dropped(now=1040)
+        instance.truncated(now=1040)
+        instance.garbage(5, now=1040)
+        actual = instance.stats(now=1040)
+        ## frames of different nodes, i.e., no gaps
+        assert actual['quality'] == pytest.approx(1 / 3)
+        assert actual['truncated'] == 1
+        assert actual['garbage_bytes'] == 5
+
+    @staticmethod
+    def test_window_slides():
+        instance = LinkQualityMonitor(expected_interval=30, window_seconds=600, buckets=10)
+        instance.dropped(now=1000)
+        instance.frame(now=1000)
+        assert instance.stats(now=1500)['dropped'] == 1
+        ## the old bucket expired
+        instance.frame(now=1700)
+        actual = instance.stats(now=1700)
+        assert actual['dropped'] == 0
+        assert actual['frames'] == 1
+        assert actual['quality'] == 1.0
+        ## everything expired
+        assert instance.stats(now=100000)['frames'] == 0
+
+    @staticmethod
+    def test_invalid():
+        with pytest.raises(ValueError):
+            LinkQualityMonitor(expected_interval=0)
+        with pytest.raises(ValueError):
+            LinkQualityMonitor(buckets=0)
@@ -0,0 +1,115 @@
+#!pytest
+
+import os
+import signal
+import tempfile
+import threading
+import time
+import unittest
+
+import pytest
+
+from garagenode_profiler import *
+
+
+def _busy_loop(started, stop):
+    started.set()
+    while not stop.is_set():
+        sum(range(100))
+
+
+class SamplingProfilerTests(unittest.TestCase):
+
+    @staticmethod
+    def test_invalid_interval():
+        with pytest.raises(ValueError):
+            SamplingProfiler(0)
+
+    @staticmethod
+    def test_sample():
+        ## prepare
+        started = threading.Event()
+        stop = threading.Event()
+        thread = threading.Thread(target=_busy_loop, args=(started, stop), name='busy')
+        thread.start()
+        started.wait()
+        instance = SamplingProfiler()
+        try:
+            ## action
+            instance.sample()
+            instance.sample()
+        finally:
+            stop.set()
+            thread.join()
+        ## check
+        assert instance.samples == 2
+        lines = instance.collapsed()
+        busy = [line for line in lines if line.startswith('busy;')]
+        assert busy
+        stack, count = busy[0].rsplit(' ', 1)
+        assert int(count) >= 1
+        ## the innermost frame may be in `Event.is_set()`
+        assert 'test_garagenode_profiler.py:_busy_loop' in stack.split(';')[-2:]
+
+    @staticmethod
+    def test_start_stop_dump():
+        instance = SamplingProfiler(interval=0.001).start()
+        assert instance.running
+        time.sleep(0.05)
+        instance.stop()
+        assert not instance.running
+        assert instance.samples > 0
+        ## the sampler's own thread is not sampled
+        assert not any(line.startswith('sampling-profiler;') for line in instance.collapsed())
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'profile.collapsed')
+            instance.dump(path)
+            with open(path) as fp:
+                assert fp.read().splitlines() == instance.collapsed()
+
+    @staticmethod
+    def test_signals():
+        ## prepare
+        profiler = SamplingProfiler(interval=0.001)
+        timers = StageTimers()
+        timers.stop('parsing', timers.start())
+        old_handlers = signal.getsignal(signal.SIGUSR1), signal.getsignal(signal.SIGUSR2)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'profile.collapsed')
+            try:
+                install_signal_handlers(profiler, timers, path)
+                ## action
+                os.kill(os.getpid(), signal.SIGUSR1)
+                time.sleep(0.05)
+                assert profiler.running
+                ## stage timers are reset on start
+                assert timers.stats() == {}
+                os.kill(os.getpid(), signal.SIGUSR2)
+                time.sleep(0.01)
+                ## check
+                assert not profiler.running
+                assert os.path.exists(path)
+            finally:
+                profiler.stop()
+                signal.signal(signal.SIGUSR1, old_handlers[0])
+                signal.signal(signal.SIGUSR2, old_handlers[1])
+
+
+class StageTimersTests(unittest.TestCase):
+
+    @staticmethod
+    def test_stats():
+        instance = StageTimers()
+        for _ in range(3):
+            started = instance.start()
+            time.sleep(0.001)
+            instance.stop('publishing', started)
+        actual = instance.stats()
+        assert list(actual) == ['publishing']
+        assert actual['publishing']['count'] == 3
+        assert actual['publishing']['wall_ms'] >= 3
+        assert actual['publishing']['wall_ms_max'] >= actual['publishing']['wall_ms_mean']
+        ## sleeping does not use CPU
+        assert actual['publishing']['cpu_ms'] < actual['publishing']['wall_ms']
+        instance.reset()
+        assert instance.stats() == {}
@@ -1,6 +1,8 @@
 #!pytest
 
 import io
+import tempfile
+import threading
 import os
 
 import pytest
@@ -8,8 +10,12 @@ import pytest
 import garagenode_receiver_mqtt
 from garagenode_receiver_mqtt import *
 import unittest
+import unittest.mock
 from unittest.mock import MagicMock
 
+from garagenode_shm import ReadingsReader
+from garagenode_clock import CaptureWriter
+
 garagenode_receiver_mqtt.DEBUG = 1
 os.environ["MQTT_TOPIC_BASE"] = "/foobar/"
 
@@ -242,13 +248,8 @@ class MyTestCase(unittest.TestCase):
         ## run
         garagenode_receiver_mqtt.handle_stream(stream)
 
-        ## checks
-        assert 1 == garagenode_receiver_mqtt.send_mqtt.call_count
-        call0 = garagenode_receiver_mqtt.send_mqtt.call_args_list[0]
-        msgs = call0[0][0]
-        print(len(msgs), msgs)
-        assert len(msgs) == 0
-        assert type(msgs) is list
+        ## checks, frames without any valid field are dropped
+        assert 0 == garagenode_receiver_mqtt.send_mqtt.call_count
 
     @staticmethod
     def test_handle_stream_wrongdata2():
@@ -378,13 +379,8 @@ class MyTestCase(unittest.TestCase):
         ## run
         garagenode_receiver_mqtt.handle_stream(stream)
 
-        ## checks
-        assert 1 == garagenode_receiver_mqtt.send_mqtt.call_count
-        call0 = garagenode_receiver_mqtt.send_mqtt.call_args_list[0]
-        msgs = call0[0][0]
-        print(len(msgs), msgs)
-        assert len(msgs) == 0
-        assert type(msgs) is list
+        ## checks, frames without any valid field are dropped
+        assert 0 == garagenode_receiver_mqtt.send_mqtt.call_count
 
     @staticmethod
     def test_handle_stream_invalidunicode():
@@ -603,3 +599,580 @@ class MyTestCase(unittest.TestCase):
         assert msgs[0] == {'topic': '/foobar/light', 'payload': 11, 'retain': False}, msgs[0]
         assert msgs[1] == {'topic': '/foobar/humidity', 'payload': 29.90, 'retain': False}, msgs[1]
         assert msgs[2] == {'topic': '/foobar/temperature', 'payload': 27.60, 'retain': False}, msgs[2]
+
+
+class HomeAssistantDiscoveryTests(unittest.TestCase):
+
+    @staticmethod
+    def test_config():
+        ## prepare
+        instance = HomeAssistantDiscovery("/foobar/", "homeassistant")
+        ## action
+        actual = instance.config("temperature")
+        ## check
+        assert actual['topic'] == "homeassistant/sensor/garagenode/temperature/config"
+        assert actual['retain'] is True
+        payload = json.loads(actual['payload'])
+        assert payload['state_topic'] == "/foobar/temperature"
+        assert payload['device_class'] == "temperature"
+        assert payload['unique_id'] == "garagenode_temperature"
+        ## cached
+        assert instance.config("temperature") is actual
+
+    @staticmethod
+    def test_config_switch():
+        instance = HomeAssistantDiscovery("/foobar/")
+        actual = instance.config("switch2")
+        assert actual['topic'] == "homeassistant/binary_sensor/garagenode/switch2/config"
+        assert json.loads(actual['payload'])['payload_on'] == "1"
+
+    @staticmethod
+    def test_config_unknown():
+        instance = HomeAssistantDiscovery("/foobar/")
+        assert instance.config("AAA") is None
+
+    @staticmethod
+    def test_msgs_only_new_fields():
+        ## prepare
+        instance = HomeAssistantDiscovery("/foobar/")
+        envelope = MessageEnvelope().add(Message('light', 11)).add(Message('AAA', 1))
+        ## action & check
+        actual = instance.msgs(envelope)
+        assert [m['topic'] for m in actual] == ["homeassistant/sensor/garagenode/light/config"]
+        ## already announced
+        assert instance.msgs(envelope) == []
+        ## set of seen fields changed
+        envelope.add(Message('switch1', 1, retain=True))
+        actual = instance.msgs(envelope)
+        assert [m['topic'] for m in actual] == ["homeassistant/binary_sensor/garagenode/switch1/config"]
+
+    @staticmethod
+    def test_msgs_refresh():
+        ## prepare
+        instance = HomeAssistantDiscovery("/foobar/", refresh_seconds=60)
+        envelope = MessageEnvelope().add(Message('light', 11)).add(Message('humidity', 29.9))
+        ## action & check
+        assert len(instance.msgs(envelope, now=100.0)) == 2
+        assert instance.msgs(envelope, now=159.0) == []
+        ## e.g., broker restarted in the meantime, all fields are announced again
+        assert len(instance.msgs(envelope, now=160.0)) == 2
+        assert instance.msgs(envelope, now=161.0) == []
+
+    @staticmethod
+    def test_msgs_refresh_disabled():
+        instance = HomeAssistantDiscovery("/foobar/", refresh_seconds=0)
+        envelope = MessageEnvelope().add(Message('light', 11))
+        assert len(instance.msgs(envelope, now=100.0)) == 1
+        assert instance.msgs(envelope, now=1e9) == []
+
+
+class HandleStreamDiscoveryTests(unittest.TestCase):
+
+    def setUp(self):
+        os.environ["MQTT_DISCOVERY_PREFIX"] = "homeassistant"
+
+    def tearDown(self):
+        del os.environ["MQTT_DISCOVERY_PREFIX"]
+
+    @staticmethod
+    def test_handle_stream_discovery():
+        ## prepare
+        stream = io.BytesIO()
+        stream.write(b'......**L:11;H:29.90;T:27.60;S1:1;S2:1$$.......')
+        stream.write(b'**L:444;H:nan;T:nan;S1:1;S2:1$$')
+        stream.seek(0)  ## needed!
+        garagenode_receiver_mqtt.send_mqtt = MagicMock()
+
+        ## run
+        garagenode_receiver_mqtt.handle_stream(stream)
+
+        ## checks
+        assert 2 == garagenode_receiver_mqtt.send_mqtt.call_count
+        msgs = garagenode_receiver_mqtt.send_mqtt.call_args_list[0][0][0]
+        assert len(msgs) == 10
+        assert msgs[0]['topic'] == "homeassistant/sensor/garagenode/light/config"
+        assert msgs[5] == {'topic': '/foobar/light', 'payload': 11, 'retain': False}, msgs[5]
+        ## 2nd time no discovery anymore
+        msgs = garagenode_receiver_mqtt.send_mqtt.call_args_list[1][0][0]
+        assert len(msgs) == 5
+        assert msgs[0] == {'topic': '/foobar/light', 'payload': 444, 'retain': False}, msgs[0]
+
+
+class CombinedPayloadTests(unittest.TestCase):
+
+    @staticmethod
+    def test_combined2msg_json():
+        ## prepare
+        envelope = MessageEnvelope().add(Message('light', 11)).add(Message('humidity', float('nan')))
+        envelope.add(Message('switch1', 1, retain=True))
+        ## action
+        actual = combined2msg(envelope, 'json')
+        ## check
+        assert actual['topic'] == '/foobar/state'
+        assert actual['retain'] is True
+        assert actual['payload'] == '{"light":11,"humidity":null,"switch1":1}'
+
+    @staticmethod
+    def test_combined2msg_struct():
+        ## prepare
+        envelope = MessageEnvelope().add(Message('light', 11)).add(Message('temperature', -1.5))
+        ## action
+        actual = combined2msg(envelope, 'struct')
+        ## check
+        assert actual['retain'] is False
+        assert len(actual['payload']) == COMBINED_STRUCT.size == 13
+        version, light, humidity, temperature, switch1, switch2 = COMBINED_STRUCT.unpack(actual['payload'])
+        assert version == COMBINED_STRUCT_VERSION
+        assert light == 11
+        assert humidity != humidity
+        assert temperature == -1.5
+        assert switch1 == -1
+        assert switch2 == -1
+
+    @staticmethod
+    def test_combined2msg_json_infinite():
+        envelope = MessageEnvelope().add(Message('temperature', float('inf'))).add(Message('humidity', float('-inf')))
+        actual = combined2msg(envelope, 'json')
+        assert actual['payload'] == '{"temperature":null,"humidity":null}'
+        assert json.loads(actual['payload']) == {'temperature': None, 'humidity': None}
+
+    @staticmethod
+    def test_combined2msg_struct_out_of_range():
+        ## prepare, e.g., from a corrupted frame
+        envelope = MessageEnvelope().add(Message('light', 99999)).add(Message('humidity', 1e39))
+        envelope.add(Message('temperature', float('inf'))).add(Message('switch1', 300, retain=True))
+        envelope.add(Message('switch2', 1, retain=True))
+        ## action
+        actual = combined2msg(envelope, 'struct')
+        ## check, packed as missing
+        version, light, humidity, temperature, switch1, switch2 = COMBINED_STRUCT.unpack(actual['payload'])
+        assert light == -1
+        assert humidity != humidity
+        assert temperature != temperature
+        assert switch1 == -1
+        assert switch2 == 1
+
+    @staticmethod
+    def test_combined2msg_invalid():
+        with pytest.raises(ValueError):
+            combined2msg(MessageEnvelope(), 'xml')
+
+
+class HandleStreamCombinedTests(unittest.TestCase):
+
+    def setUp(self):
+        os.environ["MQTT_COMBINED_FORMAT"] = "json"
+
+    def tearDown(self):
+        del os.environ["MQTT_COMBINED_FORMAT"]
+        os.environ.pop("MQTT_COMBINED_ONLY", None)
+
+    @staticmethod
+    def test_handle_stream_combined_alongside():
+        stream = io.BytesIO(b'......**L:11;H:29.90;T:27.60;S1:1;S2:1$$.......')
+        garagenode_receiver_mqtt.send_mqtt = MagicMock()
+        garagenode_receiver_mqtt.handle_stream(stream)
+        msgs = garagenode_receiver_mqtt.send_mqtt.call_args_list[0][0][0]
+        assert len(msgs) == 6
+        assert msgs[0] == {'topic': '/foobar/light', 'payload': 11, 'retain': False}, msgs[0]
+        assert msgs[5]['topic'] == '/foobar/state'
+        assert json.loads(msgs[5]['payload']) == {'light': 11, 'humidity': 29.9, 'temperature': 27.6,
+                                                  'switch1': 1, 'switch2': 1}
+
+    @staticmethod
+    def test_handle_stream_combined_only():
+        os.environ["MQTT_COMBINED_ONLY"] = "true"
+        stream = io.BytesIO(b'......**L:11;H:29.90;T:27.60;S1:1;S2:1$$.......')
+        garagenode_receiver_mqtt.send_mqtt = MagicMock()
+        garagenode_receiver_mqtt.handle_stream(stream)
+        msgs = garagenode_receiver_mqtt.send_mqtt.call_args_list[0][0][0]
+        assert len(msgs) == 1
+        assert msgs[0]['topic'] == '/foobar/state'
+
+    @staticmethod
+    def test_handle_stream_combined_struct_corrupted():
+        os.environ["MQTT_COMBINED_FORMAT"] = "struct"
+        stream = io.BytesIO(b'**L:99999;H:29.90;T:27.60;S1:1;S2:1$$**L:11;H:29.90;T:27.60;S1:0;S2:1$$')
+        garagenode_receiver_mqtt.send_mqtt = MagicMock()
+        garagenode_receiver_mqtt.handle_stream(stream)
+        ## the receiver keeps running after the corrupted frame
+        assert 2 == garagenode_receiver_mqtt.send_mqtt.call_count
+        payload = garagenode_receiver_mqtt.send_mqtt.call_args_list[1][0][0][-1]['payload']
+        assert COMBINED_STRUCT.unpack(payload)[1] == 11
+
+
+class HandleStreamHistoryTests(unittest.TestCase):
+
+    @staticmethod
+    def test_handle_stream_history():
+        ## prepare
+        stream = io.BytesIO(b'......**L:11;H:29.90;T:27.60;S1:1;S2:1$$...**L:12;S1:0$$....')
+        garagenode_receiver_mqtt.send_mqtt = MagicMock()
+        history = ReadingsHistory(10)
+        ## run
+        garagenode_receiver_mqtt.handle_stream(stream, history=history)
+        ## check
+        assert len(history) == 2
+        actual = history.recent()
+        assert actual[0]['temperature'] == 27.6
+        assert actual[1]['light'] == 12
+        assert actual[1]['switch1'] == 0
+        assert 'switch2' not in actual[1]
+
+    @staticmethod
+    def test_handle_stream_out_of_range():
+        ## prepare, values beyond what the history (C long) and TSDB (64 bits) can store
+        stream = io.BytesIO(b'**L:99999999999999999999999;H:29.90;T:inf;S1:7$$**L:12;H:101;T:-1.60;S1:0$$')
+        garagenode_receiver_mqtt.send_mqtt = MagicMock()
+        history = ReadingsHistory(10)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            store = TimeSeriesStore(os.path.join(tmpdir, 'test.gnts'))
+            ## run
+            garagenode_receiver_mqtt.handle_stream(stream, history=history, store=store)
+            store.close()
+            ## check, out-of-range fields are dropped, the rest of the frame is kept
+            actual = history.recent()
+            assert actual[0] == {'timestamp': actual[0]['timestamp'], 'humidity': 29.9}
+            assert actual[1] == {'timestamp': actual[1]['timestamp'], 'light': 12, 'temperature': -1.6,
+                                 'switch1': 0}
+            assert len(list(store.query())) == 2
+
+    @staticmethod
+    def test_parse_frame_out_of_range():
+        link = LinkQualityMonitor()
+        actual = parse_frame(b'L:-5;H:nan;T:-40.5;S1:1$$', link=link)
+        assert 'light' not in actual.keys()
+        ## NaN: sensor reading failed
+        assert actual.get('humidity').value != actual.get('humidity').value
+        assert actual.get('temperature').value == -40.5
+        stats = link.stats()
+        assert stats['field_errors'] == 1
+        assert stats['damaged'] == 1
+
+
+class HandleStreamTruncatedTests(unittest.TestCase):
+
+    @staticmethod
+    def test_handle_stream_eof_within_frame():
+        ## EOF before the end signature must not block
+        stream = io.BytesIO(b'......**L:11;H:29.90;T:27.60;S1:1$$...**L:12;H:2')
+        garagenode_receiver_mqtt.send_mqtt = MagicMock()
+        garagenode_receiver_mqtt.handle_stream(stream)
+        assert 1 == garagenode_receiver_mqtt.send_mqtt.call_count
+
+
+class NodeTableTests(unittest.TestCase):
+
+    @staticmethod
+    def test_get():
+        ## prepare
+        instance = NodeTable()
+        now = 1000.0
+        ## action
+        state = instance.get('n1', now)
+        ## check
+        assert state.node == 'n1'
+        assert state.last_light == -1
+        assert instance.get('n1', now) is state
+        assert len(instance) == 1
+
+    @staticmethod
+    def test_invalid_max_nodes():
+        with pytest.raises(ValueError):
+            NodeTable(max_nodes=0)
+
+    @staticmethod
+    def test_evict_max_nodes():
+        ## prepare
+        instance = NodeTable(max_nodes=2)
+        now = 1000.0
+        instance.get('n1', now)
+        instance.get('n2', now)
+        instance.get('n1', now)  ## n2 is now the least recently seen
+        ## action
+        instance.get('n3', now)
+        ## check
+        assert len(instance) == 2
+        assert 'n1' in instance
+        assert 'n2' not in instance
+        assert 'n3' in instance
+
+    @staticmethod
+    def test_evict_expired():
+        ## prepare
+        instance = NodeTable(expire_seconds=60)
+        now = 1000.0
+        instance.get('n1', now)
+        instance.get(None, now + 30)
+        ## action
+        instance.get('n2', now + 61)
+        ## check
+        assert 'n1' not in instance
+        assert None in instance
+        assert 'n2' in instance
+
+
+class HandleStreamNodesTests(unittest.TestCase):
+
+    @staticmethod
+    def test_handle_stream_nodes():
+        ## prepare
+        stream = io.BytesIO()
+        stream.write(b'......**N:garage2;L:11;H:29.90;T:27.60;S1:1;S2:1$$.......')
+        stream.write(b'......**L:12;S1:0$$.......')
+        stream.write(b'......**N:garage2;L:11;S1:0$$.......')
+        stream.seek(0)  ## needed!
+        garagenode_receiver_mqtt.send_mqtt = MagicMock()
+
+        ## run
+        garagenode_receiver_mqtt.handle_stream(stream)
+
+        ## checks
+        assert 3 == garagenode_receiver_mqtt.send_mqtt.call_count
+        msgs = garagenode_receiver_mqtt.send_mqtt.call_args_list[0][0][0]
+        assert len(msgs) == 5
+        assert msgs[0] == {'topic': '/foobar/garage2/light', 'payload': 11, 'retain': False}, msgs[0]
+        ## node without ID has its own state, i.e., is sent initially
+        msgs = garagenode_receiver_mqtt.send_mqtt.call_args_list[1][0][0]
+        assert msgs[0] == {'topic': '/foobar/light', 'payload': 12, 'retain': False}, msgs[0]
+        ## switch change for garage2
+        msgs = garagenode_receiver_mqtt.send_mqtt.call_args_list[2][0][0]
+        assert msgs[1] == {'topic': '/foobar/garage2/switch1', 'payload': 0, 'retain': True}, msgs[1]
+
+    @staticmethod
+    def test_handle_stream_invalid_node():
+        stream = io.BytesIO(b'......**N:ga/rage;L:11;S1:1$$.......')
+        garagenode_receiver_mqtt.send_mqtt = MagicMock()
+        garagenode_receiver_mqtt.handle_stream(stream)
+        assert 0 == garagenode_receiver_mqtt.send_mqtt.call_count
+
+
+class FrameDeduplicatorTests(unittest.TestCase):
+
+    @staticmethod
+    def test_is_duplicate():
+        ## prepare
+        instance = FrameDeduplicator(window_seconds=2)
+        ## check
+        assert not instance.is_duplicate(b'L:11;S1:1$', now=100)
+        assert instance.is_duplicate(b'L:11;S1:1$', now=101)
+        assert not instance.is_duplicate(b'L:12;S1:1$', now=101)
+        assert instance.passed == 2
+        assert instance.suppressed == 1
+
+    @staticmethod
+    def test_window_expired():
+        instance = FrameDeduplicator(window_seconds=2)
+        assert not instance.is_duplicate(b'L:11;S1:1$', now=100)
+        assert not instance.is_duplicate(b'L:11;S1:1$', now=102.5)
+        assert len(instance) == 1
+
+    @staticmethod
+    def test_max_entries():
+        ## prepare
+        instance = FrameDeduplicator(window_seconds=60, max_entries=2)
+        instance.is_duplicate(b'1', now=100)
+        instance.is_duplicate(b'2', now=100)
+        instance.is_duplicate(b'3', now=100)
+        ## check, oldest entry is gone
+        assert len(instance) == 2
+        assert not instance.is_duplicate(b'1', now=100)
+        assert instance.is_duplicate(b'3', now=100)
+
+    @staticmethod
+    def test_invalid_max_entries():
+        with pytest.raises(ValueError):
+            FrameDeduplicator(max_entries=0)
+
+
+class HandleStreamDedupTests(unittest.TestCase):
+
+    def tearDown(self):
+        os.environ.pop("DEDUP_WINDOW_SECONDS", None)
+
+    @staticmethod
+    def test_handle_stream_duplicate():
+        ## the 2nd (repeated) frame would be a switch change
+        stream = io.BytesIO(b'...**S1:1$$...**S1:0$$...**S1:0$$.....')
+        garagenode_receiver_mqtt.send_mqtt = MagicMock()
+        with unittest.mock.patch.object(garagenode_receiver_mqtt, 'parse_frame',
+                                        wraps=garagenode_receiver_mqtt.parse_frame) as parse_frame:
+            garagenode_receiver_mqtt.handle_stream(stream)
+            ## dropped before decoding
+            assert parse_frame.call_count == 2
+        assert 2 == garagenode_receiver_mqtt.send_mqtt.call_count
+
+    @staticmethod
+    def test_handle_stream_duplicate_disabled():
+        os.environ["DEDUP_WINDOW_SECONDS"] = "0"
+        stream = io.BytesIO(b'...**S1:1$$...**S1:1$$.....')
+        with unittest.mock.patch.object(garagenode_receiver_mqtt, 'parse_frame',
+                                        wraps=garagenode_receiver_mqtt.parse_frame) as parse_frame:
+            garagenode_receiver_mqtt.handle_stream(stream)
+            assert parse_frame.call_count == 2
+
+
+class HandleStreamStoreTests(unittest.TestCase):
+
+    @staticmethod
+    def test_handle_stream_store():
+        ## prepare
+        stream = io.BytesIO(b'......**L:11;H:29.90;T:27.60;S1:1;S2:1$$...**N:n2;L:12;S1:0$$....')
+        garagenode_receiver_mqtt.send_mqtt = MagicMock()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            store = TimeSeriesStore(os.path.join(tmpdir, 'test.gnts'))
+            ## run
+            garagenode_receiver_mqtt.handle_stream(stream, store=store)
+            store.close()
+            ## check
+            actual = list(store.query())
+            assert len(actual) == 2
+            assert actual[0][0] == ''
+            assert actual[0][1][1:] == (11, 29.9, 27.6, 1, 1)
+            assert actual[1][0] == 'n2'
+            assert actual[1][1][1] == 12
+
+
+class HandleStreamBusTests(unittest.TestCase):
+
+    @staticmethod
+    def test_handle_stream_bus():
+        stream = io.BytesIO(b'......**L:11;H:29.90;T:27.60;S1:1;S2:1$$...**N:n2;L:12;S1:0$$....')
+        garagenode_receiver_mqtt.send_mqtt = MagicMock()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            bus = ReadingsWriter(os.path.join(tmpdir, 'garagenode'))
+            garagenode_receiver_mqtt.handle_stream(stream, bus=bus)
+            actual = ReadingsReader(bus.path).read()
+            assert actual['node'] == 'n2'
+            assert actual['light'] == 12
+            assert 'humidity' not in actual
+
+
+class LinkQualityTests(unittest.TestCase):
+
+    def tearDown(self):
+        os.environ.pop("LINK_PUBLISH_SECONDS", None)
+
+    @staticmethod
+    def test_look_in_stream_link():
+        ## garbage, truncated frame, invalid UTF-8, conversion error, invalid node ID
+        stream = io.BytesIO(b'xy\r\n**L:11;H:29*$**L:12;\xff;S1:1$$**L:1x;S1:1$$**N:a b;L:1;$$')
+        link = LinkQualityMonitor()
+        results = []
+        try:
+            while True:
+                results.append(look_in_stream(stream, link=link))
+        except IOError:
+            pass
+        actual = link.stats()
+        assert actual['garbage_bytes'] == 2
+        assert actual['truncated'] == 1
+        assert actual['invalid_utf8'] == 1
+        assert actual['field_errors'] == 1
+        assert actual['unparseable'] == 1
+        assert actual['dropped'] == 1
+        assert actual['damaged'] == 3
+
+    @staticmethod
+    def test_handle_stream_link_garbage_frames():
+        ## line noise and a corrupted node ID field between valid frames
+        stream = io.BytesIO(b'**L:11;H:29.90;T:27.60;S1:1$$**#%&garbage noise$$**zz$$'
+                            b'**X:garage2;L:140;H:29.90;T:27.60;S1:1$$**L:12;H:29.90;T:27.60;S1:0$$')
+        garagenode_receiver_mqtt.send_mqtt = MagicMock()
+        history = ReadingsHistory(10)
+        garagenode_receiver_mqtt.handle_stream(stream, history=history)
+        ## only the valid frames are stored and published
+        assert [entry['light'] for entry in history.recent()] == [11, 12]
+        assert 2 == garagenode_receiver_mqtt.send_mqtt.call_count
+        assert all(msgs for ((msgs,), kwargs) in garagenode_receiver_mqtt.send_mqtt.call_args_list)
+
+    @staticmethod
+    def test_parse_frame_garbage():
+        link = LinkQualityMonitor()
+        for raw in (b'#%&garbage noise$', b'zz$', b'X:garage2;L:140;H:29.90;T:27.60;S1:1$', b'L:a;H:b$'):
+            assert parse_frame(raw, link=link) is None, raw
+        assert parse_frame(b'L:11;H:29.90;T:27.60;S1:1$', link=link) is not None
+        link.frame()
+        actual = link.stats()
+        assert actual['unparseable'] == 4
+        assert actual['dropped'] == 4
+        assert actual['frames'] == 1
+        assert actual['quality'] == 0.2
+
+    @staticmethod
+    def test_handle_stream_link_publish():
+        os.environ["LINK_PUBLISH_SECONDS"] = "0.000001"
+        stream = io.BytesIO(b'...**L:11;S1:1$$...')
+        garagenode_receiver_mqtt.send_mqtt = MagicMock()
+        garagenode_receiver_mqtt.handle_stream(stream)
+        topics = [msg['topic'] for call in garagenode_receiver_mqtt.send_mqtt.call_args_list for msg in call.args[0]]
+        assert '/foobar/link/quality' in topics
+        assert '/foobar/link/jitter' in topics
+        assert '/foobar/light' in topics
+
+    @staticmethod
+    def test_link2msgs():
+        stats = LinkQualityMonitor().stats(now=0)
+        actual = link2msgs(stats)
+        assert actual[0] == {'topic': '/foobar/link/quality', 'payload': None, 'retain': False}
+        assert json.loads(actual[2]['payload'])['frames'] == 0
+
+
+class HandleStreamSelectorTests(unittest.TestCase):
+
+    def tearDown(self):
+        os.environ.pop("LINK_PUBLISH_SECONDS", None)
+
+    @staticmethod
+    def test_handle_stream_timers():
+        ## link stats are published on a timer, also while no data arrives
+        os.environ["LINK_PUBLISH_SECONDS"] = "0.01"
+        r, w = os.pipe()
+        stream = SelectorStream(r)
+        garagenode_receiver_mqtt.send_mqtt = MagicMock()
+        os.write(w, b'...**L:11;S1:1$$...')
+        threading.Timer(0.2, os.close, args=(w,)).start()
+        garagenode_receiver_mqtt.handle_stream(stream)
+        stream.close()
+        os.close(r)
+        topics = [msg['topic'] for call in garagenode_receiver_mqtt.send_mqtt.call_args_list for msg in call.args[0]]
+        assert topics.count('/foobar/light') == 1
+        assert topics.count('/foobar/link/quality') >= 5
+
+
+class HandleStreamStagesTests(unittest.TestCase):
+
+    @staticmethod
+    def test_handle_stream_stages():
+        stream = io.BytesIO(b'...**L:11;S1:1$$...**L:12;S1:0$$...')
+        garagenode_receiver_mqtt.send_mqtt = MagicMock()
+        stages = StageTimers()
+        garagenode_receiver_mqtt.handle_stream(stream, stages=stages)
+        actual = stages.stats()
+        assert actual['framing']['count'] == 2
+        assert actual['parsing']['count'] == 2
+        assert actual['publishing']['count'] == 2
+
+
+class HandleStreamReplayTests(unittest.TestCase):
+
+    @staticmethod
+    def test_handle_stream_replay():
+        ## a frame every 5 minutes, unchanged values, i.e., only periodic sends (MQTT_TIME_PERIOD_SECONDS)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'capture.gncp')
+            with CaptureWriter(path) as writer:
+                for k in range(10):
+                    writer.write(b'...**L:11;S1:1$$...', timestamp=1.6e9 + 300 * k)
+            clock = ReplayClock()
+            stream = ReplayStream(path, clock)
+            history = ReadingsHistory(10)
+            sent_at = []
+            garagenode_receiver_mqtt.send_mqtt = MagicMock(side_effect=lambda msgs: sent_at.append(clock.time()))
+            ## run
+            garagenode_receiver_mqtt.handle_stream(stream, history=history, clock=clock)
+            stream.close()
+        ## check, > 600 seconds since the last send
+        assert [t - 1.6e9 for t in sent_at] == [0, 900, 1800, 2700]
+        ## readings are stored with the capture time
+        assert [entry['timestamp'] - 1.6e9 for entry in history.recent()] == [300 * k for k in range(10)]
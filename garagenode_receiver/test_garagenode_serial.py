@@ -0,0 +1,180 @@
+#!pytest
+
+import os
+import queue
+import threading
+import time
+import unittest
+
+import pytest
+import serial
+
+from garagenode_serial import *
+
+
+class FakePort(object):
+    """Blocking serial port stand-in, fed with chunks (None for EOF, exceptions are raised)."""
+
+    def __init__(self):
+        self._chunks = queue.Queue()
+        self._pending = b''
+
+    def feed(self, chunk):
+        self._chunks.put(chunk)
+
+    @property
+    def in_waiting(self):
+        return len(self._pending)
+
+    def read(self, size=1):
+        if not self._pending:
+            chunk = self._chunks.get()
+            if chunk is None:
+                return b''
+            if isinstance(chunk, Exception):
+                raise chunk
+            self._pending = chunk
+        data = self._pending[:size]
+        self._pending = self._pending[size:]
+        return data
+
+
+def _wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timeout"
+        time.sleep(0.001)
+
+
+class SerialReaderThreadTests(unittest.TestCase):
+
+    @staticmethod
+    def test_invalid_size():
+        with pytest.raises(ValueError):
+            SerialReaderThread(FakePort(), size=0)
+
+    @staticmethod
+    def test_read():
+        ## prepare
+        port = FakePort()
+        instance = SerialReaderThread(port, size=16).start()
+        ## action
+        port.feed(b'**L:11;')
+        port.feed(b'S1:1$$')
+        _wait_until(lambda: instance.bytes_received == 13)
+        ## check
+        assert len(instance) == 13
+        assert instance.read(1) == b'*'
+        assert instance.read(100) == b'*L:11;S1:1$$'
+        assert len(instance) == 0
+
+    @staticmethod
+    def test_wraparound():
+        ## prepare
+        port = FakePort()
+        instance = SerialReaderThread(port, size=8).start()
+        ## action & check
+        for k in range(10):
+            data = bytes([k]) * 5
+            port.feed(data)
+            assert instance.read(3) + instance.read(3) == data
+        assert instance.overflows == 0
+
+    @staticmethod
+    def test_overflow():
+        ## prepare, consumer does not read
+        port = FakePort()
+        instance = SerialReaderThread(port, size=8).start()
+        ## action
+        port.feed(b'0123456789ABCDEF')
+        _wait_until(lambda: instance.bytes_received == 16)
+        ## check, the newest bytes are dropped
+        assert instance.overflows == 1
+        assert instance.overflow_bytes == 8
+        assert instance.read(100) == b'01234567'
+
+    @staticmethod
+    def test_eof():
+        port = FakePort()
+        instance = SerialReaderThread(port).start()
+        port.feed(b'ab')
+        port.feed(None)
+        assert instance.read(1) == b'a'
+        assert instance.read(1) == b'b'
+        assert instance.read(1) == b''
+
+    @staticmethod
+    def test_error():
+        ## the reader thread's exception is raised in the consumer
+        port = FakePort()
+        instance = SerialReaderThread(port).start()
+        port.feed(serial.SerialException("device disconnected"))
+        with pytest.raises(serial.SerialException):
+            instance.read(1)
+
+    @staticmethod
+    def test_stop():
+        port = FakePort()
+        instance = SerialReaderThread(port).start()
+        port.feed(None)
+        instance.stop()
+        assert instance.read(1) == b''
+
+
+class SelectorStreamTests(unittest.TestCase):
+
+    def setUp(self):
+        self.r, self.w = os.pipe()
+        self.instance = SelectorStream(self.r)
+
+    def tearDown(self):
+        self.instance.close()
+        os.close(self.r)
+        try:
+            os.close(self.w)
+        except OSError:
+            pass
+
+    def test_read(self):
+        os.write(self.w, b'**L:11;S1:1$$')
+        assert self.instance.read(1) == b'*'
+        assert self.instance.read(100) == b'*L:11;S1:1$$'
+        ## everything available was read in one call
+        assert self.instance.wakeups == 1
+        assert self.instance.bytes_received == 13
+
+    def test_eof(self):
+        os.write(self.w, b'ab')
+        os.close(self.w)
+        assert self.instance.read(1) == b'a'
+        assert self.instance.read(1) == b'b'
+        assert self.instance.read(1) == b''
+
+    def test_timer(self):
+        ## prepare
+        calls = []
+        self.instance.add_timer(0.01, lambda: calls.append(time.monotonic()))
+        threading.Timer(0.1, os.write, args=(self.w, b'x')).start()
+        ## action, timers run while waiting for data
+        assert self.instance.read(1) == b'x'
+        ## check
+        assert len(calls) >= 3
+        assert self.instance.timer_calls == len(calls)
+
+    def test_timer_exception(self):
+        def fail():
+            raise RuntimeError("boom")
+        self.instance.add_timer(0.01, fail)
+        threading.Timer(0.05, os.write, args=(self.w, b'x')).start()
+        assert self.instance.read(1) == b'x'
+        assert self.instance.timer_calls >= 1
+
+    def test_stop(self):
+        threading.Timer(0.05, self.instance.stop).start()
+        assert self.instance.read(1) == b''
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            self.instance.add_timer(0, lambda: None)
+        with pytest.raises(ValueError):
+            SelectorStream(self.r, chunk_size=0)
@@ -0,0 +1,89 @@
+#!pytest
+
+import math
+import os
+import tempfile
+import threading
+import unittest
+
+import pytest
+
+from garagenode_shm import *
+from garagenode_receiver_mqtt import Message, MessageEnvelope
+
+
+class ReadingsBusTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'garagenode')
+        self.writer = ReadingsWriter(self.path)
+
+    def tearDown(self):
+        self.writer.close()
+        self.tmpdir.cleanup()
+
+    def test_empty(self):
+        reader = ReadingsReader(self.path)
+        assert reader.read() is None
+        assert not reader.changed()
+
+    def test_write_read(self):
+        ## prepare
+        reader = ReadingsReader(self.path)
+        envelope = MessageEnvelope(node='n2').add(Message('light', 11)).add(Message('temperature', -1.5))
+        envelope.add(Message('switch1', 1, retain=True))
+        ## action
+        self.writer.write(envelope, timestamp=1000.5)
+        ## check
+        assert reader.changed()
+        actual = reader.read()
+        assert actual == {'seq': 2, 'timestamp': 1000.5, 'node': 'n2', 'light': 11, 'temperature': -1.5,
+                          'switch1': 1}
+        assert not reader.changed()
+        ## latest reading only
+        self.writer.write(MessageEnvelope().add(Message('humidity', 55.5)), timestamp=1001)
+        assert reader.read() == {'seq': 4, 'timestamp': 1001, 'node': None, 'humidity': 55.5}
+
+    def test_invalid_file(self):
+        path = os.path.join(self.tmpdir.name, 'foobar')
+        with open(path, 'wb') as fp:
+            fp.write(b'\x00' * SIZE)
+        with pytest.raises(ValueError):
+            ReadingsReader(path)
+
+    def test_corrupted(self):
+        ## prepare
+        reader = ReadingsReader(self.path)
+        self.writer.write(MessageEnvelope().add(Message('light', 11)), timestamp=1000)
+        ## action, e.g. a reading seen with stale bytes despite unchanged sequence numbers
+        self.writer._mm[HEADER.size + READING.size - 1] ^= 0x01
+        ## check
+        with pytest.raises(TimeoutError):
+            reader.read(retries=3)
+        ## the next write is consistent again
+        self.writer.write(MessageEnvelope().add(Message('light', 12)), timestamp=1001)
+        assert reader.read()['light'] == 12
+
+    def test_concurrent_consistent(self):
+        ## a reader never sees a half-written reading
+        reader = ReadingsReader(self.path)
+        stop = threading.Event()
+
+        def writer_loop():
+            i = 0
+            while not stop.is_set():
+                i += 1
+                self.writer.write(MessageEnvelope().add(Message('light', i)).add(Message('humidity', float(i))),
+                                  timestamp=i)
+
+        thread = threading.Thread(target=writer_loop)
+        thread.start()
+        try:
+            for _ in range(5000):
+                actual = reader.read()
+                if actual is not None:
+                    assert actual['light'] == actual['humidity'] == actual['timestamp']
+        finally:
+            stop.set()
+            thread.join()
@@ -0,0 +1,296 @@
+#!pytest
+
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+import pytest
+
+from garagenode_tsdb import *
+from garagenode_tsdb import _read_rows
+from garagenode_receiver_mqtt import Message, MessageEnvelope
+
+
+def _rows(count, start=1600000000.0, seed=1):
+    rng = random.Random(seed)
+    rows = []
+    t = start
+    light = 500
+    humidity = 50.0
+    temperature = 20.0
+    for i in range(count):
+        t = round(t + 30 + rng.randint(-50, 50) / 1000, 3)
+        light = max(0, light + rng.randint(-5, 5))
+        humidity = round(humidity + rng.uniform(-0.3, 0.3), 1)
+        temperature = round(temperature + rng.uniform(-0.1, 0.1), 1)
+        rows.append((t, light, humidity if i % 100 else math.nan, temperature, int(rng.random() < 0.01), -1))
+    return rows
+
+
+def _same(row1, row2):
+    return all(a == b or (a != a and b != b) for a, b in zip(row1, row2))
+
+
+class EncodingTests(unittest.TestCase):
+
+    @staticmethod
+    def test_roundtrip():
+        ## prepare
+        rows = _rows(1000)
+        ## action
+        t_first, t_last, payload = encode_block(rows)
+        actual = decode_block(t_first, len(rows), payload)
+        ## check
+        assert t_first == round(rows[0][0] * 1000)
+        assert t_last == round(rows[-1][0] * 1000)
+        assert len(actual) == len(rows)
+        assert all(_same(a, b) for a, b in zip(rows, actual))
+        ## compressed, raw would be at least 8 + 4 + 2 * 8 + 2 bytes per row
+        assert len(payload) < 16 * len(rows)
+
+    @staticmethod
+    def test_roundtrip_extremes():
+        rows = [(0.0, 0, 0.0, -0.0, 0, 1),
+                (1e9, 2 ** 40, math.inf, 1e-300, -1, -1),
+                (1e9 + 0.001, -5, math.nan, 5.5, 1, 0),
+                (1e9 + 0.001, -5, math.nan, 5.5, 1, 0)]
+        t_first, t_last, payload = encode_block(rows)
+        actual = decode_block(t_first, len(rows), payload)
+        assert all(_same(a, b) for a, b in zip(rows, actual))
+
+    @staticmethod
+    def test_truncated_payload():
+        rows = _rows(10)
+        t_first, t_last, payload = encode_block(rows)
+        with pytest.raises(ValueError):
+            decode_block(t_first, len(rows), payload[:5])
+
+
+class TimeSeriesStoreTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'tsdb')
+        ## segment of the readings at 1970-01-01
+        self.segment = os.path.join(self.path, '19700101.gnts')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_append_batched(self):
+        ## prepare
+        instance = TimeSeriesStore(self.path, block_samples=4, flush_seconds=3600)
+        envelope = MessageEnvelope().add(Message('light', 11)).add(Message('temperature', 20.5))
+        ## action & check, nothing written before a block is full
+        for i in range(3):
+            instance.append(envelope, timestamp=1000 + i)
+        assert instance.blocks() == []
+        instance.append(envelope, timestamp=1003)
+        assert len(instance.blocks()) == 1
+        ## check
+        rows = [row for node, row in instance.query()]
+        assert len(rows) == 4
+        assert _same(rows[0], (1000, 11, math.nan, 20.5, -1, -1))
+
+    def test_close_flushes(self):
+        instance = TimeSeriesStore(self.path, block_samples=100)
+        instance.append(MessageEnvelope().add(Message('light', 11)), timestamp=1000)
+        instance.close()
+        assert len(list(TimeSeriesStore(self.path).query())) == 1
+
+    def test_query_range_and_node(self):
+        ## prepare
+        instance = TimeSeriesStore(self.path, block_samples=10)
+        for i in range(50):
+            instance.append(MessageEnvelope().add(Message('light', i)), timestamp=1000 + i)
+            instance.append(MessageEnvelope(node='n2').add(Message('light', 100 + i)), timestamp=1000 + i)
+        instance.flush()
+        ## check
+        actual = list(instance.query(1010, 1012, node=''))
+        assert [row[1] for node, row in actual] == [10, 11, 12]
+        actual = list(instance.query(1048, node='n2'))
+        assert [node for node, row in actual] == ['n2', 'n2']
+        assert [row[1] for node, row in actual] == [148, 149]
+        assert len(list(instance.query())) == 100
+
+    def test_not_a_directory(self):
+        with open(self.path, 'wb'):
+            pass
+        with pytest.raises(ValueError):
+            TimeSeriesStore(self.path)
+
+    def test_segments(self):
+        instance = TimeSeriesStore(self.path)
+        instance.append(MessageEnvelope().add(Message('light', 1)), timestamp=86399)
+        instance.append(MessageEnvelope(node='n2').add(Message('light', 2)), timestamp=86400)
+        instance.flush()
+        assert instance.segments() == ['19700101.gnts', '19700102.gnts']
+        assert [block.segment for block in instance.blocks()] == ['19700101.gnts', '19700102.gnts']
+        assert [row[1] for node, row in instance.query(86400)] == [2]
+
+    def _hourly(self, instance, start: int, count: int):
+        ## one small block per reading
+        for i in range(start, start + count):
+            instance.append(MessageEnvelope().add(Message('light', i)), timestamp=1000 + i * 3600)
+            instance.flush()
+
+    def test_append_never_compacts(self):
+        instance = TimeSeriesStore(self.path, block_samples=10, compact_seconds=0)
+        self._hourly(instance, 0, 50)
+        assert len(instance.blocks()) == 50
+
+    def test_compact(self):
+        ## prepare, many small blocks over 3 days
+        instance = TimeSeriesStore(self.path, block_samples=10, retention_days=1)
+        self._hourly(instance, 0, 50)
+        assert instance.segments() == ['19700101.gnts', '19700102.gnts', '19700103.gnts']
+        ## action, 1st day expired, 2nd day is over, 3rd day is still being appended to
+        instance.compact(now=2 * 86400 + 100)
+        ## check
+        assert instance.segments() == ['19700102.gnts', '19700103.gnts']
+        assert [block.count for block in instance.blocks()] == [10, 10, 4, 1, 1]
+        assert [row[1] for node, row in instance.query()] == list(range(24, 50))
+
+    def test_compact_once(self):
+        ## prepare
+        instance = TimeSeriesStore(self.path, block_samples=10)
+        self._hourly(instance, 0, 30)
+        instance.compact(now=2 * 86400)
+        inode = os.stat(self.segment).st_ino
+        ## action & check, a compacted segment is not rewritten again
+        instance.compact(now=2 * 86400)
+        assert os.stat(self.segment).st_ino == inode
+        assert TimeSeriesStore(self.path, block_samples=10).compact(now=2 * 86400) is None
+        assert os.stat(self.segment).st_ino == inode
+        ## unless a (late) reading is appended to it
+        instance.append(MessageEnvelope().add(Message('light', 99)), timestamp=2000)
+        instance.flush()
+        instance.compact(now=2 * 86400)
+        assert os.stat(self.segment).st_ino != inode
+        assert [block.count for block in instance.blocks()] == [10, 10, 5, 6]
+
+    def test_background_compaction(self):
+        ## retention covers the 1970 readings at the real time
+        instance = TimeSeriesStore(self.path, block_samples=10, retention_days=365 * 100, compact_seconds=0.01)
+        self._hourly(instance, 0, 30)
+        instance.start()
+        try:
+            for _ in range(200):
+                if len(instance.blocks()) == 4:
+                    break
+                time.sleep(0.01)
+        finally:
+            instance.close()
+        assert [block.count for block in instance.blocks()] == [10, 10, 4, 6]
+        assert [row[1] for node, row in instance.query()] == list(range(0, 30))
+
+    def test_repair_truncated(self):
+        ## prepare
+        instance = TimeSeriesStore(self.path, block_samples=5)
+        for i in range(10):
+            instance.append(MessageEnvelope().add(Message('light', i)), timestamp=1000 + i)
+        size = os.path.getsize(self.segment)
+        ## simulate power loss while writing, and while compacting
+        with open(self.segment, 'ab') as fp:
+            fp.write(b'GNTS\x02\x00')
+        with open(self.segment + '.tmp', 'wb') as fp:
+            fp.write(b'GNTS')
+        ## action
+        instance = TimeSeriesStore(self.path)
+        ## check
+        assert os.path.getsize(self.segment) == size
+        assert not os.path.exists(self.segment + '.tmp')
+        assert len(list(instance.query())) == 10
+
+    def _corrupt_middle_block(self, offset_in_block: int, xor: int = 0x01):
+        ## 3 blocks of 5 readings, flip bits in the 2nd block
+        instance = TimeSeriesStore(self.path, block_samples=5)
+        for i in range(15):
+            instance.append(MessageEnvelope().add(Message('light', i)), timestamp=1000 + i)
+        size = os.path.getsize(self.segment)
+        with open(self.segment, 'r+b') as fp:
+            fp.seek(instance.blocks()[1].offset + offset_in_block)
+            value = fp.read(1)[0]
+            fp.seek(-1, os.SEEK_CUR)
+            fp.write(bytes([value ^ xor]))
+        return size
+
+    def test_repair_corrupted_magic(self):
+        size = self._corrupt_middle_block(0)
+        ## action
+        instance = TimeSeriesStore(self.path)
+        ## check, the following blocks are kept
+        assert os.path.getsize(self.segment) == size
+        assert [row[1] for node, row in instance.query()] == [0, 1, 2, 3, 4, 10, 11, 12, 13, 14]
+        ## compaction drops the corrupted block
+        instance.compact(now=86400)
+        assert [block.count for block in instance.blocks()] == [10]
+
+    def test_repair_corrupted_length(self):
+        ## payload length (bytes 24..27 of the header), points into the 3rd block
+        size = self._corrupt_middle_block(24, xor=0x04)
+        instance = TimeSeriesStore(self.path)
+        assert os.path.getsize(self.segment) == size
+        assert [row[1] for node, row in instance.query()] == [0, 1, 2, 3, 4, 10, 11, 12, 13, 14]
+
+    def test_repair_corrupted_length_beyond_eof(self):
+        size = self._corrupt_middle_block(27, xor=0x80)
+        instance = TimeSeriesStore(self.path)
+        assert os.path.getsize(self.segment) == size
+        assert [row[1] for node, row in instance.query()] == [0, 1, 2, 3, 4, 10, 11, 12, 13, 14]
+
+    def test_repair_corrupted_count(self):
+        ## sample count (bytes 6..7 of the header), decoding would run out of data
+        self._corrupt_middle_block(6, xor=0x10)
+        instance = TimeSeriesStore(self.path)
+        assert [row[1] for node, row in instance.query()] == [0, 1, 2, 3, 4, 10, 11, 12, 13, 14]
+        instance.compact(now=86400)
+        assert [row[1] for node, row in instance.query()] == [0, 1, 2, 3, 4, 10, 11, 12, 13, 14]
+
+    def test_repair_corrupted_timestamp(self):
+        ## first timestamp (bytes 8..15 of the header), would shift all timestamps of the block
+        self._corrupt_middle_block(12, xor=0x04)
+        instance = TimeSeriesStore(self.path)
+        actual = [row for node, row in instance.query()]
+        assert [row[0] for row in actual] == [1000 + i for i in (0, 1, 2, 3, 4, 10, 11, 12, 13, 14)]
+        instance.compact(now=86400)
+        assert [row[0] for node, row in instance.query()] == [1000 + i for i in (0, 1, 2, 3, 4, 10, 11, 12, 13, 14)]
+
+    def test_read_rows_undecodable(self):
+        instance = TimeSeriesStore(self.path, block_samples=5)
+        for i in range(5):
+            instance.append(MessageEnvelope().add(Message('light', i)), timestamp=1000 + i)
+        block = instance.blocks()[0]
+        ## more samples than the payload holds
+        block.count = 100
+        with open(self.segment, 'rb') as fp:
+            assert _read_rows(fp, block) == []
+
+    def test_unsupported_version(self):
+        os.makedirs(self.path)
+        with open(self.segment, 'wb') as fp:
+            fp.write(BLOCK_HEADER.pack(MAGIC, VERSION - 1, 0, 0, 0, 0, 0, 0))
+        with pytest.raises(ValueError):
+            TimeSeriesStore(self.path)
+        ## untouched
+        assert os.path.getsize(self.segment) == BLOCK_HEADER.size
+
+    def test_repair_corrupted_payload(self):
+        size = self._corrupt_middle_block(BLOCK_HEADER.size + 2)
+        instance = TimeSeriesStore(self.path)
+        assert os.path.getsize(self.segment) == size
+        assert [row[1] for node, row in instance.query()] == [0, 1, 2, 3, 4, 10, 11, 12, 13, 14]
+
+    def test_cli_query(self):
+        instance = TimeSeriesStore(self.path)
+        instance.append(MessageEnvelope().add(Message('light', 11)).add(Message('switch1', 1)), timestamp=1000)
+        instance.close()
+        output = subprocess.run([sys.executable, 'garagenode_tsdb.py', 'query', '--from=999', self.path],
+                                capture_output=True, text=True, check=True).stdout
+        assert output.splitlines() == ["node,timestamp,light,humidity,temperature,switch1,switch2",
+                                       ",1000.0,11,,,1,"]
@@ -0,0 +1,38 @@
+#!pytest
+
+import unittest
+
+from testing.script_runner import run_json_script
+
+
+def run_hil_harness(*args):
+    return run_json_script('hil_harness.py', *args)
+
+
+class HilHarnessTests(unittest.TestCase):
+
+    @staticmethod
+    def test_end_to_end():
+        returncode, report = run_hil_harness('--frames=20', '--rate=50', '--baud=115200')
+        assert returncode == 0
+        assert report['frames_received'] == 20
+        assert report['frames_lost'] == 0
+        assert report['messages_published'] == 20 * 5
+        assert report['latency_seconds']['count'] == 20
+        assert report['latency_seconds']['min'] > 0
+        assert report['throughput_frames_per_second'] > 0
+
+    @staticmethod
+    def test_end_to_end_noise():
+        returncode, report = run_hil_harness('--frames=20', '--rate=0', '--baud=0', '--noise=0.5', '--seed=3')
+        assert returncode == 0
+        assert report['frames_lost'] == 0
+        assert report['frames_corrupted'] > 0
+        assert report['frames_received'] + report['frames_corrupted'] <= 20
+
+    @staticmethod
+    def test_end_to_end_reader_thread():
+        returncode, report = run_hil_harness('--frames=20', '--rate=0', '--baud=0', '--reader-thread')
+        assert returncode == 0
+        assert report['frames_received'] == 20
+        assert report['serial_overflow_bytes'] == 0
@@ -0,0 +1,43 @@
+#!pytest
+
+import unittest
+
+from testing.script_runner import run_json_script
+
+
+def run_loadgen(*args):
+    return run_json_script('loadgen.py', *args)
+
+
+class LoadgenTests(unittest.TestCase):
+
+    @staticmethod
+    def test_ramp():
+        returncode, report = run_loadgen('--nodes=50', '--start-rate=50', '--steps=2', '--step-seconds=0.5',
+                                         '--corruption=0', '--keep-going')
+        assert returncode == 0
+        assert len(report['steps']) == 2
+        assert report['steps'][1]['offered_fps'] == 100
+        assert report['frames'] > 0
+        ## the first frame of every node is published
+        assert report['broker_messages'] >= 5 * min(report['frames'], 50)
+        assert report['steps'][0]['publish_latency_seconds']['count'] > 0
+
+    @staticmethod
+    def test_pty_corruption():
+        returncode, report = run_loadgen('--nodes=10', '--start-rate=20', '--steps=1', '--step-seconds=0.5',
+                                         '--corruption=0.5', '--transport=pty')
+        assert returncode == 0
+        assert report['frames'] > 0
+        assert report['broker_messages'] > 0
+
+    @staticmethod
+    def test_value_model():
+        returncode, report = run_loadgen('--nodes=10', '--start-rate=20', '--steps=1', '--step-seconds=0.5',
+                                         '--values=uniform', '--light-sigma=5', '--humidity-range=40,60',
+                                         '--temperature-range=-10,0')
+        assert returncode == 0
+        assert report['frames'] > 0
+        assert report['parameters']['values'] == {'model': 'uniform', 'light_sigma': 5, 'humidity_sigma': 0.5,
+                                                  'temperature_sigma': 0.1, 'humidity_range': [40, 60],
+                                                  'temperature_range': [-10, 0]}
@@ -0,0 +1,33 @@
+#!pytest
+
+import unittest
+
+from testing.script_runner import run_json_script
+
+
+def run_soak_test(*args):
+    return run_json_script('soak_test.py', *args, timeout=120)
+
+
+class SoakTests(unittest.TestCase):
+
+    @staticmethod
+    def test_short_soak():
+        returncode, report = run_soak_test('--frames=2000', '--samples=4', '--warmup=0.25')
+        assert returncode == 0, report['failures']
+        assert report['passed']
+        assert report['frames'] == 2000
+        assert [entry['frames'] for entry in report['samples']] == [500, 1000, 1500, 2000]
+        assert report['baseline_frames'] == 500
+        ## 10 nodes, 30 s each, i.e., 3 s replay clock per frame
+        assert abs(report['samples'][-1]['clock_days'] - 2000 * 3 / 86400) < 1e-6
+        assert report['samples'][-1]['publishes'] > 0
+        assert report['samples'][-1]['top_allocators']
+        assert set(report['growth']) >= {'rss_kb', 'objects', 'heap_kb'}
+
+    @staticmethod
+    def test_threshold_exceeded():
+        returncode, report = run_soak_test('--frames=1000', '--samples=2', '--warmup=0.5', '--max-object-growth=-1000000')
+        assert returncode == 1
+        assert not report['passed']
+        assert report['failures']
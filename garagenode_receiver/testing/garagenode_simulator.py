@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""garagenode_simulator.py - Simulated GarageNode sender for testing.
+
+Generates `**L:...;H:...;T:...;S1:x;S2:x$$` frames like `garagenode_sender.ino` and
+writes them to a file descriptor (e.g., pty master) at a given frame rate, with
+optional line noise and UART baud rate pacing.
+"""
+##
+## LICENSE:
+##
+## Copyright (C) 2019-2022 Alexander Streicher
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU Affero General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Affero General Public License for more details.
+##
+## You should have received a copy of the GNU Affero General Public License
+## along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+import os
+import random
+import time
+
+## UART 8N1: start bit + 8 data bits + stop bit
+BITS_PER_BYTE = 10
+
+
+def make_frame(light: int, humidity: float, temperature: float, switch1: int, switch2: int = None,
+               node: str = None):
+    """
+    Build a sender frame, formatted like the Arduino `print()` (2 decimals).
+    :param node: optional node ID (multiple senders)
+    :return: frame bytes
+    """
+    frame = "**N:%s;" % node if node else "**"
+    frame += "L:%d;H:%.2f;T:%.2f;S1:%d;" % (light, humidity, temperature, switch1)
+    if switch2 is not None:
+        frame += "S2:%d" % switch2
+    return (frame + "$$").encode('ascii')
+
+
+def add_noise(frame: bytes, rng: random.Random, noise: float):
+    """
+    Simulate power line noise.
+    With probability `noise` garbage bytes are prepended and a byte of the frame is flipped.
+    :param frame: frame bytes
+    :param rng: random number generator
+    :param noise: noise level 0..1
+    :return: (noisy bytes, True if the frame itself got corrupted)
+    """
+    if noise <= 0 or rng.random() >= noise:
+        return frame, False
+    garbage = bytes(rng.randrange(256) for _ in range(rng.randrange(1, 8)))
+    data = bytearray(frame)
+    i = rng.randrange(len(data))
+    data[i] ^= 1 << rng.randrange(8)
+    return garbage + bytes(data), True
+
+
+class SimulatedSender(object):
+    """
+    Simulated GarageNode sender writing to a file descriptor.
+    The light value carries the frame sequence number so the receiving end
+    can match published messages to sent frames.
+    """
+
+    def __init__(self, fd: int, rate: float = 1.0, baud: int = 9600, noise: float = 0.0,
+                 chunk_size: int = 16, seed: int = None):
+        """
+        :param fd: output file descriptor, e.g., pty master
+        :param rate: frames per second (0 for as fast as baud rate allows)
+        :param baud: UART baud rate to pace the bytes (0 for no pacing)
+        :param noise: noise level 0..1, see `add_noise()`
+        :param chunk_size: max. bytes per write, frames are split into random chunks (partial reads)
+        :param seed: random seed for reproducible runs
+        """
+        self.fd = fd
+        self.rate = rate
+        self.baud = baud
+        self.noise = noise
+        self.chunk_size = chunk_size
+        self.rng = random.Random(seed)
+        ## sequence number -> send time (time.perf_counter)
+        self.sent = {}
+        ## sequence numbers of frames corrupted by noise
+        self.corrupted = set()
+        self.bytes_written = 0
+
+    def _write(self, data: bytes, mark: int):
+        """
+        Write data in random chunks, paced by baud rate.
+        :param mark: index of the byte to take the time for
+        :return: time (time.perf_counter) the byte at index `mark` has been written
+        """
+        pos = 0
+        written = None
+        while pos < len(data):
+            n = self.rng.randint(1, self.chunk_size)
+            chunk = data[pos:pos + n]
+            os.write(self.fd, chunk)
+            if written is None and pos + len(chunk) > mark:
+                written = time.perf_counter()
+            pos += len(chunk)
+            if self.baud:
+                time.sleep(len(chunk) * BITS_PER_BYTE / self.baud)
+        self.bytes_written += len(data)
+        return written
+
+    def run(self, count: int):
+        """
+        Send `count` frames with sequence numbers 0..count-1.
+        """
+        interval = 1.0 / self.rate if self.rate else 0.0
+        next_time = time.perf_counter()
+        for seq in range(count):
+            frame = make_frame(seq,
+                               round(self.rng.uniform(30, 90), 2),
+                               round(self.rng.uniform(-10, 35), 2),
+                               self.rng.randint(0, 1),
+                               self.rng.randint(0, 1))
+            data, corrupted = add_noise(frame, self.rng, self.noise)
+            if corrupted:
+                self.corrupted.add(seq)
+            ## the receiver completes a frame with the first '$' of the end signature '$$'
+            self.sent[seq] = self._write(data, len(data) - 2)
+            next_time += interval
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
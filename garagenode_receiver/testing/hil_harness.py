@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""hil_harness.py - Hardware-in-the-loop style end-to-end test harness.
+
+Creates a pseudo-terminal pair, lets a simulated GarageNode sender write frames
+to the master side and runs the real receiver (`handle_stream` on a `serial.Serial`
+opened on the slave side) against a local stand-in MQTT broker.
+Reports sustained throughput and end-to-end latency (end of frame written
+until the MQTT PUBLISH arrives at the broker).
+
+Usage:
+  hil_harness.py [options]
+  hil_harness.py -h | --help
+
+Options:
+  -h --help          Show this screen.
+  -n --frames=N      Number of frames to send [default: 100].
+  -r --rate=FPS      Frames per second, 0 for as fast as possible [default: 10].
+  -b --baud=BAUD     Baud rate pacing, 0 for no pacing [default: 9600].
+  --noise=LEVEL      Noise level 0..1, fraction of corrupted frames [default: 0].
+  --seed=SEED        Random seed [default: 1].
+  --timeout=SEC      Max. seconds to wait for outstanding messages [default: 10].
+  --reader-thread    Read the serial port via SerialReaderThread (like the service does).
+  --json             Print report as JSON.
+  -v --verbose       Be more verbose.
+"""
+##
+## LICENSE:
+##
+## Copyright (C) 2019-2022 Alexander Streicher
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU Affero General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Affero General Public License for more details.
+##
+## You should have received a copy of the GNU Affero General Public License
+## along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+import json
+import logging
+import os
+import pty
+import statistics
+import sys
+import threading
+import time
+
+import serial
+from docopt import docopt
+
+__script_dir = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.dirname(__script_dir))
+
+import garagenode_receiver_mqtt  # noqa: E402
+from garagenode_serial import SerialReaderThread  # noqa: E402
+from garagenode_simulator import SimulatedSender  # noqa: E402
+from stub_broker import StubBroker  # noqa: E402
+
+TOPIC_BASE = 'hil/'
+
+## stop waiting for messages if nothing new arrives for this long
+QUIET_PERIOD_SECONDS = 1.0
+
+
+def percentile(values, p: float):
+    """Nearest-rank percentile of a list of numbers (None if empty)."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+def latency_stats(latencies):
+    """Latency summary (seconds) as dict."""
+    return {
+        'count': len(latencies),
+        'min': min(latencies) if latencies else None,
+        'mean': statistics.mean(latencies) if latencies else None,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'max': max(latencies) if latencies else None,
+    }
+
+
+def wait_quiet(broker: StubBroker, expected: int, timeout: float):
+    """Wait for `expected` messages, or until no new ones arrive for a while, or timeout."""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if broker.wait_for(expected, timeout=0):
+            return
+        if not broker.wait_for(len(broker.messages) + 1, timeout=QUIET_PERIOD_SECONDS):
+            return
+
+
+def run_harness(frames: int = 100, rate: float = 10, baud: int = 9600, noise: float = 0.0,
+                seed: int = 1, timeout: float = 10.0, reader_thread: bool = False):
+    """
+    Run one end-to-end session.
+    :return: report dict
+    """
+    broker = StubBroker().start()
+    os.environ["MQTT_HOST"] = broker.host
+    os.environ["MQTT_PORT"] = str(broker.port)
+    os.environ["MQTT_TOPIC_BASE"] = TOPIC_BASE
+    ## publish every frame, i.e., measure every frame's latency
+    os.environ["MQTT_TIME_PERIOD_SECONDS"] = "-1"
+    os.environ.pop("MQTT_USER", None)
+    garagenode_receiver_mqtt.DEBUG = False
+
+    master, slave = pty.openpty()
+    port = serial.Serial(os.ttyname(slave), baudrate=baud or 9600)
+    os.close(slave)
+    stream = SerialReaderThread(port).start() if reader_thread else port
+
+    receiver = threading.Thread(target=garagenode_receiver_mqtt.handle_stream, args=(stream,),
+                                name='receiver', daemon=True)
+    receiver.start()
+
+    sender = SimulatedSender(master, rate=rate, baud=baud, noise=noise, seed=seed)
+    started = time.perf_counter()
+    sender.run(frames)
+    ## each published reading consists of 5 field messages
+    wait_quiet(broker, 5 * frames, timeout)
+    finished = time.perf_counter()
+
+    ## an aborted read looks like EOF to the receiver
+    if reader_thread:
+        stream.stop()
+    else:
+        port.cancel_read()
+    receiver.join(timeout=5)
+    port.close()
+    os.close(master)
+    broker.stop()
+
+    latencies = []
+    received = set()
+    for msg in broker.messages:
+        if msg.topic != TOPIC_BASE + 'light':
+            continue
+        seq = int(msg.payload)
+        if seq in sender.sent and seq not in sender.corrupted and seq not in received:
+            received.add(seq)
+            latencies.append(msg.timestamp - sender.sent[seq])
+    last_arrival = max((msg.timestamp for msg in broker.messages), default=finished)
+    duration = max(last_arrival - started, 1e-9)
+
+    return {
+        'frames_sent': frames,
+        'frames_corrupted': len(sender.corrupted),
+        'frames_received': len(received),
+        'frames_lost': frames - len(sender.corrupted) - len(received),
+        'messages_published': len(broker.messages),
+        'broker_connections': broker.connections,
+        'bytes_sent': sender.bytes_written,
+        'duration_seconds': duration,
+        'throughput_frames_per_second': len(received) / duration,
+        'throughput_bytes_per_second': sender.bytes_written / duration,
+        'latency_seconds': latency_stats(latencies),
+        'serial_overflow_bytes': stream.overflow_bytes if reader_thread else None,
+        'parameters': {'rate': rate, 'baud': baud, 'noise': noise, 'seed': seed, 'reader_thread': reader_thread},
+    }
+
+
+def main():
+    arguments = docopt(__doc__)
+    logging.basicConfig(level=logging.DEBUG if arguments["--verbose"] else logging.WARNING,
+                        stream=sys.stderr,
+                        format='%(asctime)s %(levelname)-8s %(message)s',
+                        datefmt='%Y-%m-%d %H:%M:%S')
+
+    report = run_harness(frames=int(arguments["--frames"]),
+                         rate=float(arguments["--rate"]),
+                         baud=int(arguments["--baud"]),
+                         noise=float(arguments["--noise"]),
+                         seed=int(arguments["--seed"]),
+                         timeout=float(arguments["--timeout"]),
+                         reader_thread=arguments["--reader-thread"])
+
+    if arguments["--json"]:
+        print(json.dumps(report, indent=2))
+    else:
+        latency = report['latency_seconds']
+        print("frames sent/received/lost/corrupted: %d/%d/%d/%d" % (
+            report['frames_sent'], report['frames_received'], report['frames_lost'], report['frames_corrupted']))
+        print("throughput: %.1f frames/s, %.0f bytes/s" % (
+            report['throughput_frames_per_second'], report['throughput_bytes_per_second']))
+        if latency['count']:
+            print("latency [ms]: min %.2f, mean %.2f, p50 %.2f, p95 %.2f, max %.2f" % tuple(
+                1000 * latency[k] for k in ('min', 'mean', 'p50', 'p95', 'max')))
+    return 0 if report['frames_lost'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
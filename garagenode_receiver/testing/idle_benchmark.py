@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""idle_benchmark.py - CPU usage and wakeups of the receiver's serial read modes.
+
+Runs the real receiver (`handle_stream`) on a pseudo-terminal for each serial read
+mode (direct blocking reads, reader thread, select/epoll) while a simulated sender
+sends sparse frames, followed by a phase without any data. Reports CPU time and
+context switches (i.e., wakeups, from /proc, Linux only) of the receiver's threads.
+
+Usage:
+  idle_benchmark.py [options]
+  idle_benchmark.py -h | --help
+
+Options:
+  -h --help          Show this screen.
+  --modes=MODES      Comma separated read modes [default: direct,thread,select].
+  -n --frames=N      Number of frames to send per mode [default: 10].
+  -r --rate=FPS      Frames per second [default: 2].
+  -b --baud=BAUD     Baud rate pacing [default: 9600].
+  --idle=SEC         Seconds without data per mode [default: 2].
+  --json             Print report as JSON.
+  -v --verbose       Be more verbose.
+"""
+##
+## LICENSE:
+##
+## Copyright (C) 2019-2022 Alexander Streicher
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU Affero General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Affero General Public License for more details.
+##
+## You should have received a copy of the GNU Affero General Public License
+## along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+import json
+import logging
+import os
+import pty
+import sys
+import threading
+import time
+
+import serial
+from docopt import docopt
+
+__script_dir = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.dirname(__script_dir))
+
+import garagenode_receiver_mqtt  # noqa: E402
+from garagenode_serial import SerialReaderThread, SelectorStream  # noqa: E402
+from garagenode_simulator import SimulatedSender  # noqa: E402
+from stub_broker import StubBroker  # noqa: E402
+
+TOPIC_BASE = 'bench/'
+READ_MODES = ('direct', 'thread', 'select')
+
+
+def thread_usage(threads):
+    """
+    CPU seconds and context switches of threads (summed up), from /proc.
+    :param threads: list of threading.Thread
+    :return: dict with 'cpu_seconds', 'voluntary_switches', 'involuntary_switches'
+    """
+    result = {'cpu_seconds': 0.0, 'voluntary_switches': 0, 'involuntary_switches': 0}
+    for thread in threads:
+        ## per-thread CPU clock, /proc only has clock tick resolution
+        result['cpu_seconds'] += time.clock_gettime(time.pthread_getcpuclockid(thread.ident))
+        with open('/proc/self/task/%d/status' % thread.native_id) as fp:
+            for line in fp:
+                if line.startswith('voluntary_ctxt_switches:'):
+                    result['voluntary_switches'] += int(line.split()[1])
+                elif line.startswith('nonvoluntary_ctxt_switches:'):
+                    result['involuntary_switches'] += int(line.split()[1])
+    return result
+
+
+def usage_diff(after: dict, before: dict):
+    return {key: after[key] - before[key] for key in after}
+
+
+def run_mode(mode: str, frames: int = 10, rate: float = 2, baud: int = 9600, idle: float = 2.0):
+    """
+    Benchmark one serial read mode.
+    :return: report dict
+    """
+    master, slave = pty.openpty()
+    port = serial.Serial(os.ttyname(slave), baudrate=baud)
+    os.close(slave)
+    if mode == 'thread':
+        stream = SerialReaderThread(port).start()
+    elif mode == 'select':
+        stream = SelectorStream(port)
+    elif mode == 'direct':
+        stream = port
+    else:
+        raise ValueError("Unknown read mode '%s'!" % mode)
+
+    receiver = threading.Thread(target=garagenode_receiver_mqtt.handle_stream, args=(stream,),
+                                name='receiver', daemon=True)
+    receiver.start()
+    threads = [receiver] + ([stream._thread] if mode == 'thread' else [])
+
+    sender = SimulatedSender(master, rate=rate, baud=baud, seed=1)
+    usage_start = thread_usage(threads)
+    t0 = time.perf_counter()
+    sender.run(frames)
+    ## let the receiver process the last frame
+    time.sleep(0.5)
+    t1 = time.perf_counter()
+    usage_frames = thread_usage(threads)
+    time.sleep(idle)
+    t2 = time.perf_counter()
+    usage_idle = thread_usage(threads)
+
+    if mode in ('thread', 'select'):
+        stream.stop()
+    else:
+        port.cancel_read()
+    receiver.join(timeout=5)
+    if mode == 'select':
+        stream.close()
+    port.close()
+    os.close(master)
+
+    busy = usage_diff(usage_frames, usage_start)
+    quiet = usage_diff(usage_idle, usage_frames)
+    return {
+        'mode': mode,
+        'frames': frames,
+        'bytes': sender.bytes_written,
+        'frames_phase': dict(busy, seconds=t1 - t0,
+                             wakeups_per_frame=busy['voluntary_switches'] / frames if frames else None,
+                             cpu_ms_per_frame=1000 * busy['cpu_seconds'] / frames if frames else None),
+        'idle_phase': dict(quiet, seconds=t2 - t1,
+                           wakeups_per_second=quiet['voluntary_switches'] / (t2 - t1)),
+    }
+
+
+def run_benchmark(modes=READ_MODES, frames: int = 10, rate: float = 2, baud: int = 9600, idle: float = 2.0):
+    """
+    Benchmark all given read modes.
+    :return: report dict
+    """
+    broker = StubBroker().start()
+    os.environ["MQTT_HOST"] = broker.host
+    os.environ["MQTT_PORT"] = str(broker.port)
+    os.environ["MQTT_TOPIC_BASE"] = TOPIC_BASE
+    os.environ.pop("MQTT_USER", None)
+    garagenode_receiver_mqtt.DEBUG = False
+    try:
+        results = [run_mode(mode, frames, rate, baud, idle) for mode in modes]
+    finally:
+        broker.stop()
+    return {
+        'modes': results,
+        'parameters': {'frames': frames, 'rate': rate, 'baud': baud, 'idle': idle},
+    }
+
+
+def main():
+    arguments = docopt(__doc__)
+    logging.basicConfig(level=logging.DEBUG if arguments["--verbose"] else logging.WARNING,
+                        stream=sys.stderr,
+                        format='%(asctime)s %(levelname)-8s %(message)s',
+                        datefmt='%Y-%m-%d %H:%M:%S')
+
+    report = run_benchmark(modes=arguments["--modes"].split(','),
+                           frames=int(arguments["--frames"]),
+                           rate=float(arguments["--rate"]),
+                           baud=int(arguments["--baud"]),
+                           idle=float(arguments["--idle"]))
+
+    if arguments["--json"]:
+        print(json.dumps(report, indent=2))
+    else:
+        print("%-8s %14s %14s %16s %14s" % ("mode", "wakeups/frame", "CPU ms/frame", "idle wakeups/s", "idle CPU ms"))
+        for result in report['modes']:
+            print("%-8s %14.1f %14.2f %16.1f %14.1f" % (
+                result['mode'],
+                result['frames_phase']['wakeups_per_frame'] or 0,
+                result['frames_phase']['cpu_ms_per_frame'] or 0,
+                result['idle_phase']['wakeups_per_second'],
+                1000 * result['idle_phase']['cpu_seconds']))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
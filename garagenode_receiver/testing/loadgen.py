@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""loadgen.py - Load generator simulating many virtual GarageNode senders.
+
+Synthesizes frames (with node IDs) from thousands of virtual sender nodes and feeds
+them into the real receiver (`handle_stream`) through a pipe or pseudo-terminal,
+publishing to a local stand-in MQTT broker. The aggregate frame rate is ramped up
+in steps; per step the processed frame rate, input queue growth and MQTT publish
+latency are reported, and the first step the receiver cannot keep up with
+(the saturation point).
+
+Usage:
+  loadgen.py [options]
+  loadgen.py -h | --help
+
+Options:
+  -h --help             Show this screen.
+  --nodes=N             Number of virtual sender nodes [default: 1000].
+  --start-rate=FPS      Aggregate frame rate of the first step [default: 100].
+  --factor=F            Rate multiplier per step [default: 2].
+  --steps=N             Max. number of steps [default: 8].
+  --step-seconds=SEC    Duration of each step [default: 3].
+  --period=SEC          Receiver MQTT_TIME_PERIOD_SECONDS per node [default: 600].
+  --flap=PROB           Probability of a switch1 toggle per frame [default: 0.01].
+  --flap-period=N       Toggle switch2 every N frames of a node, 0 for never [default: 0].
+  --corruption=PROB     Fraction of corrupted frames (garbage and bit flips) [default: 0.01].
+  --values=MODEL        Sensor values per node: 'walk' (random walk), 'uniform' (independent
+                        per frame) or 'constant' (start values) [default: walk].
+  --light-sigma=SD      Random walk step of light [default: 20].
+  --humidity-sigma=SD   Random walk step of humidity in % [default: 0.5].
+  --temperature-sigma=SD  Random walk step of temperature in °C [default: 0.1].
+  --humidity-range=MIN,MAX  Start (and uniform) humidity range in % [default: 30,90].
+  --temperature-range=MIN,MAX  Start (and uniform) temperature range in °C [default: -5,35].
+  --transport=TYPE      Receiver input, 'pipe' or 'pty' [default: pipe].
+  --seed=SEED           Random seed [default: 1].
+  --keep-going          Do not stop ramping at the saturation point.
+  --json                Print report as JSON.
+  -v --verbose          Be more verbose.
+"""
+##
+## LICENSE:
+##
+## Copyright (C) 2019-2022 Alexander Streicher
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU Affero General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Affero General Public License for more details.
+##
+## You should have received a copy of the GNU Affero General Public License
+## along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+import array
+import fcntl
+import json
+import logging
+import os
+import pty
+import random
+import sys
+import termios
+import threading
+import time
+
+import serial
+from docopt import docopt
+
+__script_dir = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.dirname(__script_dir))
+
+import garagenode_receiver_mqtt  # noqa: E402
+from garagenode_simulator import make_frame, add_noise  # noqa: E402
+from hil_harness import latency_stats  # noqa: E402
+from stub_broker import StubBroker  # noqa: E402
+
+TOPIC_BASE = 'load/'
+
+## generator time slice
+TICK_SECONDS = 0.01
+
+## a step is saturated if less than this fraction of the offered frames got processed
+SATURATION_RATIO = 0.95
+
+
+VALUE_MODELS = ('walk', 'uniform', 'constant')
+
+## light is a 10 bit ADC value
+LIGHT_MAX = 1023
+
+
+class ValueModel(object):
+    """
+    Sensor values of the virtual nodes.
+    Start values are uniform in the ranges, then per frame either a random walk ('walk',
+    gaussian steps with the given sigmas), new uniform values ('uniform') or unchanged ('constant').
+    """
+    __slots__ = ('model', 'light_sigma', 'humidity_sigma', 'temperature_sigma', 'humidity_range',
+                 'temperature_range')
+
+    def __init__(self, model: str = 'walk', light_sigma: float = 20, humidity_sigma: float = 0.5,
+                 temperature_sigma: float = 0.1, humidity_range: tuple = (30.0, 90.0),
+                 temperature_range: tuple = (-5.0, 35.0)):
+        if model not in VALUE_MODELS:
+            raise ValueError("Unknown value model '%s'!" % model)
+        self.model = model
+        self.light_sigma = light_sigma
+        self.humidity_sigma = humidity_sigma
+        self.temperature_sigma = temperature_sigma
+        self.humidity_range = tuple(humidity_range)
+        self.temperature_range = tuple(temperature_range)
+
+    def start(self, node, rng: random.Random):
+        node.light = rng.randint(0, LIGHT_MAX)
+        node.humidity = rng.uniform(*self.humidity_range)
+        node.temperature = rng.uniform(*self.temperature_range)
+
+    def step(self, node, rng: random.Random):
+        if self.model == 'walk':
+            node.light = min(LIGHT_MAX, max(0, node.light + int(rng.gauss(0, self.light_sigma))))
+            node.humidity = min(100.0, max(0.0, node.humidity + rng.gauss(0, self.humidity_sigma)))
+            node.temperature += rng.gauss(0, self.temperature_sigma)
+        elif self.model == 'uniform':
+            self.start(node, rng)
+
+    def parameters(self):
+        """Parameters for the report."""
+        return {'model': self.model, 'light_sigma': self.light_sigma, 'humidity_sigma': self.humidity_sigma,
+                'temperature_sigma': self.temperature_sigma, 'humidity_range': list(self.humidity_range),
+                'temperature_range': list(self.temperature_range)}
+
+
+def parse_range(text: str):
+    """'MIN,MAX' -> (min, max)"""
+    low, high = (float(x) for x in text.split(','))
+    if low > high:
+        raise ValueError("Invalid range '%s'!" % text)
+    return low, high
+
+
+class VirtualNode(object):
+    """Virtual sender node, sensor values according to the value model."""
+    __slots__ = ('node', 'values', 'light', 'humidity', 'temperature', 'switch1', 'switch2', 'frames')
+
+    def __init__(self, node: str, rng: random.Random, values: ValueModel = None):
+        self.node = node
+        self.values = values or ValueModel()
+        self.values.start(self, rng)
+        self.switch1 = rng.randint(0, 1)
+        self.switch2 = rng.randint(0, 1)
+        self.frames = 0
+
+    def next_frame(self, rng: random.Random, flap: float, flap_period: int):
+        self.frames += 1
+        self.values.step(self, rng)
+        if rng.random() < flap:
+            self.switch1 ^= 1
+        if flap_period and self.frames % flap_period == 0:
+            self.switch2 ^= 1
+        return make_frame(self.light, self.humidity, self.temperature, self.switch1, self.switch2, node=self.node)
+
+
+def queued_bytes(fd: int):
+    """Number of bytes waiting in a pipe/tty (FIONREAD)."""
+    buf = array.array('i', [0])
+    fcntl.ioctl(fd, termios.FIONREAD, buf, True)
+    return buf[0]
+
+
+class LoadGenerator(object):
+    def __init__(self, nodes: int = 1000, flap: float = 0.01, flap_period: int = 0, corruption: float = 0.01,
+                 seed: int = 1, values: ValueModel = None):
+        self.rng = random.Random(seed)
+        self.values = values or ValueModel()
+        self.nodes = [VirtualNode("node%05d" % k, self.rng, self.values) for k in range(nodes)]
+        self.flap = flap
+        self.flap_period = flap_period
+        self.corruption = corruption
+        self._next_node = 0
+        self.frames = 0
+        self.bytes = 0
+
+    def frames_data(self, count: int):
+        """Next `count` frames, nodes in round-robin order (i.e., all nodes send at the same rate)."""
+        chunks = []
+        for _ in range(count):
+            node = self.nodes[self._next_node]
+            self._next_node = (self._next_node + 1) % len(self.nodes)
+            data, _ = add_noise(node.next_frame(self.rng, self.flap, self.flap_period), self.rng, self.corruption)
+            chunks.append(data)
+        data = b''.join(chunks)
+        self.frames += count
+        self.bytes += len(data)
+        return data
+
+
+def run_step(generator: LoadGenerator, write_fd: int, read_fd: int, rate: float, seconds: float, publishes):
+    """
+    Offer frames at `rate` for `seconds`.
+    :return: step report dict
+    """
+    frames_before = generator.frames
+    bytes_before = generator.bytes
+    publishes_before = len(publishes)
+    backlog_before = queued_bytes(read_fd)
+    backlog_max = backlog_before
+    started = time.perf_counter()
+    while True:
+        elapsed = time.perf_counter() - started
+        if elapsed >= seconds:
+            break
+        due = int(elapsed * rate) - (generator.frames - frames_before)
+        if due > 0:
+            ## blocks if the receiver's input queue is full
+            os.write(write_fd, generator.frames_data(due))
+        backlog_max = max(backlog_max, queued_bytes(read_fd))
+        time.sleep(TICK_SECONDS)
+    duration = time.perf_counter() - started
+    backlog_after = queued_bytes(read_fd)
+
+    frames = generator.frames - frames_before
+    written = generator.bytes - bytes_before
+    consumed = written - (backlog_after - backlog_before)
+    frame_size = written / frames if frames else 1
+    processed_fps = consumed / frame_size / duration
+    latencies = [latency for _, latency in publishes[publishes_before:]]
+    return {
+        'offered_fps': rate,
+        'generated_fps': frames / duration,
+        'processed_fps': processed_fps,
+        'backlog_bytes_start': backlog_before,
+        'backlog_bytes_end': backlog_after,
+        'backlog_bytes_max': backlog_max,
+        'backlog_growth_bytes_per_second': (backlog_after - backlog_before) / duration,
+        'publishes': len(latencies),
+        'publish_latency_seconds': latency_stats(latencies),
+        'saturated': processed_fps < SATURATION_RATIO * rate,
+    }
+
+
+def run_loadgen(nodes: int = 1000, start_rate: float = 100, factor: float = 2, steps: int = 8,
+                step_seconds: float = 3, period: int = 600, flap: float = 0.01, flap_period: int = 0,
+                corruption: float = 0.01, transport: str = 'pipe', seed: int = 1, keep_going: bool = False,
+                values: ValueModel = None):
+    """
+    Ramp up the load step by step.
+    :param values: sensor values of the virtual nodes, defaults to random walks
+    :return: report dict
+    """
+    broker = StubBroker().start()
+    os.environ["MQTT_HOST"] = broker.host
+    os.environ["MQTT_PORT"] = str(broker.port)
+    os.environ["MQTT_TOPIC_BASE"] = TOPIC_BASE
+    os.environ["MQTT_TIME_PERIOD_SECONDS"] = str(period)
+    os.environ["NODE_MAX"] = str(nodes)
+    os.environ.pop("MQTT_USER", None)
+    garagenode_receiver_mqtt.DEBUG = False
+
+    ## measure each MQTT publish (connect, publish, disconnect)
+    publishes = []
+    send_mqtt = garagenode_receiver_mqtt.send_mqtt
+
+    def timed_send_mqtt(msgs):
+        t0 = time.perf_counter()
+        send_mqtt(msgs)
+        publishes.append((t0, time.perf_counter() - t0))
+
+    garagenode_receiver_mqtt.send_mqtt = timed_send_mqtt
+
+    if transport == 'pty':
+        write_fd, slave = pty.openpty()
+        stream = serial.Serial(os.ttyname(slave))
+        read_fd = stream.fd
+        os.close(slave)
+    elif transport == 'pipe':
+        read_fd, write_fd = os.pipe()
+        stream = open(read_fd, 'rb', buffering=0)
+    else:
+        raise ValueError("Unknown transport '%s'!" % transport)
+
+    receiver = threading.Thread(target=garagenode_receiver_mqtt.handle_stream, args=(stream,),
+                                name='receiver', daemon=True)
+    receiver.start()
+
+    generator = LoadGenerator(nodes, flap, flap_period, corruption, seed, values)
+    results = []
+    saturation_fps = None
+    rate = start_rate
+    try:
+        for _ in range(steps):
+            result = run_step(generator, write_fd, read_fd, rate, step_seconds, publishes)
+            results.append(result)
+            logging.info("offered %.0f fps: processed %.0f fps, backlog %d bytes, %d publishes",
+                         rate, result['processed_fps'], result['backlog_bytes_end'], result['publishes'])
+            if result['saturated'] and saturation_fps is None:
+                saturation_fps = rate
+                if not keep_going:
+                    break
+            rate *= factor
+    finally:
+        garagenode_receiver_mqtt.send_mqtt = send_mqtt
+        if transport == 'pty':
+            stream.cancel_read()
+        os.close(write_fd)
+        receiver.join(timeout=5)
+        stream.close()
+        broker.stop()
+
+    max_processed = max((result['processed_fps'] for result in results), default=0)
+    return {
+        'saturation_offered_fps': saturation_fps,
+        'max_processed_fps': max_processed,
+        'frames': generator.frames,
+        'bytes': generator.bytes,
+        'broker_messages': len(broker.messages),
+        'steps': results,
+        'parameters': {'nodes': nodes, 'start_rate': start_rate, 'factor': factor, 'step_seconds': step_seconds,
+                       'period': period, 'flap': flap, 'flap_period': flap_period, 'corruption': corruption,
+                       'transport': transport, 'seed': seed, 'values': generator.values.parameters()},
+    }
+
+
+def main():
+    arguments = docopt(__doc__)
+    logging.basicConfig(level=logging.DEBUG if arguments["--verbose"] else logging.WARNING,
+                        stream=sys.stderr,
+                        format='%(asctime)s %(levelname)-8s %(message)s',
+                        datefmt='%Y-%m-%d %H:%M:%S')
+
+    report = run_loadgen(nodes=int(arguments["--nodes"]),
+                         start_rate=float(arguments["--start-rate"]),
+                         factor=float(arguments["--factor"]),
+                         steps=int(arguments["--steps"]),
+                         step_seconds=float(arguments["--step-seconds"]),
+                         period=int(arguments["--period"]),
+                         flap=float(arguments["--flap"]),
+                         flap_period=int(arguments["--flap-period"]),
+                         corruption=float(arguments["--corruption"]),
+                         transport=arguments["--transport"],
+                         seed=int(arguments["--seed"]),
+                         keep_going=arguments["--keep-going"],
+                         values=ValueModel(arguments["--values"],
+                                           light_sigma=float(arguments["--light-sigma"]),
+                                           humidity_sigma=float(arguments["--humidity-sigma"]),
+                                           temperature_sigma=float(arguments["--temperature-sigma"]),
+                                           humidity_range=parse_range(arguments["--humidity-range"]),
+                                           temperature_range=parse_range(arguments["--temperature-range"])))
+
+    if arguments["--json"]:
+        print(json.dumps(report, indent=2))
+    else:
+        print("%10s %10s %10s %12s %12s %9s %12s" % ("offered", "generated", "processed", "backlog", "growth/s",
+                                                     "publishes", "p95 publish"))
+        for step in report['steps']:
+            p95 = step['publish_latency_seconds']['p95']
+            print("%10.0f %10.0f %10.0f %12d %12.0f %9d %12s%s" % (
+                step['offered_fps'], step['generated_fps'], step['processed_fps'], step['backlog_bytes_end'],
+                step['backlog_growth_bytes_per_second'], step['publishes'],
+                "%.1f ms" % (1000 * p95) if p95 is not None else "-",
+                "  SATURATED" if step['saturated'] else ""))
+        if report['saturation_offered_fps']:
+            print("saturation point: %.0f frames/s offered, max. %.0f frames/s processed" % (
+                report['saturation_offered_fps'], report['max_processed_fps']))
+        else:
+            print("no saturation, max. %.0f frames/s processed" % report['max_processed_fps'])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""script_runner.py - Run the testing scripts from the unit tests.
+
+The scripts (hil_harness.py, loadgen.py, soak_test.py) run the real receiver in a
+separate process, i.e., the receiver's module state is not shared with the other
+tests, and print their report as JSON (`--json`).
+"""
+##
+## LICENSE:
+##
+## Copyright (C) 2019-2022 Alexander Streicher
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU Affero General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Affero General Public License for more details.
+##
+## You should have received a copy of the GNU Affero General Public License
+## along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+import json
+import os
+import subprocess
+import sys
+
+TESTING_DIR = os.path.dirname(os.path.realpath(__file__))
+
+
+def run_json_script(name: str, *args, timeout: float = 60):
+    """
+    Run a testing script with `--json` in a separate process.
+    :param name: script file name in the testing directory, e.g. 'loadgen.py'
+    :param args: command line arguments
+    :param timeout: max. seconds
+    :return: tuple (return code, report dict)
+    :raises AssertionError: if the script did not print a JSON report, e.g., it crashed
+    """
+    env = dict(os.environ)
+    env.pop("DEBUG", None)
+    process = subprocess.run([sys.executable, os.path.join(TESTING_DIR, name), '--json'] + list(args),
+                             capture_output=True, timeout=timeout, env=env)
+    try:
+        report = json.loads(process.stdout)
+    except ValueError:
+        raise AssertionError("%s exited with %d without a report:\n%s"
+                             % (name, process.returncode, process.stderr.decode('utf8', errors='replace')))
+    return process.returncode, report
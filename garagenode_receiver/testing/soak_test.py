@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""soak_test.py - Long-running soak test with memory and latency regression tracking.
+
+Drives the real receiver pipeline (`handle_stream`: framing, parsing, per-node state,
+dedup, link quality, history, MQTT publishing to a local stand-in broker) with synthetic
+frames from virtual sender nodes. A replay clock advances by the sender interval per
+frame, i.e., millions of frames correspond to months of operation including the
+periodic sends. At regular intervals RSS, traced Python heap (tracemalloc), object
+counts and publish latency are sampled; the test fails if they grow beyond the
+thresholds after the warm-up phase.
+
+Usage:
+  soak_test.py [options]
+  soak_test.py -h | --help
+
+Options:
+  -h --help                 Show this screen.
+  -n --frames=N             Number of frames [default: 1000000].
+  --nodes=N                 Number of virtual sender nodes [default: 10].
+  --interval=SEC            Sender interval per node (replay clock) [default: 30].
+  --samples=N               Number of samples [default: 20].
+  --warmup=FRACTION         Fraction of the frames before the baseline sample [default: 0.1].
+  --corruption=PROB         Fraction of corrupted frames [default: 0.01].
+  --flap=PROB               Probability of a switch toggle per frame [default: 0.01].
+  --max-rss-growth=KB       Max. RSS growth after warm-up [default: 4096].
+  --max-heap-growth=KB      Max. traced heap growth after warm-up [default: 512].
+  --max-object-growth=N     Max. growth of the number of GC tracked objects [default: 5000].
+  --max-latency-drift=F     Max. ratio of the last to the baseline publish latency p95 [default: 3].
+  --no-tracemalloc          Do not trace allocations (less overhead, no heap and allocator samples).
+  --seed=SEED               Random seed [default: 1].
+  --json                    Print report as JSON.
+  -v --verbose              Be more verbose.
+"""
+##
+## LICENSE:
+##
+## Copyright (C) 2019-2022 Alexander Streicher
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU Affero General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Affero General Public License for more details.
+##
+## You should have received a copy of the GNU Affero General Public License
+## along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+import gc
+import json
+import logging
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+from docopt import docopt
+
+__script_dir = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.dirname(__script_dir))
+
+import garagenode_receiver_mqtt  # noqa: E402
+from garagenode_clock import ReplayClock  # noqa: E402
+from garagenode_history import ReadingsHistory  # noqa: E402
+from hil_harness import latency_stats  # noqa: E402
+from loadgen import LoadGenerator  # noqa: E402
+from stub_broker import StubBroker  # noqa: E402
+
+TOPIC_BASE = 'soak/'
+
+## number of top allocation sites per sample
+TOP_ALLOCATORS = 10
+
+PAGE_SIZE = resource.getpagesize()
+
+
+def rss_kb():
+    """Current resident set size in KiB (Linux)."""
+    with open('/proc/self/statm') as fp:
+        return int(fp.read().split()[1]) * PAGE_SIZE // 1024
+
+
+class SyntheticStream(object):
+    """
+    Input stream of `frames` synthetic frames, ends with EOF.
+    Advances the replay clock by `interval` per frame and calls `on_frames(count)`
+    every `every` frames (between frames, i.e., within the receiver's loop).
+    """
+
+    def __init__(self, generator: LoadGenerator, frames: int, clock: ReplayClock, interval: float,
+                 every: int = 0, on_frames=None):
+        self.generator = generator
+        self.frames = frames
+        self.clock = clock
+        self.interval = interval
+        self.every = every
+        self.on_frames = on_frames
+        self.generated = 0
+        self._data = b''
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size: int = 1):
+        if self._pos >= len(self._data):
+            if self.generated and self.every and self.generated % self.every == 0 and self.on_frames:
+                self.on_frames(self.generated)
+            if self.generated >= self.frames:
+                return b''
+            ## next frame, it arrives one sender interval later
+            self._data = self.generator.frames_data(1)
+            self._pos = 0
+            self.generated += 1
+            self.clock.advance(self.clock.now + self.interval)
+        data = self._data[self._pos:self._pos + size]
+        self._pos += len(data)
+        return data
+
+
+def top_allocators(snapshot, baseline):
+    """Allocation sites with the largest growth since the baseline snapshot."""
+    stats = snapshot.compare_to(baseline, 'lineno') if baseline is not None else snapshot.statistics('lineno')
+    result = []
+    for stat in stats[:TOP_ALLOCATORS]:
+        frame = stat.traceback[0]
+        result.append({'site': "%s:%d" % (os.path.relpath(frame.filename, os.path.dirname(__script_dir)),
+                                          frame.lineno),
+                       'size_kb': stat.size / 1024,
+                       'size_diff_kb': getattr(stat, 'size_diff', stat.size) / 1024,
+                       'count': stat.count})
+    return result
+
+
+def run_soak(frames: int = 1000000, nodes: int = 10, interval: float = 30, samples: int = 20, warmup: float = 0.1,
+             corruption: float = 0.01, flap: float = 0.01, max_rss_growth: float = 4096,
+             max_heap_growth: float = 512, max_object_growth: int = 5000, max_latency_drift: float = 3,
+             trace: bool = True, seed: int = 1):
+    """
+    Run the soak test.
+    :return: report dict, 'passed' is False if a threshold was exceeded
+    """
+    broker = StubBroker().start()
+    os.environ["MQTT_HOST"] = broker.host
+    os.environ["MQTT_PORT"] = str(broker.port)
+    os.environ["MQTT_TOPIC_BASE"] = TOPIC_BASE
+    os.environ["NODE_MAX"] = str(nodes)
+    os.environ.pop("MQTT_USER", None)
+    garagenode_receiver_mqtt.DEBUG = False
+
+    ## publish latency per sample interval
+    latencies = []
+    send_mqtt = garagenode_receiver_mqtt.send_mqtt
+
+    def timed_send_mqtt(msgs):
+        t0 = time.perf_counter()
+        send_mqtt(msgs)
+        latencies.append(time.perf_counter() - t0)
+        ## the broker keeps all messages, memory growth of the test itself
+        broker.messages.clear()
+
+    garagenode_receiver_mqtt.send_mqtt = timed_send_mqtt
+
+    clock_start = 1.6e9
+    clock = ReplayClock(clock_start)
+    every = max(1, frames // samples)
+    baseline_frames = max(every, int(round(frames * warmup / every)) * every)
+    results = []
+    baseline = {}
+    started = time.perf_counter()
+
+    def sample(count):
+        gc.collect()
+        entry = {
+            'frames': count,
+            'elapsed_seconds': time.perf_counter() - started,
+            'clock_days': (clock.now - clock_start) / 86400,
+            'rss_kb': rss_kb(),
+            'objects': len(gc.get_objects()),
+            'publishes': len(latencies),
+            'publish_latency_seconds': latency_stats(latencies),
+        }
+        latencies.clear()
+        if trace:
+            ## the samples kept by this test are no growth of the receiver
+            snapshot = tracemalloc.take_snapshot().filter_traces(
+                [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__),
+                 tracemalloc.Filter(False, latency_stats.__code__.co_filename)])
+            entry['heap_kb'] = sum(stat.size for stat in snapshot.statistics('filename')) / 1024
+            entry['top_allocators'] = top_allocators(snapshot, baseline.get('snapshot'))
+            if count == baseline_frames:
+                baseline['snapshot'] = snapshot
+        if count == baseline_frames:
+            baseline['sample'] = entry
+        results.append(entry)
+        logging.info("%d frames: RSS %d KiB, %d objects, %d publishes", count, entry['rss_kb'], entry['objects'],
+                     entry['publishes'])
+
+    if trace:
+        tracemalloc.start()
+    generator = LoadGenerator(nodes, flap=flap, corruption=corruption, seed=seed)
+    stream = SyntheticStream(generator, frames, clock, interval / nodes, every, sample)
+    try:
+        garagenode_receiver_mqtt.handle_stream(stream, history=ReadingsHistory(), clock=clock)
+    finally:
+        garagenode_receiver_mqtt.send_mqtt = send_mqtt
+        if trace:
+            tracemalloc.stop()
+        broker.stop()
+    duration = time.perf_counter() - started
+
+    ## growth from the baseline (end of warm-up) to the last sample
+    failures = []
+    growth = {}
+    first = baseline.get('sample')
+    last = results[-1] if results else None
+    if first is not None and last is not None and last is not first:
+        growth['rss_kb'] = last['rss_kb'] - first['rss_kb']
+        growth['objects'] = last['objects'] - first['objects']
+        if growth['rss_kb'] > max_rss_growth:
+            failures.append("RSS grew by %d KiB" % growth['rss_kb'])
+        if growth['objects'] > max_object_growth:
+            failures.append("GC tracked objects grew by %d" % growth['objects'])
+        if trace:
+            growth['heap_kb'] = last['heap_kb'] - first['heap_kb']
+            if growth['heap_kb'] > max_heap_growth:
+                failures.append("traced heap grew by %d KiB" % growth['heap_kb'])
+        p95_first = first['publish_latency_seconds']['p95']
+        p95_last = last['publish_latency_seconds']['p95']
+        if p95_first and p95_last:
+            growth['publish_latency_p95_ratio'] = p95_last / p95_first
+            if growth['publish_latency_p95_ratio'] > max_latency_drift:
+                failures.append("publish latency p95 drifted by factor %.1f" % growth['publish_latency_p95_ratio'])
+
+    return {
+        'version': garagenode_receiver_mqtt.__version__,
+        'passed': not failures,
+        'failures': failures,
+        'growth': growth,
+        'frames': stream.generated,
+        'duration_seconds': duration,
+        'frames_per_second': stream.generated / duration if duration else None,
+        'baseline_frames': baseline_frames,
+        'samples': results,
+        'parameters': {'frames': frames, 'nodes': nodes, 'interval': interval, 'samples': samples,
+                       'warmup': warmup, 'corruption': corruption, 'flap': flap,
+                       'max_rss_growth': max_rss_growth, 'max_heap_growth': max_heap_growth,
+                       'max_object_growth': max_object_growth, 'max_latency_drift': max_latency_drift,
+                       'tracemalloc': trace, 'seed': seed},
+    }
+
+
+def main():
+    arguments = docopt(__doc__)
+    logging.basicConfig(level=logging.INFO if arguments["--verbose"] else logging.ERROR,
+                        stream=sys.stderr,
+                        format='%(asctime)s %(levelname)-8s %(message)s',
+                        datefmt='%Y-%m-%d %H:%M:%S')
+
+    report = run_soak(frames=int(arguments["--frames"]),
+                      nodes=int(arguments["--nodes"]),
+                      interval=float(arguments["--interval"]),
+                      samples=int(arguments["--samples"]),
+                      warmup=float(arguments["--warmup"]),
+                      corruption=float(arguments["--corruption"]),
+                      flap=float(arguments["--flap"]),
+                      max_rss_growth=float(arguments["--max-rss-growth"]),
+                      max_heap_growth=float(arguments["--max-heap-growth"]),
+                      max_object_growth=int(arguments["--max-object-growth"]),
+                      max_latency_drift=float(arguments["--max-latency-drift"]),
+                      trace=not arguments["--no-tracemalloc"],
+                      seed=int(arguments["--seed"]))
+
+    if arguments["--json"]:
+        print(json.dumps(report, indent=2))
+    else:
+        print("%10s %10s %10s %10s %10s %9s %12s" % ("frames", "days", "RSS KiB", "heap KiB", "objects",
+                                                     "publishes", "p95 publish"))
+        for entry in report['samples']:
+            p95 = entry['publish_latency_seconds']['p95']
+            print("%10d %10.1f %10d %10s %10d %9d %12s" % (
+                entry['frames'], entry['clock_days'], entry['rss_kb'],
+                "%.0f" % entry['heap_kb'] if 'heap_kb' in entry else "-",
+                entry['objects'], entry['publishes'],
+                "%.1f ms" % (1000 * p95) if p95 is not None else "-"))
+        print("%d frames in %.0f s (%.0f frames/s)" % (report['frames'], report['duration_seconds'],
+                                                        report['frames_per_second'] or 0))
+        print("PASSED" if report['passed'] else "FAILED: " + "; ".join(report['failures']))
+    return 0 if report['passed'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
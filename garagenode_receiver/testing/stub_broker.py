@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""stub_broker.py - Minimal local MQTT stand-in broker for testing.
+
+Accepts MQTT 3.1.1 client connections, acknowledges CONNECT/PUBLISH/PINGREQ and
+records all published messages with their arrival time. There are no subscriptions,
+it is only meant as a sink for `garagenode_receiver_mqtt.send_mqtt()`.
+"""
+##
+## LICENSE:
+##
+## Copyright (C) 2019-2022 Alexander Streicher
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU Affero General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Affero General Public License for more details.
+##
+## You should have received a copy of the GNU Affero General Public License
+## along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+import logging
+import socket
+import threading
+import time
+
+## MQTT control packet types
+CONNECT = 1
+PUBLISH = 3
+PUBREL = 6
+SUBSCRIBE = 8
+PINGREQ = 12
+DISCONNECT = 14
+
+
+class PublishedMessage(object):
+    def __init__(self, timestamp: float, topic: str, payload: bytes, retain: bool):
+        self.timestamp = timestamp
+        self.topic = topic
+        self.payload = payload
+        self.retain = retain
+
+    def __repr__(self):
+        return "%s=%r (retain: %s)" % (self.topic, self.payload, self.retain)
+
+
+def _recv_exactly(conn, n: int):
+    data = b''
+    while len(data) < n:
+        chunk = conn.recv(n - len(data))
+        if not chunk:
+            raise ConnectionError("connection closed")
+        data += chunk
+    return data
+
+
+def _read_packet(conn):
+    ## fixed header: type/flags byte and variable length "remaining length"
+    header = _recv_exactly(conn, 1)[0]
+    length = 0
+    multiplier = 1
+    while True:
+        b = _recv_exactly(conn, 1)[0]
+        length += (b & 0x7f) * multiplier
+        if not b & 0x80:
+            break
+        multiplier *= 128
+    return header >> 4, header & 0x0f, _recv_exactly(conn, length)
+
+
+class StubBroker(object):
+    """
+    MQTT stand-in broker listening on a local TCP port (any free port by default).
+    Published messages are collected in `messages`.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self.messages = []
+        self.connections = 0
+        self._cond = threading.Condition()
+        self._sock = socket.create_server((host, port))
+        self.host, self.port = self._sock.getsockname()[:2]
+        self._running = False
+
+    def start(self):
+        self._running = True
+        threading.Thread(target=self._accept_loop, name='stub-broker', daemon=True).start()
+        return self
+
+    def stop(self):
+        self._running = False
+        self._sock.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def wait_for(self, count: int, timeout: float = 10.0):
+        """
+        Wait until at least `count` messages have been published.
+        :return: True if reached, False on timeout
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: len(self.messages) >= count, timeout)
+
+    def _accept_loop(self):
+        while self._running:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                break
+            self.connections += 1
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        with conn:
+            try:
+                while True:
+                    packet_type, flags, body = _read_packet(conn)
+                    if packet_type == CONNECT:
+                        conn.sendall(b'\x20\x02\x00\x00')
+                    elif packet_type == PUBLISH:
+                        self._on_publish(conn, flags, body)
+                    elif packet_type == PUBREL:
+                        conn.sendall(b'\x70\x02' + body[:2])
+                    elif packet_type == PINGREQ:
+                        conn.sendall(b'\xd0\x00')
+                    elif packet_type == DISCONNECT:
+                        break
+                    else:
+                        logging.warning("stub broker: unsupported packet type %d", packet_type)
+                        break
+            except (ConnectionError, OSError):
+                pass
+
+    def _on_publish(self, conn, flags, body):
+        now = time.perf_counter()
+        qos = (flags >> 1) & 0x03
+        topic_length = int.from_bytes(body[:2], 'big')
+        topic = body[2:2 + topic_length].decode('utf8')
+        pos = 2 + topic_length
+        if qos:
+            packet_id = body[pos:pos + 2]
+            pos += 2
+            ## PUBACK or PUBREC
+            conn.sendall((b'\x40\x02' if qos == 1 else b'\x50\x02') + packet_id)
+        with self._cond:
+            self.messages.append(PublishedMessage(now, topic, body[pos:], bool(flags & 0x01)))
+            self._cond.notify_all()
@@ -6,6 +6,10 @@
 // sleep time in ms
 #define SLEEPTIME 30000
 
+// optional node ID, needed if multiple senders share the power line
+// (letters, digits, '-' and '_', max. 32 characters)
+//#define NODE_ID "garage2"
+
 // reed switches GPIO pins
 #define SWITCH1_PIN 3  // D3
 #define SWITCH2_PIN 4  // D4
@@ -53,6 +57,12 @@ void print(const Stream& stream, const Data& data)
   // begin-marker
   stream.print("**");
 
+#ifdef NODE_ID
+  stream.print("N:");
+  stream.print(NODE_ID);
+  stream.print(";");
+#endif
+
   stream.print("L:");
   stream.print(data.light);
   stream.print(";");